@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# analyze_history.py: Numbers worked out from a fic's history, beyond the totals AO3 shows:
+#   - How many hits, kudos and comments it got each day, and the 7 and 30 day averages of those
+#   - Kudos per hit and comments per hit, over time
+#   - How much each new chapter brought in, in the days after it was posted
+#   Everything is worked out with NumPy on the fic's whole history at once (no loops over samples),
+#   so it's quick enough to run on every fic on every update.
+#   The fic is only sampled when it's updated, so a stat at a time between two samples is interpolated
+#   linearly between them (see values_at), rather than taken from the sample before it.
+# Author: Fixationally_Consumed
+from collections import namedtuple
+import numpy as np
+# User Defined modules
+import common as cm
+import history_arrays
+
+STATS = ['hits', 'kudos', 'comments']
+ROLLING_DAYS = [7, 30]
+CHAPTER_WINDOW_DAYS = 7 # Days after a chapter is posted that count toward it
+
+"""
+HistoryMetrics
+    days:             int array, every day from the first sample to the last (days since published)
+    daily:            {stat: the stat at the end of each day, interpolated between the samples around it}.
+                      Days before the first sample are nan, and the last day is the last sample.
+    per_day:          {stat: how much the stat went up on each day}. The first day is nan.
+    rolling:          {stat: {7: 7 day average of per_day, 30: 30 day average}}. nan until there are enough days.
+    kudos_per_hit:    kudos / hits at the end of each day (nan while there are no hits)
+    comments_per_hit: comments / hits at the end of each day
+    chapters:         ChapterWindows of every chapter posted while the fic was tracked
+
+ChapterWindows (one array entry per chapter)
+    nchapters:  chapter count after it was posted
+    day:        days since published it was first seen
+    gained:     {stat: how much the stat went up in the CHAPTER_WINDOW_DAYS days after it was posted}
+    complete:   False until there's a sample at or after the end of the window, so gained is only so far
+"""
+HistoryMetrics = namedtuple('HistoryMetrics', ['days', 'daily', 'per_day', 'rolling', 'kudos_per_hit', 'comments_per_hit', 'chapters'])
+ChapterWindows = namedtuple('ChapterWindows', ['nchapters', 'day', 'gained', 'complete'])
+
+def values_at(history, stat, seconds):
+    # Returns the stat as of each time in `seconds` (seconds since published), interpolated linearly between
+    #   the samples before and after it. nan if it's before the first sample, and the last sample if it's after it.
+    times = np.asarray(history.seconds, dtype=np.float64)
+    seconds = np.asarray(seconds, dtype=np.float64)
+    values = np.interp(seconds, times, np.asarray(getattr(history, stat), dtype=np.float64))
+    values[seconds < times[0]] = np.nan
+    return values
+
+def rolling_average(values, ndays):
+    # Returns the average of each day and the ndays - 1 days before it. nan until there are ndays days,
+    #   and any day with a nan in its window is nan.
+    averages = np.full(len(values), np.nan)
+    if len(values) < ndays:
+        return averages
+    missing = np.isnan(values)
+    sums = np.cumsum(np.insert(np.where(missing, 0, values), 0, 0))
+    nmissing = np.cumsum(np.insert(missing, 0, False))
+    averages[ndays - 1:] = (sums[ndays:] - sums[:-ndays]) / ndays
+    averages[ndays - 1:][nmissing[ndays:] - nmissing[:-ndays] > 0] = np.nan
+    return averages
+
+def ratio(numerator, denominator):
+    # numerator / denominator, with nan where the denominator is 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+def chapter_windows(history, windowDays=CHAPTER_WINDOW_DAYS):
+    # Returns the ChapterWindows of every chapter after the first one the fic was tracked with
+    released = np.flatnonzero(history.chapter_added)[1:] # The first sample is flagged, but wasn't a new chapter
+    start = history.seconds[released].astype(np.int64)
+    end = start + windowDays * 86400
+    gained = {stat: values_at(history, stat, end) - values_at(history, stat, start) for stat in STATS}
+    # A window's end is only interpolated once there's a sample at or after it. Until then it's the last sample.
+    sample_after_end = np.searchsorted(history.seconds, end, side='left')
+    return ChapterWindows(nchapters=np.asarray(history.nchapters)[released],
+                          day=start // 86400,
+                          gained=gained,
+                          complete=sample_after_end < len(history))
+
+def analyze(history, windowDays=CHAPTER_WINDOW_DAYS):
+    # Returns the HistoryMetrics of the fic's HistoryArrays
+    first_day, last_day = history.seconds[0] // 86400, history.seconds[-1] // 86400
+    days = np.arange(first_day, last_day + 1)
+    end_of_day = (days + 1) * 86400 - 1
+
+    daily = {stat: values_at(history, stat, end_of_day) for stat in STATS}
+    per_day = {stat: np.insert(np.diff(daily[stat]), 0, np.nan) for stat in STATS}
+    rolling = {stat: {ndays: rolling_average(per_day[stat], ndays) for ndays in ROLLING_DAYS} for stat in STATS}
+    return HistoryMetrics(days=days,
+                          daily=daily,
+                          per_day=per_day,
+                          rolling=rolling,
+                          kudos_per_hit=ratio(daily['kudos'], daily['hits']),
+                          comments_per_hit=ratio(daily['comments'], daily['hits']),
+                          chapters=chapter_windows(history, windowDays))
+
+def analyze_saved(store, workID, historyArraysDirectory=cm.HISTORY_ARRAYS_DIRECTORY):
+    # Returns the HistoryMetrics of the fic's saved history arrays (brought up to date with the store first),
+    #   or None if it has none
+    history = history_arrays.load_current(store, workID, historyArraysDirectory)
+    if history is None or len(history) == 0:
+        return None
+    return analyze(history)
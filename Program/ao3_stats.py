@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# ao3_stats.py: Commands to do everything the user interface does without any prompts, so it can be scripted.
+#   Ex: ao3_stats.py add https://archiveofourown.org/works/32751484 --name "My Fic"
+#       ao3_stats.py import fics.txt --jobs 8
+#       ao3_stats.py remove 32751484
+#       ao3_stats.py list
+#       ao3_stats.py update --only 32751484 --jobs 4
+#       ao3_stats.py render --profile screen
+#       ao3_stats.py export history.csv --since-last warehouse
+#   Adding many fics at once (import) checks all of their work IDs on AO3 at the same time, and saves the fic
+#   list once at the end. The pages fetched to check them are also used as each fic's first data point.
+# Author: Fixationally_Consumed
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+# User Defined modules
+import common as cm
+from fic_registry import FicRegistry
+from user_interface import print_fics
+
+## Reading fics -------------------
+def parse_workID(ID_or_URL):
+    # Returns the work ID in a work ID or the URL of a work, or None if there isn't one
+    ID_or_URL = ID_or_URL.strip()
+    if ID_or_URL != '' and cm.isPosInt(ID_or_URL):
+        return ID_or_URL
+    return cm.workid_from_url(ID_or_URL)
+
+def read_import_file(filepath):
+    # Returns (work ID, fic name or None, graph directory or None) for every fic in the file, and the lines that
+    #   couldn't be read. One fic per line: the work ID or URL, optionally followed by ;;name and ;;graph directory,
+    #   the same as the fic save file. Blank lines and lines starting with # are skipped.
+    entries = list()
+    unreadable = list()
+    with open(filepath, 'r') as fh:
+        for line in fh:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            ID_or_URL, *optional_values = line.split(cm.SEP)
+            workID = parse_workID(ID_or_URL)
+            if workID is None:
+                unreadable.append(line)
+                continue
+            ficName = optional_values[0].strip() if len(optional_values) > 0 and optional_values[0].strip() != '' else None
+            graphDirectory = optional_values[1].strip() if len(optional_values) > 1 and optional_values[1].strip() != '' else None
+            entries.append((workID, ficName, graphDirectory))
+    return entries, unreadable
+
+def validate_workIDs(workIDs, jobs=cm.FETCH_JOBS):
+    # Fetches every work from AO3, `jobs` at a time. Returns {workID: its WorkStats, or why it couldn't be fetched},
+    #   so one work that fails (ex: AO3 refused it, or its page couldn't be read) doesn't stop the rest.
+    #   Raises NoConnectionError or AO3UnavailableError if AO3 can't be reached, since then none of them can be.
+    import fetch_AO3_stats
+    session = fetch_AO3_stats.get_session(pool_size=max(1, jobs))
+    session.reset()
+
+    def validate(workID):
+        try:
+            return fetch_AO3_stats.fetch_work_stats(int(workID), session)
+        except (fetch_AO3_stats.InvalidWorkIDError, fetch_AO3_stats.WorkUnavailableError):
+            return 'it\'s not on AO3, or can only be viewed when logged in.'
+        except (fetch_AO3_stats.NoConnectionError, fetch_AO3_stats.AO3UnavailableError):
+            raise
+        except Exception as e:
+            return f'it could not be fetched from AO3 ({e}).'
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return dict(zip(workIDs, executor.map(validate, workIDs)))
+
+## Commands -------------------
+def add_fics(registry, entries, validate=True, jobs=cm.FETCH_JOBS, graphDirectory=cm.DEFAULT_GRAPH_DIRECTORY, freshMinutes=None):
+    # Starts tracking every (work ID, fic name or None, graph directory or None) in entries, checking all of their
+    #   work IDs on AO3 at once first. Fics that can't be added are skipped. Returns the number of fics added.
+    new_entries = list()
+    for workID, ficName, ficGraphDirectory in entries:
+        if workID in registry or any(workID == entry[0] for entry in new_entries):
+            print(f'Skipping {workID}: it\'s already being tracked.')
+        elif ficName is not None and cm.includes_illegal_char(ficName):
+            print(f'Skipping {workID}: the name "{ficName}" has characters that aren\'t allowed.')
+        else:
+            new_entries.append((workID, ficName, ficGraphDirectory))
+
+    works = dict()
+    if validate and len(new_entries) > 0:
+        import fetch_AO3_stats
+        print(f'Checking {len(new_entries)} work IDs on AO3...')
+        try:
+            works = validate_workIDs([entry[0] for entry in new_entries], jobs)
+        except (fetch_AO3_stats.NoConnectionError, fetch_AO3_stats.AO3UnavailableError) as e:
+            print('AO3 could not be reached, so no fics were added:', e)
+            print('Try again later, or add them with --no-validate.')
+            return 0
+
+    taken = {fic['ficName'] for fic in registry.fics()}
+    new_fics = list()
+    for workID, ficName, ficGraphDirectory in new_entries:
+        if validate and isinstance(works[workID], str):
+            print(f'Skipping {workID}: {works[workID]}')
+            continue
+        if ficName is None:
+            ficName = cm.make_ficName(works[workID].title if validate else '', workID, taken)
+        elif ficName in taken:
+            print(f'Skipping {workID}: the name "{ficName}" is already used for another fic.')
+            continue
+        fic = {'workID': workID,
+               'ficName': ficName,
+               'graphDirectory': ficGraphDirectory or graphDirectory}
+        if freshMinutes is not None:
+            fic['freshMinutes'] = str(freshMinutes)
+        new_fics.append(fic)
+        taken.add(ficName)
+
+    registry.add_many(new_fics) # One write for all of them
+    for fic in new_fics:
+        print(f"Added: {fic['workID']}  {fic['ficName']}")
+    return len(new_fics)
+
+def remove_fics(registry, IDs_or_URLs):
+    # Stops tracking the fics. Their data is kept. Returns the number of fics removed.
+    workIDs = [parse_workID(ID_or_URL) for ID_or_URL in IDs_or_URLs]
+    for ID_or_URL, workID in zip(IDs_or_URLs, workIDs):
+        if workID not in registry:
+            print(f'{ID_or_URL} is not being tracked.')
+    removed = [registry.get(workID) for workID in workIDs if workID in registry]
+    registry.remove([fic['workID'] for fic in removed])
+    for fic in removed:
+        print(f"Removed: {fic['workID']}  {fic['ficName']}")
+    return len(removed)
+
+## Command line -------------------
+def make_parser():
+    parser = argparse.ArgumentParser(description='Tracks the stats of AO3 fics, without any prompts.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help='Start tracking a fic')
+    add.add_argument('work', help='The work ID or URL of the fic')
+    add.add_argument('--name', help='Name of the fic, used for its graph (default: its title on AO3)')
+    add.add_argument('--graph-dir', default=cm.DEFAULT_GRAPH_DIRECTORY, help='Folder the graph is saved in (default: the Desktop)')
+    add.add_argument('--fresh-minutes', type=int, help='Minutes the fic\'s data stays fresh for, instead of learning it')
+    add.add_argument('--no-validate', action='store_true', help='Don\'t check the work ID on AO3 first')
+
+    import_ = commands.add_parser('import', help='Start tracking every fic in a file, one work ID or URL per line '
+                                                 '(optionally followed by ;;name and ;;graph directory)')
+    import_.add_argument('file')
+    import_.add_argument('--graph-dir', default=cm.DEFAULT_GRAPH_DIRECTORY, help='Folder the graphs are saved in, for fics without one (default: the Desktop)')
+    import_.add_argument('--jobs', type=int, default=cm.FETCH_JOBS, help=f'Work IDs checked on AO3 at the same time (default: {cm.FETCH_JOBS})')
+    import_.add_argument('--no-validate', action='store_true', help='Don\'t check the work IDs on AO3 first')
+
+    remove = commands.add_parser('remove', help='Stop tracking fics (their data is kept)')
+    remove.add_argument('works', nargs='+', help='Work IDs or URLs of the fics')
+
+    commands.add_parser('list', help='Show every tracked fic')
+
+    update = commands.add_parser('update', help='Fetch the fics\' stats and update their graphs')
+    update.add_argument('--only', nargs='+', metavar='ID', help='Work IDs of the only fics to update')
+    update.add_argument('--jobs', type=int, default=cm.FETCH_JOBS, help=f'Fics fetched at the same time (default: {cm.FETCH_JOBS})')
+    update.add_argument('--render-jobs', type=int, default=cm.RENDER_JOBS, help=f'Graphs drawn at the same time (default: {cm.RENDER_JOBS})')
+    update.add_argument('--force', action='store_true', help='Update every fic, even ones updated recently')
+
+    render = commands.add_parser('render', help='Draw the graphs from the saved data, without fetching anything')
+    render.add_argument('--only', nargs='+', metavar='ID', help='Work IDs of the only fics to draw')
+    render.add_argument('--jobs', type=int, default=cm.RENDER_JOBS, help=f'Graphs drawn at the same time (default: {cm.RENDER_JOBS})')
+
+    from export_history import EXPORT_FORMATS
+    export = commands.add_parser('export', help='Export the data of every fic to a CSV, JSON Lines or Parquet file')
+    export.add_argument('output', help='File to export to (.csv, .jsonl or .parquet), or - to print it as CSV')
+    export.add_argument('--format', choices=EXPORT_FORMATS, help='Format to export in (default: from the file\'s extension)')
+    export.add_argument('--since-last', metavar='NAME', help='Only export the samples added since the last export with this name')
+
+    for command in [update, render]:
+        command.add_argument('--profile', choices=list(cm.RENDER_PROFILES), default=cm.RENDER_PROFILE,
+                             help=f'Size the graphs are drawn at (default: {cm.RENDER_PROFILE})')
+        command.add_argument('--format', choices=cm.GRAPH_FORMATS, default=cm.GRAPH_FORMAT,
+                             help=f'File type of the graphs (default: {cm.GRAPH_FORMAT})')
+    return parser
+
+def main(argv=None):
+    # Runs the command and returns the exit code
+    args = make_parser().parse_args(argv)
+    registry = FicRegistry(cm.FIC_SAVE_FILEPATH)
+
+    if args.command == 'add':
+        workID = parse_workID(args.work)
+        if workID is None:
+            print(f'No work ID could be found in "{args.work}"')
+            return 1
+        added = add_fics(registry, [(workID, args.name, None)], validate=not args.no_validate,
+                         graphDirectory=args.graph_dir, freshMinutes=args.fresh_minutes)
+        return 0 if added == 1 else 1
+    elif args.command == 'import':
+        entries, unreadable = read_import_file(args.file)
+        for line in unreadable:
+            print(f'Skipping "{line}": no work ID could be found in it.')
+        added = add_fics(registry, entries, validate=not args.no_validate, jobs=args.jobs, graphDirectory=args.graph_dir)
+        print(f'{added} of {len(entries) + len(unreadable)} fics added.')
+        return 0 if added == len(entries) + len(unreadable) else 1
+    elif args.command == 'remove':
+        removed = remove_fics(registry, args.works)
+        return 0 if removed == len(args.works) else 1
+    elif args.command == 'list':
+        print_fics(registry.fics())
+        return 0
+    elif args.command == 'update':
+        import update_AO3_fics
+        kwargs = dict(registry=registry, jobs=args.jobs, force=args.force, render_jobs=args.render_jobs,
+                      profile=args.profile, graphFormat=args.format)
+        if args.only is not None:
+            # Not folded into other runs, since a follow-up run would only update these fics
+            update_AO3_fics.update_AO3_fics(cm.FIC_SAVE_FILEPATH, only=[parse_workID(ID) for ID in args.only], **kwargs)
+        else:
+            update_AO3_fics.coalesced_update(cm.FIC_SAVE_FILEPATH, **kwargs)
+        return 0
+    elif args.command == 'render':
+        only = [parse_workID(ID) for ID in args.only] if args.only is not None else None
+        from tracker import Tracker
+        with Tracker() as tracker:
+            print(f'{tracker.render(only, args.profile, args.format, args.jobs)} graphs drawn.')
+        return 0
+    elif args.command == 'export':
+        from export_history import export_history, ExportError
+        try:
+            nrows = export_history(args.output, args.format, args.since_last)
+        except ExportError as e:
+            print(e, file=sys.stderr)
+            return 1
+        if args.output != '-':
+            print(f'{nrows} samples exported to: ', args.output)
+        return 0
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
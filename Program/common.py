@@ -2,7 +2,12 @@
 # This file contains a list of constants used throughout the project
 # Author: Fixationally_Consumed
 import os
+import re
+import json
+import uuid
 import pathlib
+import datetime
+import contextlib
 
 """ File Directory
 -- Cron
@@ -10,16 +15,44 @@ import pathlib
 -- Home
   |__ AO3 Stats
      |__ Program
+     |  |__ analyze_history.py
+     |  |__ ao3_stats.py
      |  |__ common.py
+     |  |__ export_history.py
+     |  |__ fetch_AO3_stats.py
+     |  |__ fic_registry.py
+     |  |__ file_locks.py
      |  |__ generate_graph.py
+     |  |__ generate_report.py
+     |  |__ history_arrays.py
      |  |__ interact_with_cron.py
+     |  |__ poll_intervals.py
+     |  |__ response_cache.py
+     |  |__ scheduler_service.py
+     |  |__ tracker.py
      |  |__ update_AO3_fics.py
      |  |__ user_interface.py
+     |  |__ work_history_store.py
      |  |__ <other environment folders>
      |
+     |__ AO3_Stats_Report.html (see generate_report.py)
+     |
      |__ Data
         |__ AO3_fic_list_save_file.txt
-        |__ <pickle files>
+        |__ AO3_listing_sources.txt (optional)
+        |__ AO3_listing_coverage.json (only if there are listing sources)
+        |__ AO3_work_history.sqlite3 (the data of every fic, see work_history_store.py)
+        |__ History_Arrays (memory-mappable copies of the data, see history_arrays.py)
+        |__ scheduler_service.json, scheduler_service.pid, scheduler_service.log (only while the service is used)
+        |__ update_runs.log (every update run, and every trigger folded into one, see update_AO3_fics.py)
+        |__ <old pickle files, renamed to .imported once they're in the store>
+     |
+     |__ Cache
+     |  |__ <gzipped work pages, see response_cache.py>
+     |
+     |__ Locks
+        |__ <one lock file per fic, see file_locks.py>
+        |__ update.lock, update.pending (only one update runs at a time)
 """
 
 """ Script interactions
@@ -37,9 +70,9 @@ import pathlib
                           \ /
                            V
                     update_AO3_fics.py
-                           |
-                           V
-                    generate_graph.py
+                     /           \
+                    V             V
+      fetch_AO3_stats.py    generate_graph.py
 
 """
 
@@ -49,11 +82,15 @@ SEP = ';;'
 MAIN_DIR_NAME = 'AO3_Stats'
 PROGRAM_DIR_NAME = 'Program'
 DATA_DIR_NAME = 'Data'
+CACHE_DIR_NAME = 'Cache'
+LOCK_DIR_NAME = 'Locks'
 
 HOME_DIR = str(pathlib.Path.home())
 MAIN_DIRECTORY = os.path.join(HOME_DIR, MAIN_DIR_NAME)
 PROGRAM_DIRECTORY = os.path.join(MAIN_DIRECTORY, PROGRAM_DIR_NAME)
 DATA_DIRECTORY = os.path.join(MAIN_DIRECTORY, DATA_DIR_NAME)
+CACHE_DIRECTORY = os.path.join(MAIN_DIRECTORY, CACHE_DIR_NAME)
+LOCK_DIRECTORY = os.path.join(MAIN_DIRECTORY, LOCK_DIR_NAME)
 
 #HISTORY_FOLDER_NAME = MAIN_DIR_NAME
 #HISTORY_FOLDER_DIRECTORY = os.path.join(HOME_DIR, HISTORY_FOLDER_NAME)
@@ -64,13 +101,136 @@ FIC_SAVE_DICRECTORY = DATA_DIRECTORY
 FIC_SAVE_FILENAME = 'AO3_fic_list_save_file.txt'
 FIC_SAVE_FILEPATH = os.path.join(FIC_SAVE_DICRECTORY, FIC_SAVE_FILENAME)
 
+DEFAULT_GRAPH_DIRECTORY = os.path.join(HOME_DIR, 'Desktop') # Where graphs are saved if no folder is picked
+
+REPORT_FILENAME = 'AO3_Stats_Report.html'
+REPORT_FILEPATH = os.path.join(MAIN_DIRECTORY, REPORT_FILENAME)
+
+HISTORY_STORE_FILENAME = 'AO3_work_history.sqlite3'
+HISTORY_STORE_FILEPATH = os.path.join(HISTORY_FOLDER_DIRECTORY, HISTORY_STORE_FILENAME)
+RAW_RETENTION_DAYS = 7 # Every sample is kept for this many days...
+HOURLY_RETENTION_DAYS = 90 # ...then one sample an hour is kept up to this many days, then one a day
+HISTORY_ARRAYS_DIRECTORY = os.path.join(HISTORY_FOLDER_DIRECTORY, 'History_Arrays') # Memory-mappable copies of the data, see history_arrays.py
+
+# Optional file of AO3 listing pages (a user's works, a series, or a bookmark list), one per line.
+#   The stats of any tracked fic in one of these listings are read from the listing, 20 fics per request.
+#   Ex: https://archiveofourown.org/users/Fixationally_Consumed/works
+LISTING_SOURCES_FILENAME = 'AO3_listing_sources.txt'
+LISTING_SOURCES_FILEPATH = os.path.join(FIC_SAVE_DICRECTORY, LISTING_SOURCES_FILENAME)
+# Which listing each fic was found in last time, so only that listing is read for it (see fetch_AO3_stats.harvest_listing_stats)
+LISTING_COVERAGE_FILENAME = 'AO3_listing_coverage.json'
+LISTING_COVERAGE_FILEPATH = os.path.join(FIC_SAVE_DICRECTORY, LISTING_COVERAGE_FILENAME)
+
+# Number of fics fetched from AO3 at the same time when updating
+FETCH_JOBS = 4
+
+# A fic updated less than this many minutes ago is skipped, since AO3's stats won't have changed much.
+#   This can be set for a single fic by adding it as a 4th value on the fic's line in the save file.
+FRESHNESS_MINUTES = 60
+# Each fic's freshness window is learned from how fast its stats have been changing (see poll_intervals.py),
+#   from FRESHNESS_MINUTES for busy fics up to MAX_POLL_MINUTES for quiet ones
+ADAPTIVE_POLLING = True
+MAX_POLL_MINUTES = 7 * 24 * 60
+POLL_TARGET_CHANGES = 10 # Hits, kudos and comments a fic should gain between updates
+POLL_LOOKBACK_DAYS = 14 # Days of a fic's history its change rate is measured over
+NEW_CHAPTER_DAYS = 3 # A fic is updated as often as possible for this many days after a new chapter
+RENDER_JOBS = os.cpu_count() or 1 # Number of graphs drawn at the same time, each in its own process
+RENDER_PROFILE = 'full' # Size graphs are drawn at: 'full', 'screen', 'thumbnail' or 'analysis' (see RENDER_PROFILES)
+GRAPH_FORMAT = 'png' # File type of the graphs: one of GRAPH_FORMATS
+
+# Sizes a graph can be drawn at, picked with RENDER_PROFILE (or update_AO3_fics.py --profile). See generate_graph.py.
+#   figsize is in inches, and the text is scaled with its width. Long histories are downsampled to about one
+#   point per pixel across (see history_arrays.lttb_indices), so a graph takes as long to draw as its size, not its history.
+#   max_chapter_labels: Most chapter numbers labeled on each subplot (None for all). The labels are spread out.
+#   analysis: Adds two more subplots, of new hits/kudos/comments per day and of kudos and comments per hit
+#             (see analyze_history.py)
+#   The profile is part of each graph's fingerprint, so changing one redraws every graph on the next update.
+RENDER_PROFILES = {
+    'full':      {'figsize': (15, 15), 'dpi': 300, 'max_chapter_labels': None, 'analysis': False},
+    'screen':    {'figsize': (15, 15), 'dpi': 100, 'max_chapter_labels': 60,   'analysis': False},
+    'thumbnail': {'figsize': (6, 6),   'dpi': 60,  'max_chapter_labels': 0,    'analysis': False},
+    'analysis':  {'figsize': (15, 25), 'dpi': 150, 'max_chapter_labels': None, 'analysis': True},
+}
+GRAPH_FORMATS = ['png', 'svg', 'webp']
+
+ILLEGAL_CHARS = '/<>:"\|?*;' # Characters fic names can't have, since they're used in file names and the save file
+
+AO3_URL = 'https://archiveofourown.org'
+REQUEST_TIMEOUT = 30 # Seconds to wait on AO3 before giving up on a request
+CACHE_MAX_BYTES = 200 * 1024 * 1024 # Size cap of the cache of fetched work pages
+VALIDATION_REUSE_MINUTES = 6 * 60 # A new fic's first data point can use the page fetched to validate it for this long
+USER_AGENT = 'AO3_Stats (https://github.com/Fixationally-Consumed/AO3_Stats_Distro)'
+REQUESTS_PER_MINUTE = 60 # Average pace of requests to AO3
+REQUEST_BURST = 5 # Requests that can be made at once before the pace kicks in
+MAX_RETRIES = 4 # Times a request is retried when AO3 is rate-limiting (429) or having server issues (5xx)
+BACKOFF_SECONDS = 2 # Wait before the first retry, doubled every retry after
+MAX_BACKOFF_SECONDS = 120
+MAX_SERVER_ERRORS = 5 # Server errors (5xx) in a row before the run is stopped
+SERVER_ERROR_COOLDOWN_SECONDS = 5 * 60 # After that, requests are stopped this long before AO3 is tried again
+
+# The service (see scheduler_service.py) runs the updates instead of cron, from one program that stays running
+SERVICE_STATE_FILEPATH = os.path.join(DATA_DIRECTORY, 'scheduler_service.json') # When it last updated the fics
+SERVICE_PID_FILEPATH = os.path.join(DATA_DIRECTORY, 'scheduler_service.pid')
+SERVICE_LOG_FILEPATH = os.path.join(DATA_DIRECTORY, 'scheduler_service.log')
+SERVICE_JITTER_SECONDS = 120 # Each update starts up to this many seconds after its tracking time, at random
+SERVICE_CATCH_UP_DAYS = 7 # Tracking times missed while the computer was off are only caught up on this far back
+
+# Only one update runs at a time. An update started while another is running doesn't run itself, it's folded
+#   into one more run right after the current one (see update_AO3_fics.coalesced_update)
+RUN_LOCK_FILEPATH = os.path.join(LOCK_DIRECTORY, 'update.lock')
+RUN_PENDING_FILEPATH = os.path.join(LOCK_DIRECTORY, 'update.pending') # Exists while a follow-up run is wanted
+RUN_LOG_FILEPATH = os.path.join(DATA_DIRECTORY, 'update_runs.log')
+
+TRACKER_CACHE_SIZE = 64 # Fics' histories a Tracker keeps in memory (see tracker.py)
+
 ## Functions -------------------
-def make_graph_filename(ficName):
-    return f"{ficName} - stats.png"
+def includes_illegal_char(string):
+    windows_illegal_names = """CON, PRN, AUX, NUL, COM1, COM2, COM3, COM4, COM5, COM6, COM7, COM8, COM9, LPT1, LPT2, LPT3, LPT4, LPT5, LPT6, LPT7, LPT8, LPT9""".split(', ')
+    for char in string:
+        if char in ILLEGAL_CHARS:
+            return True
+    if string in windows_illegal_names:
+        return True
+    elif string.endswith(' ') or string.endswith('.'):
+        return True
+    else:
+        return False
+    return None
+
+def make_ficName(title, workID, taken):
+    # Returns a fic name made from the work's title, without the characters fic names can't have.
+    #   The work ID is added on if the name is already taken.
+    ficName = ''.join(char for char in title if char not in ILLEGAL_CHARS).strip().rstrip('.').strip()
+    if ficName == '' or includes_illegal_char(ficName):
+        ficName = f'Work {workID}'
+    if ficName in taken:
+        ficName = f'{ficName} {workID}'
+    return ficName
+
+def make_graph_filename(ficName, graphFormat=GRAPH_FORMAT, profile=RENDER_PROFILE):
+    # Graphs drawn at a render profile other than RENDER_PROFILE get the profile in their name, ex: "My Fic - stats (thumbnail).png",
+    #   so they're kept next to the usual graph instead of drawn over it
+    if profile != RENDER_PROFILE:
+        return f"{ficName} - stats ({profile}).{graphFormat}"
+    return f"{ficName} - stats.{graphFormat}"
 
 def make_workHistory_filename(ficName, ID):
     return f"{ficName}_{ID}_workHistory.pickle"
 
+def workid_from_url(URL):
+    # Returns the work ID (as a str) in the URL of a work, ex: https://archiveofourown.org/works/32751484/chapters/81257581,
+    #   or None if there isn't one
+    match = re.search(r'/works/(\d+)', URL)
+    return match.group(1) if match is not None else None
+
+def is_fresh(fic, last_updated, freshMinutes=FRESHNESS_MINUTES):
+    # Returns True if the fic was updated (at last_updated) recently enough that it doesn't need to be updated again yet.
+    #   The fic's own freshness window, if it has one, is used over freshMinutes.
+    freshMinutes = int(fic.get('freshMinutes') or freshMinutes)
+    if last_updated is None or freshMinutes <= 0:
+        return False
+    return datetime.datetime.now() - last_updated < datetime.timedelta(minutes=freshMinutes)
+
 def ensure_fic_save_file_exists(fic_save_filepath):
     fic_save_directory = os.path.dirname(fic_save_filepath)
     # Create the save folder if it doesn't already exist
@@ -87,29 +247,97 @@ def read_in(filepath):
     with open(filepath, 'r') as fh:
         split_raw_text = fh.readlines()
 
-    processed_split_raw_text = list()
     for line in split_raw_text:
         line = line.strip()
         if line == '': # Either blank spaces or new lines
             continue
-        processed_split_raw_text.append(line)
-    
-    for line in processed_split_raw_text:
-        workID, ficName, graphDirectory = line.split(SEP)
-        fic_obj.append({'workID':workID,
-                    'ficName': ficName,
-                    'graphDirectory': graphDirectory})
+        fic = parse_fic_line(line)
+        if fic is not None:
+            fic_obj.append(fic)
     return fic_obj
 
+def parse_fic_line(line):
+    # Returns the fic dictionary of one (stripped) line of the fic save file, or None if the line isn't a valid fic
+    #   (ex: it was edited by hand). A bad line is skipped with a warning, so it can't stop every other fic from updating.
+    values = line.split(SEP)
+    if len(values) < 3:
+        print(f'Skipping a line of the fic save file that is missing values: {line}')
+        return None
+    workID, ficName, graphDirectory, *optional_values = values
+    if workID == '' or not isPosInt(workID):
+        print(f'Skipping a line of the fic save file with a work ID that is not a number: {line}')
+        return None
+    fic = {'workID':workID,
+           'ficName': ficName,
+           'graphDirectory': graphDirectory}
+    if len(optional_values) > 0 and optional_values[0] != '':
+        try:
+            int(optional_values[0])
+        except ValueError:
+            print(f'Skipping a line of the fic save file with minutes between updates that are not a number: {line}')
+            return None
+        fic['freshMinutes'] = optional_values[0]
+    return fic
+
+def make_fic_line(fic):
+    # Returns the line of the fic save file for the fic, including the new line
+    values = [fic['workID'], fic['ficName'], fic['graphDirectory']]
+    if fic.get('freshMinutes'):
+        values.append(fic['freshMinutes'])
+    return SEP.join(values) + '\n'
+
+def read_in_listing_sources(filepath):
+    # Returns the listing pages in the file. Blank lines and lines starting with # are skipped
+    if not os.path.exists(filepath):
+        return list()
+    with open(filepath, 'r') as fh:
+        lines = [line.strip() for line in fh.readlines()]
+    return [line for line in lines if line != '' and not line.startswith('#')]
+
+def read_listing_coverage(filepath, sources):
+    # Returns {workID: (the listing it was found in last time, the page it was on), or '' if it wasn't in any of them}.
+    #   If the listings have changed since, the fics that weren't in any are forgotten, so they're looked for again.
+    if not os.path.exists(filepath):
+        return dict()
+    try:
+        with open(filepath, 'r') as fh:
+            saved = json.load(fh)
+    except ValueError:
+        return dict() # It's only a shortcut, so the listings are just searched again
+    changed = saved['sources'] != list(sources)
+    coverage = dict()
+    for workID, listed in saved['coverage'].items():
+        if listed == '' and not changed:
+            coverage[int(workID)] = ''
+        elif isinstance(listed, list):
+            coverage[int(workID)] = tuple(listed)
+    return coverage
+
+def write_listing_coverage(coverage, filepath, sources):
+    with atomic_write(filepath) as fh:
+        json.dump({'sources': list(sources), 'coverage': {str(workID): listed for workID, listed in coverage.items()}}, fh)
+    return None
+
+@contextlib.contextmanager
+def atomic_write(filepath, mode='w', **open_kwargs):
+    # Opens a temporary file next to filepath to write to, and renames it to filepath once the with block finishes,
+    #   so filepath is never seen half written. If the block raises, the temporary file is removed and filepath
+    #   is left as it was. The temporary file's name is unique, so two programs writing the same file don't mix.
+    #   mode: 'w' or 'wb', open_kwargs: passed on to open(), ex: encoding='utf-8'
+    temp_filepath = f'{filepath}.{uuid.uuid4().hex[:12]}.tmp'
+    try:
+        with open(temp_filepath, mode.replace('w', 'x'), **open_kwargs) as fh:
+            yield fh
+        os.replace(temp_filepath, filepath)
+    except BaseException:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+        raise
+
 def write_out(fics_obj, filepath, alterFicNumber=None):
-    if len(fics_obj) > 0:
-        with open(filepath, 'w') as fh:
-            for fic in fics_obj:
-                line = SEP.join([fic['workID'], fic['ficName'], fic['graphDirectory']]) + '\n'
-                fh.write(line)
-    else:
-        with open(filepath, 'w') as fh:
-            fh.write('')
+    with atomic_write(filepath) as fh:
+        for fic in fics_obj:
+            fh.write(make_fic_line(fic))
     return None
 
 def clear_screen(new_lines=20):
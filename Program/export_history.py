@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# export_history.py: Writes every fic's data out of the store to a CSV, JSON Lines or Parquet file, one row per sample:
+#   workID, ficName, sampled_at, days_since_published, nchapters, words, hits, kudos, comments
+#   The samples are streamed from the store to the file one at a time (Parquet: EXPORT_BATCH_ROWS at a time),
+#   so it uses the same small amount of memory however many fics and however much history there is.
+#   An incremental export (--since-last NAME) only writes the samples added since the last export with that name,
+#   ex: for loading into a database on a schedule. Samples re-added for times already exported (ex: by
+#   update_AO3_fics.py --replay) aren't exported again; a full export has them.
+#   Parquet needs pyarrow, which isn't installed with the rest of the program since only this uses it.
+# Author: Fixationally_Consumed
+import os
+import sys
+import csv
+import json
+import argparse
+import datetime
+import itertools
+# User Defined modules
+import common as cm
+from fic_registry import FicRegistry
+from work_history_store import WorkHistoryStore
+
+EXPORT_FORMATS = ['csv', 'jsonl', 'parquet']
+EXPORT_COLUMNS = ['workID', 'ficName', 'sampled_at', 'days_since_published', 'nchapters', 'words', 'hits', 'kudos', 'comments']
+EXPORT_BATCH_ROWS = 50000 # Rows per Parquet row group
+
+class ExportError(Exception):
+    pass
+
+## Rows -------------------
+def export_rows(samples, ficNames, exported_until):
+    # Yields the export row of each sample in the store, and keeps track of the newest sample of each work in
+    #   exported_until ({workID: unix time}) as it goes. Works that are no longer tracked have no fic name.
+    for workID, sampled_at, *stats in samples:
+        exported_until[workID] = sampled_at
+        yield (workID, ficNames.get(str(workID), ''), datetime.datetime.fromtimestamp(sampled_at), *stats)
+
+## Writers -------------------
+def write_csv(rows, fh):
+    writer = csv.writer(fh)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow((*row[:2], row[2].isoformat(), *row[3:]))
+    return None
+
+def write_jsonl(rows, fh):
+    for row in rows:
+        fh.write(json.dumps(dict(zip(EXPORT_COLUMNS, (*row[:2], row[2].isoformat(), *row[3:])))) + '\n')
+    return None
+
+def import_pyarrow():
+    # Returns pyarrow and pyarrow.parquet, or raises ExportError saying how to install them
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ExportError('Exporting to Parquet needs pyarrow, which is not installed. Install it with:\n'
+                          f'    {os.path.join(cm.PROGRAM_DIRECTORY, "venv/bin/python3")} -m pip install pyarrow') from None
+    return pyarrow, pyarrow.parquet
+
+def write_parquet(rows, fh):
+    # Writes EXPORT_BATCH_ROWS rows at a time, each as its own row group. fh: a file opened with 'wb'
+    pa, pq = import_pyarrow()
+    schema = pa.schema([('workID', pa.int64()), ('ficName', pa.string()), ('sampled_at', pa.timestamp('s')),
+                        ('days_since_published', pa.int32()), ('nchapters', pa.int32()), ('words', pa.int64()),
+                        ('hits', pa.int64()), ('kudos', pa.int64()), ('comments', pa.int64())])
+    with pq.ParquetWriter(fh, schema) as writer:
+        while True:
+            batch = list(itertools.islice(rows, EXPORT_BATCH_ROWS))
+            if len(batch) == 0:
+                break
+            writer.write_table(pa.Table.from_arrays([pa.array(column, type=field.type) for column, field in zip(zip(*batch), schema)],
+                                                    schema=schema))
+    return None
+
+## Exporting -------------------
+def export_format(output_filepath, exportFormat=None):
+    # Returns the format to export in: exportFormat if it's given, otherwise the output file's extension
+    exportFormat = exportFormat or os.path.splitext(output_filepath)[1].lstrip('.').lower()
+    if exportFormat not in EXPORT_FORMATS:
+        raise ExportError(f'Cannot tell what format to export "{output_filepath}" in. Pick one with --format ({", ".join(EXPORT_FORMATS)}).')
+    return exportFormat
+
+def export_history(output_filepath, exportFormat=None, since_last=None, fic_save_filepath=cm.FIC_SAVE_FILEPATH,
+                   store_filepath=cm.HISTORY_STORE_FILEPATH):
+    # Exports the samples to output_filepath ('-' for the screen, as CSV or JSON Lines) and returns how many rows
+    #   were written. since_last: name of an incremental export, so only samples it hasn't exported yet are written.
+    #   Where it's up to is only saved once the whole file is written, so a failed export is simply done again.
+    if output_filepath == '-':
+        exportFormat = exportFormat or 'csv'
+    exportFormat = export_format(output_filepath, exportFormat)
+    if exportFormat == 'parquet':
+        if output_filepath == '-':
+            raise ExportError('Parquet can only be exported to a file.')
+        import_pyarrow() # Before anything is written, if it isn't installed
+    ficNames = {fic['workID']: fic['ficName'] for fic in FicRegistry(fic_save_filepath).fics()}
+    store = WorkHistoryStore(store_filepath)
+    exported_until = dict()
+    counted = [0]
+
+    def count(rows):
+        for row in rows:
+            counted[0] += 1
+            yield row
+
+    samples = store.iter_samples(since_last)
+    rows = count(export_rows(samples, ficNames, exported_until))
+    try:
+        if output_filepath == '-':
+            (write_csv if exportFormat == 'csv' else write_jsonl)(rows, sys.stdout)
+            sys.stdout.flush()
+        else:
+            # A half written export is never left behind
+            if exportFormat == 'parquet':
+                with cm.atomic_write(output_filepath, 'wb') as fh:
+                    write_parquet(rows, fh)
+            else:
+                with cm.atomic_write(output_filepath, newline='' if exportFormat == 'csv' else None, encoding='utf-8') as fh:
+                    (write_csv if exportFormat == 'csv' else write_jsonl)(rows, fh)
+        if since_last is not None:
+            store.set_exported_until(since_last, exported_until)
+            store.commit()
+    finally:
+        samples.close() # Stops reading from the store, if the export stopped partway
+        store.close()
+    return counted[0]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exports the data of every fic to a CSV, JSON Lines or Parquet file.')
+    parser.add_argument('output', help='File to export to (.csv, .jsonl or .parquet), or - to print it as CSV')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, help='Format to export in (default: from the file\'s extension)')
+    parser.add_argument('--since-last', metavar='NAME',
+                        help='Only export the samples added since the last export with this name, ex: --since-last warehouse')
+    args = parser.parse_args()
+    try:
+        nrows = export_history(args.output, args.format, args.since_last)
+    except ExportError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    if args.output != '-':
+        print(f'{nrows} samples exported to: ', args.output)
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+# fetch_AO3_stats.py: Fetches only the stats of an AO3 work (chapters, words, hits, kudos, comments, and publish date).
+#   A work's stats are at the very top of its page, so the page is read in chunks and the download stops as soon
+#   as the stats have been parsed. The chapters themselves, which are nearly all of a long work, are never read.
+#   Every request goes through one shared AO3Session, which reuses connections and paces requests so AO3 doesn't
+#   start rate-limiting (HTTP 429) partway through a run.
+# Author: Fixationally_Consumed
+import os
+import codecs
+import datetime
+import email.utils
+import random
+import threading
+import time
+from collections import namedtuple
+from html.parser import HTMLParser
+import requests
+from requests.adapters import HTTPAdapter
+# User Defined modules
+import common as cm
+import response_cache
+
+# Has the same attribute names as AO3.Work, so it can be used anywhere a work was used before
+#   fetched_at is when the stats were read from AO3, to the second
+WorkStats = namedtuple('WorkStats', ['workID', 'title', 'date_published', 'nchapters', 'words', 'hits', 'kudos', 'comments', 'fetched_at'])
+
+CHUNK_SIZE = 16 * 1024 # Bytes read from AO3 at a time
+DRAIN_LIMIT = 64 * 1024 # If less than this is left of a page, it's read anyway so the connection can be reused
+
+class InvalidWorkIDError(Exception):
+    # The work does not exist on AO3
+    pass
+
+class WorkUnavailableError(Exception):
+    # The work exists, but its stats can't be read (ex: it's only viewable when logged in)
+    pass
+
+class NoConnectionError(Exception):
+    # AO3 couldn't be reached at all (ex: no internet)
+    pass
+
+class AO3UnavailableError(Exception):
+    # AO3 kept answering with server errors (5xx), so there's no point in continuing the run
+    pass
+
+## Session -------------------
+class TokenBucket:
+    """
+    Limits requests to `rate` per second on average, while allowing bursts of up to `capacity` requests.
+    Each request takes a token. When the bucket is empty, the request waits until its token has refilled.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1 # Reserve a token, even if it's not refilled yet
+            wait = max(-self._tokens / self.rate, self._paused_until - now, 0)
+        time.sleep(wait)
+        return None
+
+    def pause(self, seconds):
+        # Stops every request for `seconds`, ex: when AO3 says to retry after a while
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0)
+        return None
+
+def retry_after_seconds(response):
+    # Returns how long AO3 asked to wait before trying again, or None if it didn't say
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    if value.strip().isdigit():
+        return int(value.strip())
+    try:
+        retry_time = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0, (retry_time - datetime.datetime.now(retry_time.tzinfo)).total_seconds())
+
+def backoff_seconds(attempt):
+    # Exponential backoff with jitter, so threads that were turned away together don't all retry together
+    delay = min(cm.MAX_BACKOFF_SECONDS, cm.BACKOFF_SECONDS * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+class AO3Session:
+    """
+    A requests.Session shared by the whole run, so connections to AO3 are kept alive and reused between fics.
+
+    - Requests are paced by a TokenBucket to cm.REQUESTS_PER_MINUTE.
+    - HTTP 429 (rate-limited) and 5xx responses are retried with exponential backoff. A 429's Retry-After is
+      honored by pausing every request, not just the one that was turned away.
+    - After cm.MAX_SERVER_ERRORS 5xx responses in a row, AO3UnavailableError is raised for every request,
+      so the run stops early instead of hammering AO3 while it's down. Once cm.SERVER_ERROR_COOLDOWN_SECONDS
+      have passed, requests are let through again to see if AO3 is back, and reset() (called at the start of
+      every run) forgets the errors right away. The session lives as long as the process (ex: the scheduler
+      service), so it must be able to recover from an outage.
+    """
+    def __init__(self, pool_size=cm.FETCH_JOBS, requests_per_minute=cm.REQUESTS_PER_MINUTE):
+        self._session = requests.Session()
+        self._session.headers['User-Agent'] = cm.USER_AGENT
+        self.pool_size = 0
+        self.ensure_pool_size(pool_size)
+        self._bucket = TokenBucket(rate=requests_per_minute / 60, capacity=cm.REQUEST_BURST)
+        self._server_errors = 0 # 5xx responses in a row
+        self._unavailable_since = 0 # When the last 5xx that kept the errors over the limit came in (time.monotonic())
+        self._lock = threading.Lock()
+
+    def ensure_pool_size(self, pool_size):
+        # Makes sure there are enough pooled connections for `pool_size` requests at once
+        if pool_size > self.pool_size:
+            self.pool_size = pool_size
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            self._session.mount('https://', adapter)
+            self._session.mount('http://', adapter)
+        return None
+
+    def reset(self):
+        # Forgets the server errors from before, so the next request goes to AO3 again
+        with self._lock:
+            self._server_errors = 0
+            self._unavailable_since = 0
+        return None
+
+    def get(self, url, **kwargs):
+        # Returns the response to a GET request, retrying when AO3 is rate-limiting or having server issues
+        kwargs.setdefault('timeout', cm.REQUEST_TIMEOUT)
+        for attempt in range(cm.MAX_RETRIES + 1):
+            if (self._server_errors >= cm.MAX_SERVER_ERRORS
+                    and time.monotonic() - self._unavailable_since < cm.SERVER_ERROR_COOLDOWN_SECONDS):
+                raise AO3UnavailableError(f'AO3 returned {self._server_errors} server errors in a row')
+            self._bucket.take()
+            try:
+                response = self._session.get(url, **kwargs)
+            except requests.ConnectionError as e:
+                if attempt == cm.MAX_RETRIES:
+                    raise NoConnectionError(str(e)) from e
+                time.sleep(backoff_seconds(attempt))
+                continue
+
+            if response.status_code == 429:
+                delay = retry_after_seconds(response)
+                delay = backoff_seconds(attempt) if delay is None else delay + random.uniform(0, 1)
+                self._bucket.pause(delay)
+            elif response.status_code >= 500:
+                with self._lock:
+                    self._server_errors += 1
+                    if self._server_errors >= cm.MAX_SERVER_ERRORS:
+                        self._unavailable_since = time.monotonic()
+                delay = backoff_seconds(attempt)
+            else:
+                with self._lock:
+                    self._server_errors = 0
+                return response
+
+            if attempt == cm.MAX_RETRIES:
+                return response # Out of retries, the caller will see the error status
+            response.close()
+            time.sleep(delay)
+        return None
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+def get_session(pool_size=cm.FETCH_JOBS):
+    # Returns the AO3Session shared by everything in this process. It's made the first time it's needed.
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = AO3Session(pool_size=pool_size)
+        _shared_session.ensure_pool_size(pool_size)
+    return _shared_session
+
+## Work pages -------------------
+def to_int(text):
+    # AO3 writes large numbers with commas (ex: 12,345)
+    text = text.strip().replace(',', '')
+    return int(text) if text != '' else 0
+
+class WorkStatsParser(HTMLParser):
+    """
+    Reads the stats <dl> and the title from the top of a work's page.
+
+    The stats are in <dl class="stats">, with one <dd> per stat, ex: <dd class="hits">1,234</dd>
+    The title is in the <h2 class="title heading"> right after them.
+    Once both have been read, `done` is set and nothing else on the page needs to be fed in.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stats = dict()
+        self.title = None
+        self.done = False
+        self._in_stats = False
+        self._stats_read = False
+        self._current_dd = None
+        self._in_title = False
+        self._text = list()
+
+    def handle_starttag(self, tag, attrs):
+        classes = (dict(attrs).get('class') or '').split()
+        if tag == 'dl' and 'stats' in classes and not self._stats_read:
+            self._in_stats = True
+        elif tag == 'dd' and self._in_stats and len(classes) > 0:
+            self._current_dd = classes[0]
+            self._text = list()
+        elif tag == 'h2' and 'title' in classes and self.title is None:
+            self._in_title = True
+            self._text = list()
+        elif tag == 'div' and dict(attrs).get('id') == 'chapters':
+            # Made it to the body of the work, there's nothing left to find
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == 'dd' and self._current_dd is not None:
+            self.stats[self._current_dd] = ''.join(self._text).strip()
+            self._current_dd = None
+        elif tag == 'dl' and self._in_stats:
+            self._in_stats = False
+            self._stats_read = True
+        elif tag == 'h2' and self._in_title:
+            self.title = ' '.join(''.join(self._text).split())
+            self._in_title = False
+        if self._stats_read and self.title is not None:
+            self.done = True
+
+    def handle_data(self, data):
+        if self._current_dd is not None or self._in_title:
+            self._text.append(data)
+
+    def work_stats(self, workID, fetched_at):
+        # Returns the parsed stats. Stats AO3 leaves off the page (ex: no kudos yet) are 0, same as AO3.Work
+        if 'published' not in self.stats:
+            raise WorkUnavailableError(f'Could not find the stats of work {workID}')
+        return WorkStats(workID=int(workID),
+                         title=self.title or '',
+                         date_published=datetime.datetime.strptime(self.stats['published'], '%Y-%m-%d'),
+                         nchapters=to_int(self.stats.get('chapters', '0').split('/')[0]),
+                         words=to_int(self.stats.get('words', '0')),
+                         hits=to_int(self.stats.get('hits', '0')),
+                         kudos=to_int(self.stats.get('kudos', '0')),
+                         comments=to_int(self.stats.get('comments', '0')),
+                         fetched_at=fetched_at)
+
+def now():
+    # The time stats are recorded at. Seconds are plenty, and match the response cache's filenames
+    return datetime.datetime.now().replace(microsecond=0)
+
+def parse_work_stats(chunks, workID, fetched_at=None):
+    # Feeds the page into the parser one chunk of bytes at a time, stopping once the stats have been read
+    parser = WorkStatsParser()
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        if parser.done:
+            break
+    return parser.work_stats(workID, fetched_at or now())
+
+def recorded(chunks, record):
+    # Passes the chunks along, keeping a copy of each one in `record`
+    for chunk in chunks:
+        record.append(chunk)
+        yield chunk
+
+def fetch_work_stats(workID, session=None, cache=True, cache_directory=cm.CACHE_DIRECTORY):
+    # Returns the WorkStats of the work as it currently is on AO3.
+    #   The part of the page that was read is saved to the response cache in cache_directory, unless `cache` is False.
+    session = session or get_session()
+    url = f'{cm.AO3_URL}/works/{workID}?view_adult=true'
+    fetched_at = now()
+    page = list() # Raw chunks read by the parser, for the cache
+    with session.get(url, stream=True) as response:
+        if response.status_code == 404:
+            raise InvalidWorkIDError(f'Cannot find work {workID}')
+        response.raise_for_status()
+        if '/users/login' in response.url:
+            raise WorkUnavailableError(f'Work {workID} can only be viewed when logged in to AO3')
+        chunks = response.iter_content(chunk_size=CHUNK_SIZE)
+        work_stats = parse_work_stats(recorded(chunks, page), workID, fetched_at)
+        # Closing a response partway through also closes its connection. If there's only a little left,
+        #   it's cheaper to read the rest and keep the connection for the next fic.
+        remaining = int(response.headers.get('Content-Length', 0)) - response.raw.tell()
+        if 0 < remaining <= DRAIN_LIMIT:
+            for _ in chunks:
+                pass
+    if cache:
+        response_cache.save_page(workID, fetched_at, b''.join(page), cache_directory)
+    return work_stats
+
+def read_cached_work_stats(filepath):
+    # Returns the WorkStats parsed from a page in the response cache
+    workID, fetched_at = response_cache.split_page_filename(os.path.basename(filepath))
+    return parse_work_stats([response_cache.read_page(filepath)], workID, fetched_at)
+
+def recent_cached_work_stats(workID, maxMinutes=cm.VALIDATION_REUSE_MINUTES, cache_directory=cm.CACHE_DIRECTORY):
+    # Returns the WorkStats from the newest cached page of the work if it was fetched within the
+    #   last maxMinutes (ex: when its work ID was validated), or None if there isn't one
+    pages = response_cache.cached_pages(workID, cache_directory)
+    if len(pages) == 0:
+        return None
+    fetched_at, filepath = pages[-1]
+    if datetime.datetime.now() - fetched_at > datetime.timedelta(minutes=maxMinutes):
+        return None
+    try:
+        return read_cached_work_stats(filepath)
+    except Exception:
+        return None # A page that can't be parsed is just fetched again
+
+def parse_cached_pages(workID, cache_directory=cm.CACHE_DIRECTORY):
+    # Returns the WorkStats of every page of the work in the response cache, oldest first.
+    #   Pages that can't be parsed are skipped.
+    cachedStats = list()
+    for _, filepath in response_cache.cached_pages(workID, cache_directory):
+        try:
+            cachedStats.append(read_cached_work_stats(filepath))
+        except Exception as e:
+            print(f'Could not parse the cached page {filepath}')
+            print(e)
+    return cachedStats
+
+## Listing pages -------------------
+"""
+A listing page (a user's works, a series, or a bookmark list) shows the stats of up to 20 works at once,
+so one request can update 20 fics. Listings don't show when a work was published though, so the
+WorkStats from a listing have date_published set to None.
+"""
+
+class ListingStatsParser(HTMLParser):
+    # Reads the stats of every work blurb (<li class="... blurb ...">) on a listing page
+    def __init__(self, fetched_at):
+        super().__init__(convert_charrefs=True)
+        self.fetched_at = fetched_at
+        self.works = dict()
+        self.has_next_page = False
+        self._blurb_depth = 0 # How many <li> deep into the current blurb the parser is. 0 is outside of a blurb
+        self._workID = None
+        self._stats = dict()
+        self._title = None
+        self._in_heading = False
+        self._in_title = False
+        self._in_stats = False
+        self._current_dd = None
+        self._in_pagination = False
+        self._text = list()
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        if tag == 'li' and self._blurb_depth > 0:
+            self._blurb_depth += 1
+        elif tag == 'li' and 'blurb' in classes:
+            self._blurb_depth = 1
+            self._workID = None
+            self._stats = dict()
+            self._title = None
+            if (attrs.get('id') or '').startswith('work_'):
+                self._workID = int(attrs['id'][len('work_'):])
+        elif self._blurb_depth > 0:
+            if tag == 'h4' and 'heading' in classes:
+                self._in_heading = True
+            elif tag == 'a' and self._in_heading and self._title is None:
+                # The first link in the heading is the work itself. Bookmark blurbs only have the work ID here
+                href = attrs.get('href') or ''
+                if href.startswith('/works/') and self._workID is None:
+                    self._workID = int(href.split('/')[2])
+                self._in_title = True
+                self._text = list()
+            elif tag == 'dl' and 'stats' in classes:
+                self._in_stats = True
+            elif tag == 'dd' and self._in_stats and len(classes) > 0:
+                self._current_dd = classes[0]
+                self._text = list()
+        elif tag == 'ol' and 'pagination' in classes:
+            self._in_pagination = True
+        elif tag == 'a' and self._in_pagination and attrs.get('rel') == 'next':
+            self.has_next_page = True
+
+    def handle_endtag(self, tag):
+        if self._blurb_depth > 0:
+            if tag == 'a' and self._in_title:
+                self._title = ' '.join(''.join(self._text).split())
+                self._in_title = False
+            elif tag == 'h4':
+                self._in_heading = False
+            elif tag == 'dd' and self._current_dd is not None:
+                self._stats[self._current_dd] = ''.join(self._text).strip()
+                self._current_dd = None
+            elif tag == 'dl':
+                self._in_stats = False
+            elif tag == 'li':
+                self._blurb_depth -= 1
+                if self._blurb_depth == 0:
+                    self._add_work()
+        elif tag == 'ol':
+            self._in_pagination = False
+
+    def handle_data(self, data):
+        if self._current_dd is not None or self._in_title:
+            self._text.append(data)
+
+    def _add_work(self):
+        if self._workID is None or 'hits' not in self._stats:
+            return None # Not a work (ex: a bookmarked series) or the stats are hidden
+        self.works[self._workID] = WorkStats(workID=self._workID,
+                                             title=self._title or '',
+                                             date_published=None,
+                                             nchapters=to_int(self._stats.get('chapters', '0').split('/')[0]),
+                                             words=to_int(self._stats.get('words', '0')),
+                                             hits=to_int(self._stats.get('hits', '0')),
+                                             kudos=to_int(self._stats.get('kudos', '0')),
+                                             comments=to_int(self._stats.get('comments', '0')),
+                                             fetched_at=self.fetched_at)
+        return None
+
+def parse_listing_stats(html, fetched_at=None):
+    # Returns ({workID: WorkStats}, whether there is another page after this one)
+    parser = ListingStatsParser(fetched_at or now())
+    parser.feed(html)
+    parser.close()
+    return parser.works, parser.has_next_page
+
+def listing_page_url(source, page):
+    # source can be the full URL of the listing or just its path, ex: users/Fixationally_Consumed/works
+    path = source.split('archiveofourown.org')[-1].strip().strip('/')
+    return f"{cm.AO3_URL}/{path}{'&' if '?' in path else '?'}page={page}"
+
+def fetch_listing_stats(source, workIDs, session=None, max_pages=None):
+    # Returns ({workID: WorkStats}, {workID: the page it's on}, whether the listing ran out) for the works in `workIDs`
+    #   that are in the listing. Pages are read in order and stop once every work in `workIDs` has been found,
+    #   the listing runs out, or max_pages pages have been read.
+    session = session or get_session()
+    workIDs = set(workIDs)
+    found = dict()
+    pages = dict()
+    page = 1
+    ran_out = False
+    while len(workIDs - found.keys()) > 0 and (max_pages is None or page <= max_pages):
+        response = session.get(listing_page_url(source, page))
+        response.raise_for_status()
+        works, has_next_page = parse_listing_stats(response.text)
+        for workID in works.keys() & workIDs:
+            found[workID] = works[workID]
+            pages[workID] = page
+        if not has_next_page:
+            ran_out = True
+            break
+        page += 1
+    return found, pages, ran_out
+
+def harvest_listing_stats(sources, workIDs, session=None, coverage=None):
+    # Returns the WorkStats of every work in `workIDs` that could be found in one of the listings.
+    #   coverage: {workID: (the listing it was found in last time, the page it was on), or '' if it wasn't in any},
+    #   updated here. A work is only looked for in the listing it was found in last time, reading up to one page
+    #   past the one it was on (in case newer works pushed it down), and a work that wasn't in any is not looked for at all,
+    #   so a long listing isn't read to the end on every update for works that aren't in it.
+    #   Works that aren't in coverage yet are looked for in every listing, reading at most one page per work, since
+    #   reading more would take more requests than fetching those works one at a time.
+    #   A work is only taken out of a listing, or marked as in none of them, once a listing was read to the end without it.
+    #   A listing that fails is skipped, since its works just fall back to being fetched one at a time.
+    coverage = coverage if coverage is not None else dict()
+    sources = list(sources)
+    workIDs = set(workIDs)
+    # Works never found in a listing, or found in one that's no longer in the list, are looked for in all of them
+    unknown = {workID for workID in workIDs if coverage.get(workID) != '' and
+               (workID not in coverage or coverage[workID][0] not in sources)}
+    found = dict()
+    searched_all = True
+    for source in sources:
+        remaining = workIDs - found.keys()
+        known = {workID: coverage[workID][1] for workID in remaining - unknown
+                 if coverage.get(workID, '') != '' and coverage[workID][0] == source}
+        searching = remaining & unknown
+        if len(known) == 0 and len(searching) == 0:
+            continue
+        max_pages = max([page + 1 for page in known.values()] + [len(searching)])
+        try:
+            listed, pages, ran_out = fetch_listing_stats(source, known.keys() | searching, session=session, max_pages=max_pages)
+        except (NoConnectionError, AO3UnavailableError):
+            raise # The per-work fetches would fail too
+        except Exception as e:
+            print(f'Could not read the listing {source}')
+            print(e)
+            searched_all = False
+            continue
+        found.update(listed)
+        coverage.update({workID: (source, pages[workID]) for workID in listed})
+        for workID in known.keys() - listed.keys():
+            if ran_out:
+                del coverage[workID] # Not in its listing anymore, so it's looked for in all of them next time
+            else:
+                coverage[workID] = (source, max_pages) # Further down than was read, so the next update reads one more page
+        if len(searching - listed.keys()) > 0 and not ran_out:
+            searched_all = False # They may be further down
+    if searched_all:
+        coverage.update({workID: '' for workID in unknown - found.keys()})
+    return found
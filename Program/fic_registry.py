@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# fic_registry.py: The list of tracked fics, kept in memory and indexed by work ID.
+#   The fic save file is only re-read when it was changed on disk (ex: by another program), so looking up
+#   the list is cheap no matter how many fics are tracked. Adding a fic appends its line to the file.
+#   Removing or changing fics re-writes the file once, through a temporary file, for all of the changes at once.
+# Author: Fixationally_Consumed
+import os
+# User Defined modules
+import common as cm
+
+class FicRegistry:
+    def __init__(self, filepath=cm.FIC_SAVE_FILEPATH):
+        cm.ensure_fic_save_file_exists(filepath)
+        self.filepath = filepath
+        self._fics = dict() # workID: fic, in the order of the file
+        self._ficNames = set()
+        self._file_version = None # (modified time, size) of the file when it was last read or written
+        self.reload()
+
+    ## Reading -------------------
+    def _current_file_version(self):
+        stat = os.stat(self.filepath)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload(self, force=False):
+        # Re-reads the file if it changed since it was last read or written. Returns True if it was re-read.
+        file_version = self._current_file_version()
+        if not force and file_version == self._file_version:
+            return False
+        fics = cm.read_in(self.filepath)
+        self._fics = {fic['workID']: fic for fic in fics}
+        self._ficNames = {fic['ficName'] for fic in fics}
+        self._file_version = file_version
+        return True
+
+    def fics(self):
+        # Returns a list of every tracked fic, in the order of the file
+        self.reload()
+        return list(self._fics.values())
+
+    def get(self, workID):
+        # Returns the fic with the work ID, or None if it isn't tracked
+        self.reload()
+        return self._fics.get(str(workID))
+
+    def has_ficName(self, ficName):
+        self.reload()
+        return ficName in self._ficNames
+
+    def __contains__(self, workID):
+        self.reload()
+        return str(workID) in self._fics
+
+    def __len__(self):
+        self.reload()
+        return len(self._fics)
+
+    ## Writing -------------------
+    def add(self, fic):
+        # Starts tracking the fic. Its line is appended to the file, rather than re-writing the whole file.
+        self.add_many([fic])
+        return None
+
+    def add_many(self, fics):
+        # Starts tracking every fic in fics, with one append to the file for all of them
+        self.reload()
+        workIDs = [fic['workID'] for fic in fics]
+        for workID in workIDs:
+            if workID in self._fics or workIDs.count(workID) > 1:
+                raise ValueError(f"Work ID {workID} is already being tracked")
+        with open(self.filepath, 'a+') as fh:
+            # Make sure the new lines don't get joined onto the last one, if the file was edited by hand.
+            #   The last byte is read in binary, since going back one byte in a text file can land in the middle of a character.
+            if fh.tell() > 0:
+                with open(self.filepath, 'rb') as binary_fh:
+                    binary_fh.seek(-1, os.SEEK_END)
+                    if binary_fh.read(1) != b'\n':
+                        fh.write('\n')
+            fh.write(''.join(cm.make_fic_line(fic) for fic in fics))
+        for fic in fics:
+            self._fics[fic['workID']] = fic
+            self._ficNames.add(fic['ficName'])
+        self._file_version = self._current_file_version()
+        return None
+
+    def remove(self, workIDs):
+        # Stops tracking every fic in workIDs, with one re-write of the file
+        self.reload()
+        for workID in workIDs:
+            fic = self._fics.pop(str(workID), None)
+            if fic is not None:
+                self._ficNames.discard(fic['ficName'])
+        self.save()
+        return None
+
+    def change(self, workID, new_fic):
+        # Replaces the fic with the work ID with new_fic (which can have a new work ID), keeping its place in the list
+        self.reload()
+        old_fic = self._fics[str(workID)]
+        self._fics = {(new_fic['workID'] if ID == str(workID) else ID): (new_fic if ID == str(workID) else fic)
+                      for ID, fic in self._fics.items()}
+        self._ficNames.discard(old_fic['ficName'])
+        self._ficNames.add(new_fic['ficName'])
+        self.save()
+        return None
+
+    def save(self):
+        # Re-writes the whole file from the fics in memory
+        cm.write_out(list(self._fics.values()), self.filepath)
+        self._file_version = self._current_file_version()
+        return None
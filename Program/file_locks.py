@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# file_locks.py: Advisory locks, so more than one program (ex: a cron update and an update from the user interface)
+#   can run at the same time without writing over each other's work.
+#   Each fic has its own lock, in the Locks folder next to Data, so different fics can still be updated at once.
+#   The locks are released by the operating system if a program crashes, so a lock is never left stuck.
+# Author: Fixationally_Consumed
+import os
+import fcntl
+from contextlib import contextmanager
+# User Defined modules
+import common as cm
+
+def make_fic_lock_filepath(workID, lock_directory=cm.LOCK_DIRECTORY):
+    return os.path.join(lock_directory, f'{workID}.lock')
+
+@contextmanager
+def file_lock(lock_filepath, blocking=True):
+    # Holds an exclusive lock on the lock file while in the with block, waiting for it if another program has it.
+    #   If blocking is False, it raises BlockingIOError right away instead of waiting.
+    lock_directory = os.path.dirname(lock_filepath)
+    if lock_directory != '' and not os.path.exists(lock_directory):
+        os.makedirs(lock_directory, exist_ok=True)
+    with open(lock_filepath, 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+def fic_lock(workID, lock_directory=cm.LOCK_DIRECTORY):
+    # Lock held while a fic's data, arrays and graph are being updated
+    return file_lock(make_fic_lock_filepath(workID, lock_directory))
@@ -1,15 +1,24 @@
 #!/usr/bin/env python3
 import common as cm
 import os
-import pickle
-import datetime
-import matplotlib.pyplot as plt
-import AO3
-import warnings
+import hashlib
+import contextlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from fetch_AO3_stats import fetch_work_stats
+import history_arrays
+import analyze_history
+from file_locks import fic_lock
 
-def generate_graph(workID, ficName, graphDirectory, workHistoryDirectory):
+RENDER_VERSION = 2 # Bump when changing the plotting code, so every graph is redrawn
+
+def generate_graph(workID, ficName, graphDirectory, store, work=None, historyArraysDirectory=cm.HISTORY_ARRAYS_DIRECTORY,
+                   profile=cm.RENDER_PROFILE, graphFormat=cm.GRAPH_FORMAT, lock_directory=cm.LOCK_DIRECTORY):
     """
-    update_AO3_stats_on - Used for collecting information from AO3, saving that data, and the outputting a graph of that data 
+    generate_graph - Updates one fic's data with its stats on AO3, and redraws its graph if anything on it changed.
+    Everything is done in this process. update_AO3_fics.py does the same for every fic, drawing the graphs
+    in other processes (see RenderPool).
 
     Author: Fixationally_Consumed
 
@@ -18,95 +27,260 @@ def generate_graph(workID, ficName, graphDirectory, workHistoryDirectory):
                 If the URL for the fic is https://archiveofourown.org/works/32751484/chapters/81257581
                 then the work ID is 32751484.
 
-    plotTitle (str): Title on the graph, not the filename. I have an engineering background and was shamed (not really) if I didn't put titles on my graphs. It's a habit.
-    figureFileName (str): The name of the graph's file. I recommend using the name of your fic. The extension is not required.
-    figureDirectory (str): Save location of the graph. EX: Users/Fix/Desktop
+    ficName (str): Name of the fic. The graph's title and file name are made from it.
+    graphDirectory (str): Save location of the graph. EX: Users/Fix/Desktop
+
+    store (WorkHistoryStore): Where the data of every fic is saved. This is updated automatically by the code.
 
-    workHistoryDirectory (str): Save location of the data file. This is updated automatically by the code.
-    workHistoryFileName (str): The name for the specific save file. I recommend using the name of your fic.
+    work (WorkStats, optional): The already fetched stats of the AO3 work. If not given, they are fetched from AO3.
+    historyArraysDirectory (str, optional): Where the memory-mappable copy of the fic's data is saved (see history_arrays.py).
+    profile (str, optional): Name of the size to draw the graph at, one of cm.RENDER_PROFILES.
+    graphFormat (str, optional): File type of the graph, one of cm.GRAPH_FORMATS.
+    lock_directory (str, optional): Where the fic's lock file is kept (see file_locks.py).
 
     -------------- Outputs
-    Save file: This is the "workHistory" file where all the data is saved. It is a pickle file.
+    Save file: A new sample of the work's stats is added to the store, and committed.
     Graph: Visual depiction of the save file. It's a graph with three subplots, unless altered by the user.
+           It's only redrawn when something on it changed since it was last drawn (see render_fingerprint).
+    """
+    dataFingerprint = update_history(workID, store, work, historyArraysDirectory, lock_directory)
+    # The fic is locked while its graph is drawn, so another program updating the same fic
+    #   at the same time (ex: cron and the user interface) waits its turn instead of writing over this one.
+    with fic_lock(workID, lock_directory):
+        render_if_changed(store, workID, dataFingerprint, make_plot_title(ficName), make_graph_filepath(ficName, graphDirectory, graphFormat, profile),
+                          profile, historyArraysDirectory)
+    return None
+
+def make_plot_title(ficName):
+    return f'"{ficName}" Data'
+
+def make_graph_filepath(ficName, graphDirectory, graphFormat=cm.GRAPH_FORMAT, profile=cm.RENDER_PROFILE):
+    return os.path.join(graphDirectory, cm.make_graph_filename(ficName, graphFormat, profile))
+
+def update_history(workID, store, work=None, historyArraysDirectory=cm.HISTORY_ARRAYS_DIRECTORY, lock_directory=cm.LOCK_DIRECTORY,
+                   cache_directory=cm.CACHE_DIRECTORY):
+    # Adds the work's stats (a WorkStats, fetched from AO3 if not given) to the store. Returns the fingerprint
+    #   of the fic's data (see data_fingerprint).
+    #   The fic's history arrays are only rebuilt and saved when something drawn on its graph changed. A sample that's
+    #   the same as the one before it (ex: a fic nobody has read in a while) only goes in the store, and the saved
+    #   arrays are brought up to date when something reads them (see history_arrays.load_current).
+    if work is None:
+        work = fetch_work_stats(workID, cache_directory=cache_directory)  # Stats of the AO3 work in its current state.
+    elif work.date_published is None and store.date_published(workID) is None:
+        # The stats came from a listing page, which doesn't show when the work was published,
+        #   and the publish date hasn't been saved yet. Fetch the work itself to get it.
+        work = fetch_work_stats(workID, cache_directory=cache_directory)
+
+    with fic_lock(workID, lock_directory):
+        lastSample = store.last_sample(workID)
+        date_published = store.date_published(workID)
+        store.add_sample(work)
+        deleted = store.compact(workID)
+        dataFingerprint = store.data_fingerprint(workID)
+        if (dataFingerprint is None or deleted > 0 or date_published != store.date_published(workID)
+                or is_new_data(lastSample, work)):
+            dataFingerprint = save_history(store, workID, historyArraysDirectory)
+        store.commit() # Right away, so other programs aren't kept waiting to write to the store
+    return dataFingerprint
+
+def is_new_data(lastSample, work):
+    # Returns True if the work's stats aren't just the last sample (from store.last_sample) again, a little later
+    if lastSample is None or lastSample[0] >= int(work.fetched_at.timestamp()):
+        return True # No sample yet, or the new one replaced or went before it
+    return tuple(lastSample[1:]) != (work.nchapters, work.words, work.hits, work.kudos, work.comments)
+
+def save_history(store, workID, historyArraysDirectory=cm.HISTORY_ARRAYS_DIRECTORY):
+    # Rebuilds and saves the fic's history arrays from the store, and stores the fingerprint of its data.
+    #   Returns the fingerprint. Not committed until store.commit() is called.
+    history = history_arrays.from_store(store, workID)
+    history.save(historyArraysDirectory)
+    dataFingerprint = data_fingerprint(history)
+    store.set_data_fingerprint(workID, dataFingerprint)
+    return dataFingerprint
+
+def replay_graph(workID, ficName, graphDirectory, store, cachedStats, historyArraysDirectory=cm.HISTORY_ARRAYS_DIRECTORY,
+                 profile=cm.RENDER_PROFILE, graphFormat=cm.GRAPH_FORMAT):
+    # Same as generate_graph, but instead of fetching the work, the stats re-parsed from the response cache
+    #   are added to the fic's data. A re-parsed sample replaces the sample that was saved when it was fetched.
+    #   Nothing is fetched from AO3.
+    with fic_lock(workID):
+        for work in cachedStats:
+            store.add_sample(work)
+        store.reset_compaction(workID) # The replayed samples may be older than what's been compacted already
+        dataFingerprint = save_history(store, workID, historyArraysDirectory)
+        store.commit()
+        render_if_changed(store, workID, dataFingerprint, make_plot_title(ficName), make_graph_filepath(ficName, graphDirectory, graphFormat, profile),
+                          profile, historyArraysDirectory)
+    return None
+
+def data_fingerprint(history):
+    # Returns a hash of the fic's data that's drawn on the graph.
+    #   Samples at the end that are the same as the one before them (ex: a fic nobody has read in a while)
+    #   are left out, so a dormant fic's graph isn't redrawn just to make its flat line a little longer.
+    stats = history.columns[1:] # Every column but the time
+    changed = np.flatnonzero(np.any(stats[:, 1:] != stats[:, :-1], axis=0))
+    nsamples = changed[-1] + 2 if len(changed) > 0 else 1 # Up to and including the last sample that changed
 
-    -------------- Running the script
-    This script should be run periodically (I do it daily) to collect data. If you don't want to do it manually, which
-    is recommended, use your computer's tools. Mac has crontab (or there's probably something better) to automatically
-    run scripts. I'm sure Linux and Windows have their own auto running programs. Whatever the case, just know that
-    downloading this script does not mean it will run on it's own.
+    fingerprint = hashlib.sha1(np.ascontiguousarray(history.columns[:, :nsamples]).tobytes())
+    fingerprint.update(history.chapter_added[:nsamples].tobytes())
+    return fingerprint.hexdigest()
+
+def render_fingerprint(dataFingerprint, plotTitle, profile=cm.RENDER_PROFILE):
+    # Returns a hash of everything drawn on the graph: the data (its data_fingerprint), the title, and the render profile
+    return hashlib.sha1(repr((dataFingerprint, plotTitle, cm.RENDER_PROFILES[profile], RENDER_VERSION)).encode()).hexdigest()
+
+def is_graph_current(store, dataFingerprint, plotTitle, figureSavePath, profile=cm.RENDER_PROFILE):
+    # Returns True if the saved graph was drawn from the same data and settings
+    return (os.path.exists(figureSavePath)
+            and store.render_fingerprint(figureSavePath) == render_fingerprint(dataFingerprint, plotTitle, profile))
+
+def render_if_changed(store, workID, dataFingerprint, plotTitle, figureSavePath, profile=cm.RENDER_PROFILE,
+                      historyArraysDirectory=cm.HISTORY_ARRAYS_DIRECTORY):
+    # Plots the graph, unless the saved graph was drawn from the same data and settings. Returns True if it was plotted.
+    #   The fic's history arrays are only read when it's plotted.
+    if is_graph_current(store, dataFingerprint, plotTitle, figureSavePath, profile):
+        return False
+    history = history_arrays.load_current(store, workID, historyArraysDirectory)
+    plot_workHistory(history, plotTitle, figureSavePath, profile)
+    store.set_render_fingerprint(figureSavePath, render_fingerprint(dataFingerprint, plotTitle, profile))
+    store.commit()
+    return True
+
+## Rendering in other processes -------------------
+def use_agg_backend():
+    # Render processes only write files, so they use the non-interactive backend
+    import matplotlib
+    matplotlib.use('Agg')
+    return None
+
+def render_saved_graph(workID, plotTitle, figureSavePath, profile=cm.RENDER_PROFILE, historyArraysDirectory=cm.HISTORY_ARRAYS_DIRECTORY,
+                       lock_directory=cm.LOCK_DIRECTORY):
+    # Plots the fic's graph from its saved history arrays, which are memory-mapped rather than sent to the process.
+    #   Returns the fingerprint of what was drawn, which is the newest data if the fic was updated again meanwhile.
+    with fic_lock(workID, lock_directory):
+        history = history_arrays.load(workID, historyArraysDirectory)
+        plot_workHistory(history, plotTitle, figureSavePath, profile)
+    return render_fingerprint(data_fingerprint(history), plotTitle, profile)
+
+class RenderPool:
     """
-    # Define Constants -------------------------------------------------------------------
-    ## AO3 Work Information
-    # workID is passed in
-    
-    ## ----- Graph/Figure info
-    plotTitle = f'"{ficName}" Data' # Title name of the plot
-    figureFileName = cm.make_graph_filename(ficName) # Name of the figure, doesn't require file extension
-    figureSavePath =  os.path.join(graphDirectory, figureFileName) # Where to save the graph
-
-    ## ----- Data file info
-    workHistoryFileName = cm.make_workHistory_filename(ficName, workID)
-    workHistorySavePath = os.path.join(workHistoryDirectory, workHistoryFileName) # Where to save the data file for the work
-
-    # Start script -----------------------------------------------------------------
-    warnings.filterwarnings(action='ignore', category=UserWarning, module='AO3') # Suppress the annoying UserWarning that some fics may be long in length
-    work = AO3.Work(workID)  # Obj. of the AO3 work in its current state.
-    publish_date = work.date_published.date()
-    todaysDate = datetime.date.today()
-    daysSincePublished = (todaysDate - publish_date).days
-
-    # Updating information ---------------------------------------------------------
-    if os.path.isfile(workHistorySavePath): # If there is already a previous data save
-        with open(workHistorySavePath, "rb") as pFile: # Loading the previously recorded data
-            workHistory = pickle.load(pFile)
-
-        if workHistory['days since published'][-1] == daysSincePublished:
-            # If the last days since published is the same as todays, don't make a new data point but rather update todays data point
-            workHistory['nchapters'][-1] = work.nchapters
-            workHistory['kudos'][-1] = work.kudos
-            workHistory['ncomments'][-1] = work.comments
-            workHistory['hits'][-1] = work.hits
-            workHistory['word count'][-1] = work.words
-            workHistory['days since published'][-1] = daysSincePublished
-            workHistory['chapter added'][-1] = workHistory['nchapters'][-1] !=  workHistory['nchapters'][-2]
-            """The above creates a bool flag (I think that's what it's called) for when a new chapter has been posted.
-                It checks for a difference between total chapter numbers and returns True if there is.
-                This is used to post chapter numbers on the graph when they occur. I used this because the program/AO3
-                only keep track of the current state of a fic, and so I had to find a way when the chapter numbers changed.
-                This might not be the 'best' way, but it works!"""
-        else:
-            # Updating the data with a new data point for the current state of the AO3 work    
-            workHistory['nchapters'].append(work.nchapters)
-            workHistory['kudos'].append(work.kudos)
-            workHistory['ncomments'].append(work.comments)
-            workHistory['hits'].append(work.hits)
-            workHistory['word count'].append(work.words)
-            workHistory['days since published'].append(daysSincePublished)
-            workHistory['chapter added'].append(workHistory['nchapters'][-1] !=  workHistory['nchapters'][-2])
-            """The above creates a bool flag (I think that's what it's called) for when a new chapter has been posted.
-                It checks for a difference between total chapter numbers and returns True if there is.
-                This is used to post chapter numbers on the graph when they occur. I used this because the program/AO3
-                only keep track of the current state of a fic, and so I had to find a way when the chapter numbers changed.
-                This might not be the 'best' way, but it works!"""
-
-        with open(workHistorySavePath, 'wb') as pFile: # Saving the updated information
-            pickle.dump(workHistory, pFile)
-    else: # If there is no previous data. This is only for new runs.
-        # Initiate workHistory with a double set of values.
-        #   This is so that the 'chapter added' value always has at least two values to compare.
-        workHistory = {
-            'nchapters': [work.nchapters, work.nchapters,],
-            'kudos': [work.kudos, work.kudos,],
-            'ncomments': [work.comments, work.comments,],
-            'hits': [work.hits, work.hits,],
-            'word count': [work.words, work.words,],
-            'days since published': [daysSincePublished, daysSincePublished,],
-            'chapter added': [True, False,]
-        }
-        with open(workHistorySavePath, 'wb') as pFile: # Saving the data
-            pickle.dump(workHistory, pFile)
-
-    # Generate plot(s) ---------------------------------------------------------
+    Draws graphs in separate processes (one per core by default), so plotting, which is slow and uses the
+    CPU, happens while the next fics are still being fetched. Only the work ID and file paths are sent to a
+    render process. It memory-maps the fic's saved history arrays itself, which are brought up to date
+    before the graph is queued.
+
+    At most 2 graphs per process can be waiting to be drawn. When that many are, submit() waits for one
+    to finish, so fetching faster than the graphs can be drawn doesn't pile up in memory.
+
+    A program that updates the fics again and again (ex: the scheduler service) keeps one RenderPool open
+    between updates, so the processes, with matplotlib already imported and their figures already made,
+    are reused. batch() waits for one update's graphs without stopping the processes.
+    """
+    def __init__(self, store, jobs=cm.RENDER_JOBS, profile=cm.RENDER_PROFILE, graphFormat=cm.GRAPH_FORMAT,
+                 historyArraysDirectory=cm.HISTORY_ARRAYS_DIRECTORY, lock_directory=cm.LOCK_DIRECTORY):
+        self.store = store
+        self.jobs = max(1, jobs)
+        self.profile = profile
+        self.graphFormat = graphFormat
+        self.historyArraysDirectory = historyArraysDirectory
+        self.lock_directory = lock_directory
+        self._executor = self._start()
+        self._pending = dict() # future: (ficName, figureSavePath)
+
+    def _start(self):
+        return ProcessPoolExecutor(max_workers=self.jobs, initializer=use_agg_backend)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def submit(self, workID, ficName, graphDirectory, dataFingerprint):
+        # Queues the fic's graph to be drawn, unless it's already current. Returns True if it was queued.
+        #   dataFingerprint: the fingerprint of the fic's data (see data_fingerprint)
+        plotTitle = make_plot_title(ficName)
+        figureSavePath = make_graph_filepath(ficName, graphDirectory, self.graphFormat, self.profile)
+        if is_graph_current(self.store, dataFingerprint, plotTitle, figureSavePath, self.profile):
+            return False
+        with fic_lock(workID, self.lock_directory):
+            history_arrays.load_current(self.store, workID, self.historyArraysDirectory)
+        while len(self._pending) >= 2 * self.jobs:
+            self._finish(wait(self._pending, return_when=FIRST_COMPLETED).done)
+        try:
+            render = self._executor.submit(render_saved_graph, workID, plotTitle, figureSavePath, self.profile, self.historyArraysDirectory,
+                                           self.lock_directory)
+        except BrokenProcessPool:
+            # A render process died (ex: it ran out of memory). The pool can't be used again, so a new one is started.
+            self._finish(list(self._pending))
+            self._executor.shutdown()
+            self._executor = self._start()
+            render = self._executor.submit(render_saved_graph, workID, plotTitle, figureSavePath, self.profile, self.historyArraysDirectory,
+                                           self.lock_directory)
+        self._pending[render] = (ficName, figureSavePath)
+        return True
+
+    def _finish(self, renders):
+        # Saves the fingerprint of each finished graph
+        for render in renders:
+            ficName, figureSavePath = self._pending.pop(render)
+            try:
+                self.store.set_render_fingerprint(figureSavePath, render.result())
+                self.store.commit()
+            except Exception as e:
+                print(f'Error drawing the graph of {ficName}')
+                print(e)
+        return None
+
+    def wait(self):
+        # Waits for every queued graph to be drawn
+        self._finish(list(self._pending))
+        return None
+
+    @contextlib.contextmanager
+    def batch(self):
+        # For a with block that queues graphs (ex: one update), and waits for them to be drawn at the end of it.
+        #   Unlike closing the pool, the processes are kept for the next batch.
+        try:
+            yield self
+        finally:
+            self.wait()
+
+    def close(self):
+        # Waits for every queued graph to be drawn, and stops the processes
+        self.wait()
+        self._executor.shutdown()
+        return None
+
+def plot_workHistory(history, plotTitle, figureSavePath, profile=cm.RENDER_PROFILE):
+    # Draws and saves the graph with this process's GraphRenderer for the profile
+    get_renderer(profile).render(history, plotTitle, figureSavePath)
+    return None
+
+_renderers = dict() # The GraphRenderer of each profile used in this process, made the first time it's used
+
+def get_renderer(profile=cm.RENDER_PROFILE):
+    if profile not in _renderers:
+        _renderers[profile] = GraphRenderer(profile)
+    return _renderers[profile]
+
+def close_renderer():
+    # Closes the figures of every GraphRenderer of this process
+    for renderer in _renderers.values():
+        renderer.close()
+    _renderers.clear()
+    return None
+
+def spread_out(indices, most):
+    # Returns at most `most` of the indices, evenly spread out and always including the last one
+    if most is None or len(indices) <= most:
+        return indices
+    if most <= 0:
+        return indices[:0]
+    return indices[np.unique(np.linspace(len(indices) - 1, 0, most).round().astype(np.int64))]
+
+class GraphRenderer:
     """
     What I want to plot: days since posted vs _____
        - hits
@@ -118,47 +292,99 @@ def generate_graph(workID, ficName, graphDirectory, workHistoryDirectory):
        - Current hit count
        - Current chapter count
        - How many total words are in the work
+
+    The figure and its three subplots are made once, and only the data, chapter numbers, side box and title
+    are swapped out for each fic. So drawing many graphs in one program uses the memory of one figure.
+    profile: Name of the size to draw at, one of cm.RENDER_PROFILES.
     """
-    ## ----- Plot data and label axes
-    fig, (ax_hits, ax_kudos, ax_ncomments) = plt.subplots(3, 1, figsize=(15,15))
+    def __init__(self, profile=cm.RENDER_PROFILE):
+        # matplotlib is imported here, the first time a graph is drawn, so a run with no graphs to draw never imports it
+        import matplotlib.pyplot as plt
+        self.profile = profile
+        self.settings = cm.RENDER_PROFILES[profile]
+        self.scale = self.settings['figsize'][0] / 15 # Text sizes were picked for a 15 inch wide graph
+        self.max_points = int(self.settings['figsize'][0] * self.settings['dpi']) # About one point per pixel across
 
-    ax_hits.plot(workHistory['days since published'], workHistory['hits'])
-    ax_hits.set_xlabel('Days since Published') ; ax_hits.set_ylabel('Hits', fontsize=25)
+        ## ----- Make the subplots and label axes
+        nsubplots = 5 if self.settings['analysis'] else 3
+        self.fig, all_axes = plt.subplots(nsubplots, 1, figsize=self.settings['figsize'])
+        self.axes = all_axes[:3] # Hits, kudos, comments
+        for ax, ylabel in zip(all_axes, ['Hits', 'Kudos', 'Comments', 'New per Day', 'Per 100 Hits']):
+            ax.set_xlabel('Days since Published', fontsize=10 * max(self.scale, .6)) ; ax.set_ylabel(ylabel, fontsize=25 * self.scale)
+            ax.tick_params(labelsize=10 * max(self.scale, .6))
+        self.lines = [ax.plot([], [])[0] for ax in self.axes]
+        self.chapter_labels = list()
 
-    ax_kudos.plot(workHistory['days since published'], workHistory['kudos'])
-    ax_kudos.set_xlabel('Days since Published') ; ax_kudos.set_ylabel('Kudos', fontsize=25)
+        ## ----- Extra subplots of analyze_history's numbers
+        self.analysis_axes = all_axes[3:]
+        self.analysis_lines = list()
+        if self.settings['analysis']:
+            ax_per_day, ax_per_hit = self.analysis_axes
+            for stat in analyze_history.STATS:
+                self.analysis_lines.append(ax_per_day.plot([], [], label=f'{stat.capitalize()} ({analyze_history.ROLLING_DAYS[0]} day average)')[0])
+            self.analysis_lines.append(ax_per_hit.plot([], [], label='Kudos')[0])
+            self.analysis_lines.append(ax_per_hit.plot([], [], label='Comments')[0])
+            for ax in self.analysis_axes:
+                ax.legend(loc='upper left', fontsize=12 * self.scale)
 
-    ax_ncomments.plot(workHistory['days since published'], workHistory['ncomments'])
-    ax_ncomments.set_xlabel('Days since Published') ; ax_ncomments.set_ylabel('Comments', fontsize=25)
+        ## ----- Side box and title, filled in for each fic
+        self.info = self.fig.text(1, .5, '', fontsize=25 * self.scale, ha='left', va='center')
+        self.title = self.fig.suptitle('', fontsize=30 * self.scale)
 
-    ## ----- Plotting chapter numbers when new chapter is posted (not plotting chapter number for every data point)
-    """
-    This checks for when a new chapter was detected, which is determined every time the program updates it's data (around line 33).
-    Then, the bool list is iterated through, and every time a new chapter was posted the current chapter number is plotted.
-    """
-    for i, newChapterBool in enumerate(workHistory['chapter added']):
-        if newChapterBool is True:
-            ax_hits.text(workHistory['days since published'][i], # x-value
-                         workHistory['hits'][i], # y-value
-                         workHistory['nchapters'][i], fontsize=14) # Text (chapter number)
-            
-            ax_kudos.text(workHistory['days since published'][i], # x-value
-                         workHistory['kudos'][i], # y-value
-                         workHistory['nchapters'][i], fontsize=14) # Text (chapter number)
-            
-            ax_ncomments.text(workHistory['days since published'][i], # x-value
-                              workHistory['ncomments'][i], # y-value
-                              workHistory['nchapters'][i], fontsize=14) # Text (chapter number)
-
-    ## ----- Creating text box off to the side that displays extra info
-    info = 'Hits:         {}\n'.format(workHistory['hits'][-1])  \
-         + 'Chapters:  {}\n'.format(workHistory['nchapters'][-1])  \
-         + 'Words:       {}\n'.format(workHistory['word count'][-1])
-    fig.text(1, .5, info, fontsize=25, ha='left', va='center')
-
-    ## ----- Title plot
-    fig.suptitle(plotTitle, fontsize=30)
-    plt.tight_layout()
-    #plt.show() # Use to show plot while editing. Comment out plt.savefig() if you don't want to write the file yet while editing.
-    plt.savefig(figureSavePath, dpi=300, bbox_inches = "tight")
-    return None
+    def render(self, history, plotTitle, figureSavePath):
+        ## ----- Plot data
+        days = history.days
+        for ax, line, values in zip(self.axes, self.lines, [history.hits, history.kudos, history.comments]):
+            shown = history_arrays.lttb_indices(days, values, self.max_points) # Every point, if there are fewer than max_points
+            line.set_data(days[shown], values[shown])
+            ax.relim()
+            ax.autoscale_view()
+
+        if self.settings['analysis']:
+            self.plot_analysis(analyze_history.analyze(history))
+
+        ## ----- Plotting chapter numbers when new chapter is posted (not plotting chapter number for every data point)
+        """
+        This checks for when a new chapter was detected, which is determined every time the program updates it's data.
+        Then, every day a new chapter was posted, the current chapter number is plotted.
+        """
+        for label in self.chapter_labels: # The last fic's
+            label.remove()
+        self.chapter_labels = list()
+        for i in spread_out(np.flatnonzero(history.chapter_added), self.settings['max_chapter_labels']):
+            for ax, values in zip(self.axes, [history.hits, history.kudos, history.comments]):
+                self.chapter_labels.append(ax.text(days[i], # x-value
+                                                   values[i], # y-value
+                                                   history.nchapters[i], fontsize=14 * self.scale)) # Text (chapter number)
+
+        ## ----- Text box off to the side that displays extra info
+        info = 'Hits:         {}\n'.format(history.hits[-1])  \
+             + 'Chapters:  {}\n'.format(history.nchapters[-1])  \
+             + 'Words:       {}\n'.format(history.words[-1])
+        self.info.set_text(info)
+
+        ## ----- Title plot
+        self.title.set_text(plotTitle)
+        self.fig.tight_layout()
+        # Saved so the graph is never seen half written
+        graphFormat = os.path.splitext(figureSavePath)[1][1:] # The file type is picked from the extension
+        with cm.atomic_write(figureSavePath, 'wb') as fh:
+            self.fig.savefig(fh, dpi=self.settings['dpi'], bbox_inches = "tight", format=graphFormat)
+        return None
+
+    def plot_analysis(self, metrics):
+        # Puts the fic's HistoryMetrics on the extra subplots
+        ndays = analyze_history.ROLLING_DAYS[0]
+        series = [metrics.rolling[stat][ndays] for stat in analyze_history.STATS] \
+               + [metrics.kudos_per_hit * 100, metrics.comments_per_hit * 100]
+        for line, values in zip(self.analysis_lines, series):
+            line.set_data(metrics.days, values) # nan days are left as gaps
+        for ax in self.analysis_axes:
+            ax.relim()
+            ax.autoscale_view()
+        return None
+
+    def close(self):
+        import matplotlib.pyplot as plt
+        plt.close(self.fig)
+        return None
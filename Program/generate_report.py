@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# generate_report.py: Makes one HTML page with every tracked fic on it: its current totals, and a small line
+#   (sparkline) of its hits, kudos and comments over time. It's a quick look at every fic at once, instead of
+#   opening each fic's graph.
+#   The sparklines are written straight into the page as SVG, so nothing is plotted and there's only one small file.
+#   Each fic's data is read once, memory-mapped from its history arrays (see history_arrays.py).
+# Author: Fixationally_Consumed
+import html
+import argparse
+import datetime
+# User Defined modules
+import common as cm
+import history_arrays
+from fic_registry import FicRegistry
+from work_history_store import WorkHistoryStore
+
+SPARKLINE_WIDTH = 160
+SPARKLINE_HEIGHT = 32
+SPARKLINE_POINTS = 64 # Points each sparkline is downsampled to. More than this isn't visible at its size
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>AO3 Stats</title>
+<style>
+body {{ font-family: -apple-system, Helvetica, Arial, sans-serif; margin: 2em; color: #222; }}
+table {{ border-collapse: collapse; }}
+th, td {{ padding: 4px 10px; text-align: right; border-bottom: 1px solid #ddd; }}
+th {{ background: #f4f4f4; }}
+td.name, th.name {{ text-align: left; }}
+td.spark {{ padding: 2px 6px; }}
+polyline {{ fill: none; stroke: #1f77b4; stroke-width: 1.5; }}
+</style>
+</head>
+<body>
+<h1>AO3 Stats</h1>
+<p>{nfics} fics, made {made_at}</p>
+<table>
+<tr><th class="name">Fic</th><th>Hits</th><th></th><th>Kudos</th><th></th><th>Comments</th><th></th><th>Chapters</th><th>Words</th><th>Last Updated</th></tr>
+{rows}
+</table>
+</body>
+</html>
+"""
+
+def sparkline(x, y):
+    # Returns an inline SVG of the line (x, y), downsampled to SPARKLINE_POINTS points
+    if len(x) < 2:
+        return ''
+    shown = history_arrays.lttb_indices(x, y, SPARKLINE_POINTS)
+    x = x[shown].astype(float)
+    y = y[shown].astype(float)
+    x_span = (x[-1] - x[0]) or 1
+    y_span = (y.max() - y.min()) or 1
+    px = (x - x[0]) / x_span * (SPARKLINE_WIDTH - 2) + 1
+    py = SPARKLINE_HEIGHT - 1 - (y - y.min()) / y_span * (SPARKLINE_HEIGHT - 2) # SVG's y goes down
+    points = ' '.join(f'{a:.1f},{b:.1f}' for a, b in zip(px, py))
+    return (f'<svg width="{SPARKLINE_WIDTH}" height="{SPARKLINE_HEIGHT}" viewBox="0 0 {SPARKLINE_WIDTH} {SPARKLINE_HEIGHT}">'
+            f'<polyline points="{points}"/></svg>')
+
+def report_row(fic, history, last_updated):
+    # Returns the table row of the fic
+    name = f'<td class="name">{html.escape(fic["ficName"])}</td>'
+    if history is None or len(history) == 0:
+        return f'<tr>{name}<td colspan="9">No data yet</td></tr>'
+    cells = list()
+    for values in [history.hits, history.kudos, history.comments]:
+        cells.append(f'<td>{values[-1]:,}</td>')
+        cells.append(f'<td class="spark">{sparkline(history.seconds, values)}</td>')
+    cells.append(f'<td>{history.nchapters[-1]:,}</td>')
+    cells.append(f'<td>{history.words[-1]:,}</td>')
+    cells.append(f'<td>{last_updated.strftime("%Y-%m-%d %H:%M") if last_updated is not None else ""}</td>')
+    return f'<tr>{name}{"".join(cells)}</tr>'
+
+def generate_report(fic_save_filepath=cm.FIC_SAVE_FILEPATH, report_filepath=cm.REPORT_FILEPATH,
+                    historyArraysDirectory=cm.HISTORY_ARRAYS_DIRECTORY):
+    # Writes the report of every tracked fic to report_filepath, and returns report_filepath
+    fics = FicRegistry(fic_save_filepath).fics()
+    store = WorkHistoryStore(cm.HISTORY_STORE_FILEPATH)
+    rows = list()
+    for fic in fics:
+        history = history_arrays.load_current(store, fic['workID'], historyArraysDirectory)
+        rows.append(report_row(fic, history, store.last_sample_time(fic['workID'])))
+    store.close()
+
+    page = PAGE.format(nfics=len(fics), made_at=datetime.datetime.now().strftime('%Y-%m-%d %H:%M'), rows='\n'.join(rows))
+    with cm.atomic_write(report_filepath, encoding='utf-8') as fh:
+        fh.write(page)
+    return report_filepath
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Makes one HTML page with the stats of every fic being tracked.')
+    parser.add_argument('--output', default=cm.REPORT_FILEPATH,
+                        help=f'Where to save the report (default: {cm.REPORT_FILEPATH})')
+    args = parser.parse_args()
+    print('Report saved to: ', generate_report(report_filepath=args.output))
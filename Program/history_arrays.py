@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# history_arrays.py: A fic's data as fixed-type NumPy arrays, saved in a layout that can be memory-mapped.
+#   The store (work_history_store.py) is where the data is kept. This is a copy of it that's quick to read:
+#   loading it for plotting or analysis is a memory-map of the file, with no copying, unpickling, or SQL.
+#   It's only rewritten when the fic's graph changes, so load_current() is what brings it up to date with the store.
+# Author: Fixationally_Consumed
+import os
+import numpy as np
+# User Defined modules
+import common as cm
+
+""" Files, in cm.HISTORY_ARRAYS_DIRECTORY
+{workID}.npy:          int32, shape (6, number of samples). Each row is one column of data, stored one after the other:
+                       seconds since published, chapters, words, hits, kudos, comments
+{workID}_chapters.npy: uint8, the 'chapter added' flag of each sample packed 8 to a byte (np.packbits)
+"""
+
+COLUMNS = ['seconds', 'nchapters', 'words', 'hits', 'kudos', 'comments']
+
+class HistoryArrays:
+    def __init__(self, workID, columns, chapters_packed):
+        # columns: int32 array of shape (6, n), rows in the order of COLUMNS
+        # chapters_packed: np.packbits of the n 'chapter added' flags
+        self.workID = int(workID)
+        self.columns = columns
+        self.chapters_packed = chapters_packed
+        for index, name in enumerate(COLUMNS):
+            setattr(self, name, columns[index]) # Views into columns, not copies
+
+    def __len__(self):
+        return self.columns.shape[1]
+
+    @property
+    def days(self):
+        # Days since published of each sample, with the time of day as a fraction
+        return self.seconds / 86400
+
+    @property
+    def chapter_added(self):
+        # True on each sample a new chapter was first seen (and on the first one, so the starting chapter gets labeled)
+        return np.unpackbits(self.chapters_packed, count=len(self)).astype(bool)
+
+    def save(self, directory=cm.HISTORY_ARRAYS_DIRECTORY):
+        # Each file is written with cm.atomic_write, so a reader never sees half a file
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        for filepath, array in [(columns_filepath(self.workID, directory), self.columns),
+                                (chapters_filepath(self.workID, directory), self.chapters_packed)]:
+            with cm.atomic_write(filepath, 'wb') as fh:
+                np.save(fh, np.ascontiguousarray(array))
+        return None
+
+def columns_filepath(workID, directory=cm.HISTORY_ARRAYS_DIRECTORY):
+    return os.path.join(directory, f'{workID}.npy')
+
+def chapters_filepath(workID, directory=cm.HISTORY_ARRAYS_DIRECTORY):
+    return os.path.join(directory, f'{workID}_chapters.npy')
+
+def from_samples(workID, rows):
+    # Returns the HistoryArrays of rows of (seconds since published, chapters, words, hits, kudos, comments)
+    columns = np.array(rows, dtype=np.int32).reshape(-1, len(COLUMNS)).T.copy() # .copy() makes each column contiguous
+    nchapters = columns[COLUMNS.index('nchapters')]
+    chapter_added = np.ones(len(nchapters), dtype=bool)
+    chapter_added[1:] = nchapters[1:] != nchapters[:-1]
+    return HistoryArrays(workID, columns, np.packbits(chapter_added))
+
+def from_store(store, workID):
+    # Returns the HistoryArrays of the work's data in the store, or None if it doesn't have any
+    rows = store.history_samples(workID)
+    if len(rows) == 0:
+        return None
+    return from_samples(workID, rows)
+
+def load(workID, directory=cm.HISTORY_ARRAYS_DIRECTORY):
+    # Returns the saved HistoryArrays of the work, memory-mapped from its files, or None if they haven't been saved
+    if not os.path.exists(columns_filepath(workID, directory)):
+        return None
+    columns = np.load(columns_filepath(workID, directory), mmap_mode='r')
+    chapters_packed = np.load(chapters_filepath(workID, directory), mmap_mode='r')
+    return HistoryArrays(workID, columns, chapters_packed)
+
+def is_current(history, store):
+    # Returns True if the HistoryArrays has every sample of the work that's in the store
+    count, newest = store.history_version(history.workID)
+    date_published = store.date_published(history.workID)
+    return (count == len(history) and count > 0 and date_published is not None
+            and newest - int(date_published.timestamp()) == int(history.seconds[-1]))
+
+def load_current(store, workID, directory=cm.HISTORY_ARRAYS_DIRECTORY):
+    # Returns the saved HistoryArrays of the work, first rebuilding and saving them from the store if they're missing
+    #   or behind it (they're only saved when the fic's graph changes, see generate_graph.update_history).
+    #   Returns None if the store has no data of the work.
+    history = load(workID, directory)
+    if history is not None and is_current(history, store):
+        return history
+    history = from_store(store, workID)
+    if history is not None:
+        history.save(directory)
+    return history
+
+def lttb_indices(x, y, nout):
+    """
+    Returns the indices of nout points of the line (x, y) that keep its shape, picked with the
+    Largest-Triangle-Three-Buckets method: the first and last points are kept, the rest of the points are
+    split into nout - 2 buckets, and from each bucket the point that makes the largest triangle with the
+    point picked before it and the average of the next bucket is kept.
+    Peaks and jumps (ex: a new chapter) make large triangles, so they're kept, while flat stretches are thinned out.
+    """
+    n = len(x)
+    if nout >= n or nout < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, nout - 1).astype(np.int64) # Bucket b is edges[b]:edges[b + 1]
+    # The average of every bucket, all at once. The "bucket" after the last one is the last point.
+    sizes = np.diff(edges)
+    average_x = np.append(np.add.reduceat(x[:-1], edges[:-1]) / sizes, x[-1])
+    average_y = np.append(np.add.reduceat(y[:-1], edges[:-1]) / sizes, y[-1])
+    # The loop runs once per bucket, so it's kept to plain Python numbers and as few NumPy calls as possible
+    edges, average_x, average_y = edges.tolist(), average_x.tolist(), average_y.tolist()
+    indices = [0] * nout
+    indices[-1] = n - 1
+    a = 0 # The point picked from the bucket before
+    for b in range(nout - 2):
+        start, end = edges[b], edges[b + 1]
+        ax, ay = x[a], y[a]
+        areas = (ax - average_x[b + 1]) * (y[start:end] - ay) - (ax - x[start:end]) * (average_y[b + 1] - ay)
+        a = start + int(np.abs(areas).argmax())
+        indices[b + 1] = a
+    indices = np.array(indices, dtype=np.int64)
+    return indices
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# import_benchmark.py: Measures how long it takes to import the programs that start up the most:
+#   the user interface (every time it's opened) and update_AO3_fics.py (every time cron runs it).
+#   Each one is imported in a fresh Python with -X importtime, which reports the time spent on every module.
+#   The slowest modules are listed, so a slow import that sneaks back in is easy to find.
+#   Exits with an error if a program goes over its budget.
+# Author: Fixationally_Consumed
+import os
+import sys
+import argparse
+import subprocess
+
+# Module: most milliseconds its import should take
+BUDGETS_MS = {'user_interface': 200,
+              'update_AO3_fics': 1000,
+              'ao3_stats': 200}
+# Modules the program shouldn't import at all just to start up
+NOT_IMPORTED = {'user_interface': ['matplotlib', 'requests', 'crontab', 'tabulate', 'AO3'],
+                'update_AO3_fics': ['matplotlib'],
+                'ao3_stats': ['numpy', 'requests', 'matplotlib']}
+
+def import_times(module):
+    # Returns [(cumulative microseconds, module name), ...] of every module imported by importing `module`
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    times = list()
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self, cumulative, name = line[len('import time:'):].split('|')
+        times.append((int(cumulative), name[1:].rstrip())) # Each level of nested import is indented 2 more spaces
+    return times
+
+def own_imports(times):
+    # Returns the part of import_times() nested under the module itself. The module is last, right after the block
+    #   of its own imports. Anything before that block (at the top level) was imported when Python started up.
+    for start in range(len(times) - 1, 0, -1):
+        if not times[start - 1][1].startswith('  '):
+            return times[start:-1]
+    return times[:-1]
+
+def benchmark(module, top=10, repeats=3):
+    # Prints the import time of the module (the best of `repeats`, so the disk cache is warm) and its slowest
+    #   imports. Returns True if it's within its budget and didn't import anything it shouldn't.
+    times = min((import_times(module) for _ in range(repeats)), key=lambda times: times[-1][0])
+    total_ms = times[-1][0] / 1000 # The module itself is last, and its cumulative time includes everything
+    imported = {name.strip().split('.')[0] for _, name in own_imports(times)}
+    print(f'{module}: {total_ms:.0f} ms (budget: {BUDGETS_MS.get(module, "none")} ms)')
+    # The modules imported directly by the module, which are indented one level
+    direct = [(cumulative, name) for cumulative, name in own_imports(times) if not name.startswith('    ')]
+    for cumulative, name in sorted(direct, reverse=True)[:top]:
+        print(f'    {cumulative / 1000:8.1f} ms  {name.strip()}')
+
+    ok = total_ms <= BUDGETS_MS.get(module, float('inf'))
+    for name in NOT_IMPORTED.get(module, list()):
+        if name in imported:
+            print(f'    {name} is imported, but should only be imported when it is needed')
+            ok = False
+    return ok
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures the import time of the programs that start up the most.')
+    parser.add_argument('modules', nargs='*', default=list(BUDGETS_MS),
+                        help=f'Modules to measure (default: {" ".join(BUDGETS_MS)})')
+    parser.add_argument('--top', type=int, default=10, help='Number of the slowest imports to list (default: 10)')
+    args = parser.parse_args()
+    results = [benchmark(module, top=args.top) for module in args.modules]
+    sys.exit(0 if all(results) else 1)
@@ -6,15 +6,59 @@ import common as cm
 import re
 from datetime import datetime
 import os
+import signal
+import subprocess
 
 # Constants --------
 PYTHON_EXE_PATH = os.path.join(cm.PROGRAM_DIRECTORY, 'venv/bin/python3')
 UPDATE_AO3_FICS_PATH = os.path.join(cm.PROGRAM_DIRECTORY, 'update_AO3_fics.py')
 AO3_cron_command = ' '.join([PYTHON_EXE_PATH, UPDATE_AO3_FICS_PATH])
+SCHEDULER_SERVICE_PATH = os.path.join(cm.PROGRAM_DIRECTORY, 'scheduler_service.py')
+service_cron_command = f'{PYTHON_EXE_PATH} {SCHEDULER_SERVICE_PATH} >> {cm.SERVICE_LOG_FILEPATH} 2>&1'
 
 def get_AO3_jobs(cron):
     return [job for job in cron if job.command == AO3_cron_command]
 
+## Service -------------------
+# With the service on, the tracking times stay in the crontab (so they can still be viewed and changed) but are
+#   disabled, and the service (see scheduler_service.py) runs the updates on those times instead.
+#   An @reboot job starts the service again whenever the computer is turned on.
+def get_service_jobs(cron):
+    return [job for job in cron if job.command == service_cron_command]
+
+def is_service_on(cron):
+    return len(get_service_jobs(cron)) > 0
+
+def turn_service_on(cron):
+    if not is_service_on(cron):
+        cron.new(command=service_cron_command).every_reboot()
+    for job in get_AO3_jobs(cron):
+        job.enable(False)
+    return None
+
+def turn_service_off(cron):
+    for job in get_service_jobs(cron):
+        cron.remove(job)
+    for job in get_AO3_jobs(cron):
+        job.enable(True)
+    return None
+
+def start_or_stop_service(cron):
+    # Starts the service if it's on and not running yet, or stops it if it's off and still running.
+    #   Only done once the crontab is saved, so quitting without saving changes nothing.
+    from scheduler_service import read_service_pid
+    pid = read_service_pid()
+    if is_service_on(cron) and pid is None:
+        with open(cm.SERVICE_LOG_FILEPATH, 'a') as log:
+            # Its own session, so it keeps running after the user interface is closed
+            subprocess.Popen([PYTHON_EXE_PATH, SCHEDULER_SERVICE_PATH], stdin=subprocess.DEVNULL, stdout=log,
+                             stderr=subprocess.STDOUT, start_new_session=True)
+        print('The service was started.')
+    elif not is_service_on(cron) and pid is not None:
+        os.kill(pid, signal.SIGTERM)
+        print('The service was stopped.')
+    return None
+
 def convert_weekdays(weekdays):
     conversion = {'0':'Sun', '1':'Mon', '2':'Tue', '3':'Wed', '4':'Thu', '5':'Fri', '6':'Sat', '*':'All'}
     individual_days = weekdays.split(',')
@@ -173,6 +217,8 @@ def add_job(cron):
             print('It could be because the AO3 script the program runs was deleted.')
             print('Please try again.')
             continue
+        if is_service_on(cron): # The service runs it instead
+            job.enable(False)
         return None
 
 def remove_job(cron, jobs):
@@ -253,6 +299,8 @@ def interact_with_cron():
     print('computer will wait until the next time.')
     print('There\'s no harm done!')
     print('So go crazy!')
+    print('Each fic is only fetched as often as its stats are changing, so quiet')
+    print('fics aren\'t fetched on every tracking time anyway.')
     print('\n\n')
     while True:
         print('What would you like to do? After typing, hit Enter')
@@ -260,6 +308,7 @@ def interact_with_cron():
         print('Add a tracking time:                   Type "Add"')
         print('Remove a tracking time:                Type "Remove"')
         print('Change a tracking time:                Type "Change"')
+        print(f'Background service ({"on" if is_service_on(cron) else "off"}):'.ljust(39) + 'Type "Background"')
         print('                   ~~~~~~~~~~             ')
         print('Save your time changes:               Type "Save"')
         print('Quit without saving time changes:     Type "Quit"')
@@ -288,11 +337,24 @@ def interact_with_cron():
             change_job_time(cron, AO3_jobs)
             AO3_jobs = get_AO3_jobs(cron)
             cm.clear_screen()
+        elif user_action.lower().startswith('b'): # Turn the service on or off
+            cm.clear_screen()
+            if is_service_on(cron):
+                turn_service_off(cron)
+                print('The background service will be turned off when you save.')
+                print('The tracking times will be run by cron again.')
+            else:
+                turn_service_on(cron)
+                print('The background service will be turned on when you save.')
+                print('It stays running and updates the fics on your tracking times, and catches up')
+                print('on the times your computer was asleep or off through as soon as it\'s back.')
+            print()
         elif user_action.lower().startswith('s'): # Save the changes and exit
             cm.clear_screen()
             print('Please allow the program to make changes / administer your computer')
             print('It\'s only to add the auto-running to your crontab :)')
             cron.write()
+            start_or_stop_service(cron)
             """
             for job in cron:
                 print(job)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# poll_intervals.py: How often each fic is worth fetching from AO3, learned from its own recent history.
+#   A fic that just posted a chapter, or is getting a lot of hits, is fetched on every update (as often as
+#   FRESHNESS_MINUTES allows). A fic that has been quiet for weeks is only fetched about once a week.
+#   In between, a fic is fetched about as often as it takes to gain POLL_TARGET_CHANGES hits, kudos and comments,
+#   so its graph has the same detail either way, with far fewer requests to AO3 for the quiet fics.
+# Author: Fixationally_Consumed
+import datetime
+# User Defined modules
+import common as cm
+
+def last_chapter_time(samples):
+    # Returns when the last new chapter was first seen in the samples, or None if the chapter count never went up
+    for previous, sample in zip(reversed(samples[:-1]), reversed(samples)):
+        if sample[2] > previous[2]:
+            return sample[0]
+    return None
+
+def poll_minutes(store, workID, minMinutes=cm.FRESHNESS_MINUTES, maxMinutes=cm.MAX_POLL_MINUTES,
+                 targetChanges=cm.POLL_TARGET_CHANGES, now=None):
+    # Returns how many minutes the fic's data stays fresh for: between minMinutes and maxMinutes, depending on
+    #   how fast its hits, kudos and comments went up over the last POLL_LOOKBACK_DAYS
+    now = now or datetime.datetime.now()
+    samples = store.samples(workID, start=now - datetime.timedelta(days=cm.POLL_LOOKBACK_DAYS))
+    if len(samples) < 2: # Not enough to tell yet
+        return minMinutes
+
+    chapter_time = last_chapter_time(samples)
+    if chapter_time is not None and now - chapter_time < datetime.timedelta(days=cm.NEW_CHAPTER_DAYS):
+        return minMinutes
+
+    first, last = samples[0], samples[-1]
+    minutes = (last[0] - first[0]).total_seconds() / 60
+    changes = sum(last[stat] - first[stat] for stat in [4, 5, 6]) # hits, kudos, comments
+    if minutes <= 0:
+        return minMinutes
+    if changes <= 0:
+        return maxMinutes
+    return int(min(max(targetChanges * minutes / changes, minMinutes), maxMinutes))
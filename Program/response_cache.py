@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# response_cache.py: Keeps a copy of every work page fetched from AO3, gzipped, in the Cache folder next to Data.
+#   The pages can be re-parsed later without going back to AO3 (see update_AO3_fics.py --replay), so a fixed
+#   parser or a newly tracked stat can be applied to past samples, and a bad sample can be debugged offline.
+#   The cache is capped at cm.CACHE_MAX_BYTES. When it's full, the least recently used pages are deleted first.
+# Author: Fixationally_Consumed
+import os
+import gzip
+import datetime
+import threading
+# User Defined modules
+import common as cm
+
+TIME_FORMAT = '%Y%m%dT%H%M%S'
+
+_lock = threading.Lock()
+_cache_sizes = dict() # Total bytes in each cache folder, so it doesn't need to be re-counted on every save
+
+def make_page_filename(workID, fetched_at):
+    return f"{workID}_{fetched_at.strftime(TIME_FORMAT)}.html.gz"
+
+def split_page_filename(filename):
+    # Returns the (workID, fetched_at) a page's filename was made from
+    workID, time_stamp = filename[:-len('.html.gz')].split('_')
+    return int(workID), datetime.datetime.strptime(time_stamp, TIME_FORMAT)
+
+def is_page_filename(filename):
+    return filename.endswith('.html.gz') and '_' in filename
+
+def save_page(workID, fetched_at, page, cache_directory=cm.CACHE_DIRECTORY, max_bytes=cm.CACHE_MAX_BYTES):
+    # Saves the (raw bytes of the) page, then makes room if the cache went over max_bytes
+    if not os.path.exists(cache_directory):
+        os.makedirs(cache_directory, exist_ok=True)
+    filepath = os.path.join(cache_directory, make_page_filename(workID, fetched_at))
+    with gzip.open(filepath, 'wb') as fh:
+        fh.write(page)
+
+    with _lock:
+        if cache_directory not in _cache_sizes:
+            _cache_sizes[cache_directory] = sum(entry.stat().st_size for entry in os.scandir(cache_directory) if is_page_filename(entry.name))
+        else:
+            _cache_sizes[cache_directory] += os.path.getsize(filepath)
+        if _cache_sizes[cache_directory] > max_bytes:
+            _cache_sizes[cache_directory] = evict(cache_directory, max_bytes)
+    return filepath
+
+def evict(cache_directory, max_bytes):
+    # Deletes the least recently used pages until the cache is down to 90% of max_bytes, so it's not
+    #   evicting again on the very next save. Returns the new size of the cache.
+    #   A page's modified time is its last use, since reading a page touches it.
+    entries = [entry for entry in os.scandir(cache_directory) if is_page_filename(entry.name)]
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    total = sum(entry.stat().st_size for entry in entries)
+    for entry in entries:
+        if total <= max_bytes * 0.9:
+            break
+        total -= entry.stat().st_size
+        os.remove(entry.path)
+    return total
+
+def cached_pages(workID, cache_directory=cm.CACHE_DIRECTORY):
+    # Returns [(fetched_at, filepath), ...] of every cached page of the work, oldest first
+    if not os.path.exists(cache_directory):
+        return list()
+    prefix = f'{workID}_'
+    pages = list()
+    for entry in os.scandir(cache_directory):
+        if entry.name.startswith(prefix) and is_page_filename(entry.name):
+            pages.append((split_page_filename(entry.name)[1], entry.path))
+    pages.sort()
+    return pages
+
+def read_page(filepath):
+    # Returns the raw bytes of a cached page, and marks it as recently used
+    with gzip.open(filepath, 'rb') as fh:
+        page = fh.read()
+    os.utime(filepath)
+    return page
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# scheduler_service.py: Updates the fics on the tracking times, from one program that stays running,
+#   instead of cron starting a new program every time.
+#   Starting a new program means importing everything and connecting to AO3 from scratch on every update.
+#   The service does that once, and keeps its connections to AO3, its open files and the processes that draw
+#   the graphs between updates.
+#
+#   The tracking times are the same ones set in the user interface ("Time"), read from the crontab. While the
+#   service is on, those jobs are disabled in the crontab and a single @reboot job starts the service instead
+#   (see interact_with_cron.py). Times the computer was asleep or off through are caught up on with one update
+#   as soon as it's back, and each update is started a little late at random (jitter) so it's not exactly on the minute.
+# Author: Fixationally_Consumed
+import os
+import sys
+import json
+import time
+import random
+import signal
+import datetime
+# User Defined modules
+import common as cm
+from file_locks import file_lock
+
+## Cron schedules -------------------
+def parse_cron_field(field, low, high):
+    # Returns the set of values a crontab field matches, ex: "*/15" for minutes is {0, 15, 30, 45}
+    #   Supports *, single values, ranges (a-b), steps (*/n, a-b/n) and lists of those (a,b,c)
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(value) for value in part.split('-'))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        values.update(range(start, end + 1, step))
+    return values
+
+class CronSchedule:
+    # One crontab time: minute hour day-of-month month day-of-week, ex: "30 17 * * 1,3,5"
+    def __init__(self, minute='*', hour='*', day='*', month='*', weekday='*'):
+        self.minutes = parse_cron_field(minute, 0, 59)
+        self.hours = parse_cron_field(hour, 0, 23)
+        self.days = parse_cron_field(day, 1, 31)
+        self.months = parse_cron_field(month, 1, 12)
+        self.weekdays = {weekday % 7 for weekday in parse_cron_field(weekday, 0, 7)} # 0 and 7 are both Sunday
+        self.any_day = day == '*'
+        self.any_weekday = weekday == '*'
+
+    def matches(self, when):
+        # Returns True if the schedule runs on the minute of `when` (a datetime)
+        if when.minute not in self.minutes or when.hour not in self.hours or when.month not in self.months:
+            return False
+        day_matches = when.day in self.days
+        weekday_matches = (when.weekday() + 1) % 7 in self.weekdays # datetime's Monday is 0, cron's Sunday is 0
+        if not self.any_day and not self.any_weekday: # Like cron, either one is enough when both are set
+            return day_matches or weekday_matches
+        return day_matches and weekday_matches
+
+def is_due(schedules, start, end):
+    # Returns True if any schedule runs on a minute after start and up to end (datetimes)
+    minute = start.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+    while minute <= end:
+        if any(schedule.matches(minute) for schedule in schedules):
+            return True
+        minute += datetime.timedelta(minutes=1)
+    return False
+
+def read_schedules():
+    # Returns the CronSchedule of every AO3 tracking time in the crontab, whether or not it's disabled
+    import interact_with_cron
+    from crontab import CronTab
+    return [CronSchedule(str(job.minute), str(job.hour), str(job.dom), str(job.month), str(job.dow))
+            for job in interact_with_cron.get_AO3_jobs(CronTab(user=True))]
+
+## State -------------------
+def read_last_run(state_filepath=cm.SERVICE_STATE_FILEPATH):
+    # Returns when the service last updated the fics, or None if it never has
+    if not os.path.exists(state_filepath):
+        return None
+    with open(state_filepath, 'r') as fh:
+        return datetime.datetime.fromisoformat(json.load(fh)['last_run'])
+
+def write_last_run(last_run, state_filepath=cm.SERVICE_STATE_FILEPATH):
+    with cm.atomic_write(state_filepath) as fh:
+        json.dump({'last_run': last_run.isoformat()}, fh)
+    return None
+
+def read_service_pid(pid_filepath=cm.SERVICE_PID_FILEPATH):
+    # Returns the process ID of the running service, or None if it isn't running
+    if not os.path.exists(pid_filepath):
+        return None
+    with open(pid_filepath, 'r') as fh:
+        pid = fh.read().strip()
+    try:
+        os.kill(int(pid), 0) # Only checks that the process exists
+    except (ValueError, ProcessLookupError, PermissionError):
+        return None
+    return int(pid)
+
+## Service -------------------
+def log(*message):
+    print(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), *message, flush=True)
+    return None
+
+def run_update(store, registry, renders):
+    # Updates the fics, with the store, fic list, session, render processes and modules kept from the updates before
+    import update_AO3_fics
+    try:
+        update_AO3_fics.coalesced_update(cm.FIC_SAVE_FILEPATH, store=store, registry=registry, renders=renders)
+    except Exception as e:
+        # The service keeps going, so the next tracking time still happens
+        log('The update failed:', e)
+    return None
+
+def scheduler_service(jitterSeconds=cm.SERVICE_JITTER_SECONDS, catchUpDays=cm.SERVICE_CATCH_UP_DAYS):
+    # Runs until it's stopped (ex: by turning the service off in the user interface, which sends SIGTERM)
+    from work_history_store import WorkHistoryStore
+    from fic_registry import FicRegistry
+    from generate_graph import RenderPool
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with open(cm.SERVICE_PID_FILEPATH, 'w') as fh:
+        fh.write(str(os.getpid()))
+    store = WorkHistoryStore(cm.HISTORY_STORE_FILEPATH) # Kept open between updates
+    registry = FicRegistry(cm.FIC_SAVE_FILEPATH) # Only re-read when the fic list was changed
+    renders = RenderPool(store) # Its processes are only started the first time a graph is drawn, and kept after
+    log('The service started.')
+
+    # Catch up on tracking times missed while the service wasn't running, but only as far back as catchUpDays
+    last_run = read_last_run()
+    earliest = datetime.datetime.now() - datetime.timedelta(days=catchUpDays)
+    checked_until = max(last_run, earliest) if last_run is not None else datetime.datetime.now()
+    try:
+        while True:
+            now = datetime.datetime.now()
+            # The crontab is re-read every time, so changes made in the user interface are picked up.
+            #   If the computer was asleep, the minutes it slept through are all checked here at once.
+            if is_due(read_schedules(), checked_until, now):
+                delay = random.uniform(0, jitterSeconds)
+                log(f'Updating the fics in {delay:.0f} seconds...')
+                time.sleep(delay)
+                run_update(store, registry, renders)
+                write_last_run(now)
+                log('Done updating.')
+            checked_until = now
+            # Wake up just after the start of the next minute
+            time.sleep(60 - datetime.datetime.now().second + 1)
+    finally:
+        renders.close()
+        store.close()
+        os.remove(cm.SERVICE_PID_FILEPATH)
+    return None
+
+if __name__ == '__main__':
+    try:
+        # Only one service can run at a time, ex: if it's started by @reboot and by hand
+        with file_lock(os.path.join(cm.LOCK_DIRECTORY, 'service.lock'), blocking=False):
+            scheduler_service()
+    except BlockingIOError:
+        log('The service is already running.')
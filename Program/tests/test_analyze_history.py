@@ -0,0 +1,63 @@
+# test_analyze_history.py: Tests the numbers analyze_history works out from a made up history, in particular
+#   that stats between samples are interpolated and when a chapter's window counts as complete.
+#   Run from the Program folder with: python3 -m unittest discover tests
+# Author: Fixationally_Consumed
+import os
+import sys
+import unittest
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# User Defined modules
+import analyze_history
+import history_arrays
+
+DAY = 86400
+
+def make_history(samples):
+    # samples: [(day, nchapters, hits)], with kudos a tenth of the hits and comments a hundredth
+    return history_arrays.from_samples(1, [(int(day * DAY), nchapters, 1000, hits, hits // 10, hits // 100)
+                                           for day, nchapters, hits in samples])
+
+class TestValuesAt(unittest.TestCase):
+    def test_interpolates_between_samples(self):
+        history = make_history([(0, 1, 0), (4, 1, 400)])
+        values = analyze_history.values_at(history, 'hits', np.array([1, 2, 4]) * DAY)
+        np.testing.assert_array_equal(values, [100, 200, 400])
+
+    def test_before_first_sample_is_nan(self):
+        history = make_history([(1, 1, 100), (2, 1, 200)])
+        values = analyze_history.values_at(history, 'hits', np.array([0, 1]) * DAY)
+        self.assertTrue(np.isnan(values[0]))
+        self.assertEqual(values[1], 100)
+
+    def test_after_last_sample_is_last_sample(self):
+        history = make_history([(0, 1, 0), (2, 1, 200)])
+        self.assertEqual(analyze_history.values_at(history, 'hits', np.array([5 * DAY]))[0], 200)
+
+    def test_daily_between_sparse_samples(self):
+        # Updated every 4 days: the days in between are spread out, instead of all the hits landing on one day
+        history = make_history([(0, 1, 0), (4, 1, 400), (8, 1, 800)])
+        per_day = analyze_history.analyze(history).per_day['hits']
+        np.testing.assert_allclose(per_day[1:-1], 100) # The last day ends after the last sample
+
+class TestChapterWindows(unittest.TestCase):
+    def test_complete_with_sample_after_window(self):
+        history = make_history([(0, 1, 0), (1, 2, 100), (5, 2, 500), (10, 2, 1000)])
+        chapters = analyze_history.chapter_windows(history, windowDays=7)
+        np.testing.assert_array_equal(chapters.nchapters, [2])
+        np.testing.assert_array_equal(chapters.day, [1])
+        self.assertEqual(chapters.gained['hits'][0], 700) # Day 8 is interpolated between days 5 and 10
+        self.assertTrue(chapters.complete[0])
+
+    def test_incomplete_without_sample_after_window(self):
+        history = make_history([(0, 1, 0), (1, 2, 100), (5, 2, 500)])
+        chapters = analyze_history.chapter_windows(history, windowDays=7)
+        self.assertEqual(chapters.gained['hits'][0], 400) # Only up to the last sample so far
+        self.assertFalse(chapters.complete[0])
+
+    def test_complete_with_sample_at_end_of_window(self):
+        history = make_history([(0, 1, 0), (1, 2, 100), (8, 2, 800)])
+        self.assertTrue(analyze_history.chapter_windows(history, windowDays=7).complete[0])
+
+if __name__ == '__main__':
+    unittest.main()
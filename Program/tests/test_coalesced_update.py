@@ -0,0 +1,90 @@
+# test_coalesced_update.py: Tests that coalesced_update runs one update at a time, and folds triggers that come in
+#   while an update is running into one follow-up run. The update itself is swapped for one that fetches nothing.
+#   Run from the Program folder with: python3 -m unittest discover tests
+# Author: Fixationally_Consumed
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# User Defined modules
+import common as cm
+import update_AO3_fics
+from file_locks import file_lock
+
+class TestCoalescedUpdate(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.runs = list() # The kwargs of each update that ran
+        self.during_run = list() # Functions called during each update, one per update
+        patches = [mock.patch.object(cm, 'RUN_LOCK_FILEPATH', os.path.join(directory.name, 'run.lock')),
+                   mock.patch.object(cm, 'RUN_PENDING_FILEPATH', os.path.join(directory.name, 'run.pending')),
+                   mock.patch.object(cm, 'RUN_LOG_FILEPATH', os.path.join(directory.name, 'runs.log')),
+                   mock.patch.object(update_AO3_fics, 'update_AO3_fics', self.fake_update)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def fake_update(self, fic_save_filepath, **kwargs):
+        self.runs.append(kwargs)
+        if len(self.during_run) > 0:
+            self.during_run.pop(0)()
+        return None
+
+    def trigger(self):
+        # Another trigger (ex: cron) while the update is running. The lock is per open file, so it's taken here too.
+        self.assertFalse(update_AO3_fics.coalesced_update('fics.txt'))
+        return None
+
+    def test_runs(self):
+        self.assertTrue(update_AO3_fics.coalesced_update('fics.txt', force=True))
+        self.assertEqual(self.runs, [{'force': True}])
+        self.assertEqual(update_AO3_fics.run_counts(cm.RUN_LOG_FILEPATH), {'run': 1, 'follow-up': 0, 'coalesced': 0})
+
+    def test_trigger_during_run(self):
+        self.during_run = [self.trigger]
+        self.assertTrue(update_AO3_fics.coalesced_update('fics.txt'))
+        self.assertEqual(len(self.runs), 2)
+        self.assertEqual(update_AO3_fics.run_counts(cm.RUN_LOG_FILEPATH), {'run': 1, 'follow-up': 1, 'coalesced': 1})
+        self.assertFalse(os.path.exists(cm.RUN_PENDING_FILEPATH))
+
+    def test_many_triggers_one_follow_up(self):
+        self.during_run = [lambda: [self.trigger() for _ in range(5)]]
+        update_AO3_fics.coalesced_update('fics.txt')
+        self.assertEqual(len(self.runs), 2)
+        self.assertEqual(update_AO3_fics.run_counts(cm.RUN_LOG_FILEPATH), {'run': 1, 'follow-up': 1, 'coalesced': 5})
+
+    def test_trigger_during_follow_up(self):
+        self.during_run = [self.trigger, self.trigger]
+        update_AO3_fics.coalesced_update('fics.txt')
+        self.assertEqual(len(self.runs), 3)
+        self.assertEqual(update_AO3_fics.run_counts(cm.RUN_LOG_FILEPATH), {'run': 1, 'follow-up': 2, 'coalesced': 2})
+
+    def test_run_already_going(self):
+        # The update that's running (here, the lock held by the test) is left to do the follow-up
+        with file_lock(cm.RUN_LOCK_FILEPATH):
+            self.assertFalse(update_AO3_fics.coalesced_update('fics.txt'))
+        self.assertEqual(self.runs, [])
+        self.assertTrue(os.path.exists(cm.RUN_PENDING_FILEPATH))
+        self.assertEqual(update_AO3_fics.run_counts(cm.RUN_LOG_FILEPATH), {'run': 0, 'follow-up': 0, 'coalesced': 1})
+
+    def test_trigger_as_run_finishes(self):
+        # A follow-up asked for after the running update last checked, but before it let go of the lock, still runs
+        real_exists = os.path.exists
+        checks = list()
+        def exists(filepath):
+            if filepath == cm.RUN_PENDING_FILEPATH and len(self.runs) == 1:
+                checks.append(filepath)
+                if len(checks) == 1: # The check after the run, with the lock still held
+                    result = real_exists(filepath)
+                    self.trigger()
+                    return result
+            return real_exists(filepath)
+        with mock.patch.object(update_AO3_fics.os.path, 'exists', exists):
+            self.assertTrue(update_AO3_fics.coalesced_update('fics.txt'))
+        self.assertEqual(len(self.runs), 2)
+
+if __name__ == '__main__':
+    unittest.main()
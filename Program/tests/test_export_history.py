@@ -0,0 +1,77 @@
+# test_export_history.py: Tests exporting the store to CSV and JSON Lines, and that an incremental export
+#   (--since-last) only writes the samples added since the last export with the same name.
+#   Run from the Program folder with: python3 -m unittest discover tests
+# Author: Fixationally_Consumed
+import os
+import sys
+import csv
+import json
+import datetime
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# User Defined modules
+import common as cm
+from export_history import export_history, export_format, ExportError, EXPORT_COLUMNS
+from fetch_AO3_stats import WorkStats
+from work_history_store import WorkHistoryStore
+
+PUBLISHED = datetime.datetime(2026, 1, 1)
+
+class TestExportHistory(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.fic_save_filepath = os.path.join(self.directory, 'fics.txt')
+        self.store_filepath = os.path.join(self.directory, 'store.sqlite3')
+        with open(self.fic_save_filepath, 'w') as fh:
+            fh.write(cm.make_fic_line({'workID': '1', 'ficName': 'One', 'graphDirectory': self.directory}))
+
+    def add_samples(self, samples):
+        # samples: [(workID, days after PUBLISHED, hits)]
+        store = WorkHistoryStore(self.store_filepath)
+        for workID, days, hits in samples:
+            store.add_sample(WorkStats(workID, 'Work', PUBLISHED, 1, 100, hits, 0, 0, PUBLISHED + datetime.timedelta(days=days)))
+        store.commit()
+        store.close()
+        return None
+
+    def export(self, filename, since_last=None):
+        # Returns the number of rows written, and the rows read back from the file
+        filepath = os.path.join(self.directory, filename)
+        count = export_history(filepath, since_last=since_last, fic_save_filepath=self.fic_save_filepath, store_filepath=self.store_filepath)
+        with open(filepath, 'r', encoding='utf-8') as fh:
+            if filename.endswith('.csv'):
+                rows = list(csv.DictReader(fh))
+            else:
+                rows = [json.loads(line) for line in fh]
+        return count, rows
+
+    def test_csv(self):
+        self.add_samples([(1, 1, 10), (1, 2, 20), (2, 1, 5)])
+        count, rows = self.export('all.csv')
+        self.assertEqual(count, 3)
+        self.assertEqual(list(rows[0].keys()), EXPORT_COLUMNS)
+        self.assertEqual([(row['workID'], row['ficName'], row['hits']) for row in rows], [('1', 'One', '10'), ('1', 'One', '20'), ('2', '', '5')])
+        self.assertEqual(rows[0]['sampled_at'], '2026-01-02T00:00:00')
+
+    def test_since_last(self):
+        self.add_samples([(1, 1, 10), (2, 1, 5)])
+        self.assertEqual(self.export('first.jsonl', since_last='db')[0], 2)
+        self.add_samples([(1, 2, 20), (1, 3, 30)])
+        count, rows = self.export('second.jsonl', since_last='db')
+        self.assertEqual(count, 2)
+        self.assertEqual([row['hits'] for row in rows], [20, 30])
+        self.assertEqual(self.export('third.jsonl', since_last='db')[0], 0)
+        self.assertEqual(self.export('other.jsonl', since_last='other')[0], 4) # Each name keeps its own place
+        self.assertEqual(self.export('all.jsonl')[0], 4)
+
+    def test_export_format(self):
+        self.assertEqual(export_format('out.CSV'), 'csv')
+        self.assertEqual(export_format('out.txt', 'jsonl'), 'jsonl')
+        with self.assertRaises(ExportError):
+            export_format('out.txt')
+
+if __name__ == '__main__':
+    unittest.main()
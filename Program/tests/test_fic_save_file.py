@@ -0,0 +1,82 @@
+# test_fic_save_file.py: Tests reading the fic save file, and that a bad line (ex: edited by hand) is skipped
+#   with a warning instead of stopping the update of every fic.
+#   Run from the Program folder with: python3 -m unittest discover tests
+# Author: Fixationally_Consumed
+import io
+import os
+import sys
+import tempfile
+import unittest
+import contextlib
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# User Defined modules
+import common as cm
+from fic_registry import FicRegistry
+
+def line(*values):
+    return cm.SEP.join(values)
+
+class TestParseFicLine(unittest.TestCase):
+    def parse(self, fic_line):
+        # Returns the parsed fic, and what was printed
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            fic = cm.parse_fic_line(fic_line)
+        return fic, output.getvalue()
+
+    def test_fic(self):
+        fic, warning = self.parse(line('123', 'My Fic', '/graphs'))
+        self.assertEqual(fic, {'workID': '123', 'ficName': 'My Fic', 'graphDirectory': '/graphs'})
+        self.assertEqual(warning, '')
+
+    def test_fresh_minutes(self):
+        fic, _ = self.parse(line('123', 'My Fic', '/graphs', '90'))
+        self.assertEqual(fic['freshMinutes'], '90')
+        fic, _ = self.parse(line('123', 'My Fic', '/graphs', ''))
+        self.assertNotIn('freshMinutes', fic)
+
+    def test_round_trip(self):
+        fic = {'workID': '123', 'ficName': 'My Fic', 'graphDirectory': '/graphs', 'freshMinutes': '90'}
+        self.assertEqual(self.parse(cm.make_fic_line(fic).strip())[0], fic)
+
+    def test_bad_lines(self):
+        for bad_line in [line('12a', 'My Fic', '/graphs'), line('', 'My Fic', '/graphs'), line('-5', 'My Fic', '/graphs'),
+                         line('123', 'My Fic', '/graphs', 'often'), line('123', 'My Fic')]:
+            fic, warning = self.parse(bad_line)
+            self.assertIsNone(fic, bad_line)
+            self.assertIn('Skipping', warning)
+
+class TestFicRegistry(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filepath = os.path.join(directory.name, 'fics.txt')
+
+    def write(self, lines):
+        with open(self.filepath, 'w') as fh:
+            fh.write(''.join(fic_line + '\n' for fic_line in lines))
+        return None
+
+    def test_bad_line_skipped(self):
+        self.write([line('1', 'One', '/g'), line('two', 'Two', '/g'), line('3', 'Three', '/g', 'soon'), '', line('4', 'Four', '/g')])
+        with contextlib.redirect_stdout(io.StringIO()):
+            registry = FicRegistry(self.filepath)
+        self.assertEqual([fic['workID'] for fic in registry.fics()], ['1', '4'])
+
+    def test_reload_after_change(self):
+        self.write([line('1', 'One', '/g')])
+        registry = FicRegistry(self.filepath)
+        self.assertIn(1, registry)
+        registry.add({'workID': '2', 'ficName': 'Two', 'graphDirectory': '/g'})
+        self.write([line('1', 'One', '/g'), line('2', 'Two', '/g'), line('3', 'Three', '/g')]) # Changed by another program
+        self.assertEqual(len(registry), 3)
+        self.assertTrue(registry.has_ficName('Three'))
+
+    def test_remove_and_change(self):
+        self.write([line('1', 'One', '/g'), line('2', 'Two', '/g'), line('3', 'Three', '/g')])
+        registry = FicRegistry(self.filepath)
+        registry.remove(['2'])
+        registry.change('3', {'workID': '3', 'ficName': 'Three Again', 'graphDirectory': '/g'})
+        self.assertEqual([fic['ficName'] for fic in FicRegistry(self.filepath).fics()], ['One', 'Three Again'])
+
+if __name__ == '__main__':
+    unittest.main()
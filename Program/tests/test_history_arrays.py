@@ -0,0 +1,105 @@
+# test_history_arrays.py: Tests building, saving and memory-mapping a fic's history arrays, and bringing the
+#   saved arrays up to date with the store, which update_history only does when the fic's data changed.
+#   Also tests the LTTB downsampling that the graphs are drawn with.
+#   Run from the Program folder with: python3 -m unittest discover tests
+# Author: Fixationally_Consumed
+import os
+import sys
+import datetime
+import tempfile
+import unittest
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# User Defined modules
+import history_arrays
+from generate_graph import update_history
+from fetch_AO3_stats import WorkStats
+from work_history_store import WorkHistoryStore
+
+class TestHistoryArrays(unittest.TestCase):
+    def test_save_and_load(self):
+        rows = [(0, 1, 100, 5, 1, 0), (3600, 1, 100, 9, 2, 0), (7200, 2, 250, 20, 4, 1)]
+        history = history_arrays.from_samples(7, rows)
+        with tempfile.TemporaryDirectory() as directory:
+            history.save(directory)
+            loaded = history_arrays.load(7, directory)
+            self.assertIsInstance(loaded.columns, np.memmap)
+            np.testing.assert_array_equal(loaded.columns, np.array(rows, dtype=np.int32).T)
+            np.testing.assert_array_equal(loaded.chapter_added, [True, False, True])
+            np.testing.assert_array_equal(loaded.hits, [5, 9, 20])
+            del loaded # Lets go of the memory-mapped files before they're deleted
+        self.assertIsNone(history_arrays.load(7, directory))
+
+    def test_load_current(self):
+        # Saved arrays that are missing samples from the store are rebuilt, and current ones are left alone
+        published = datetime.datetime(2026, 1, 1)
+        with tempfile.TemporaryDirectory() as directory:
+            store = WorkHistoryStore(os.path.join(directory, 'store.sqlite3'))
+            arrays_directory = os.path.join(directory, 'arrays')
+            self.assertIsNone(history_arrays.load_current(store, 7, arrays_directory))
+            for day, hits in [(1, 10), (2, 20)]:
+                store.add_sample(WorkStats(7, 'Work', published, 1, 100, hits, 0, 0, published + datetime.timedelta(days=day)))
+            store.commit()
+            history = history_arrays.load_current(store, 7, arrays_directory)
+            np.testing.assert_array_equal(history.hits, [10, 20])
+            modified = os.stat(history_arrays.columns_filepath(7, arrays_directory)).st_mtime_ns
+            self.assertTrue(history_arrays.is_current(history_arrays.load_current(store, 7, arrays_directory), store))
+            self.assertEqual(os.stat(history_arrays.columns_filepath(7, arrays_directory)).st_mtime_ns, modified)
+
+            store.add_sample(WorkStats(7, 'Work', published, 1, 100, 20, 0, 0, published + datetime.timedelta(days=3)))
+            store.commit()
+            self.assertFalse(history_arrays.is_current(history, store))
+            np.testing.assert_array_equal(history_arrays.load_current(store, 7, arrays_directory).hits, [10, 20, 20])
+            del history
+            store.close()
+
+class TestUpdateHistory(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = WorkHistoryStore(os.path.join(directory.name, 'store.sqlite3'))
+        self.addCleanup(self.store.close)
+        self.arrays_directory = os.path.join(directory.name, 'arrays')
+        self.lock_directory = os.path.join(directory.name, 'locks')
+        self.published = datetime.datetime.now().replace(microsecond=0) - datetime.timedelta(days=3)
+
+    def update(self, hours, hits):
+        work = WorkStats(7, 'Work', self.published, 1, 100, hits, 0, 0, self.published + datetime.timedelta(hours=hours))
+        return update_history(7, self.store, work=work, historyArraysDirectory=self.arrays_directory, lock_directory=self.lock_directory)
+
+    def saved_length(self):
+        return len(history_arrays.load(7, self.arrays_directory))
+
+    def test_saved_only_when_changed(self):
+        first = self.update(1, 10)
+        self.assertEqual(self.saved_length(), 1)
+        self.assertEqual(self.update(2, 10), first) # Same stats: the graph's data is the same, and the arrays aren't rewritten
+        self.assertEqual(self.saved_length(), 1)
+        self.assertEqual(self.store.data_fingerprint(7), first)
+        changed = self.update(3, 15)
+        self.assertNotEqual(changed, first)
+        self.assertEqual(self.saved_length(), 3)
+        self.assertEqual(self.store.data_fingerprint(7), changed)
+
+class TestLTTB(unittest.TestCase):
+    def test_short_lines_are_kept(self):
+        np.testing.assert_array_equal(history_arrays.lttb_indices(np.arange(5), np.arange(5), 10), np.arange(5))
+
+    def test_keeps_ends_and_count(self):
+        x = np.arange(1000)
+        indices = history_arrays.lttb_indices(x, np.sin(x / 50), 100)
+        self.assertEqual(len(indices), 100)
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], 999)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+
+    def test_keeps_jump(self):
+        # A new chapter's jump in hits is kept, even though most of the flat line around it is thinned out
+        x = np.arange(1000)
+        y = np.where(x < 600, 0, 500).astype(np.float64)
+        y[600] = 1000
+        indices = history_arrays.lttb_indices(x, y, 20)
+        self.assertIn(600, indices)
+
+if __name__ == '__main__':
+    unittest.main()
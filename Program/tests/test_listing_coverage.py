@@ -0,0 +1,100 @@
+# test_listing_coverage.py: Tests which listing pages harvest_listing_stats reads, and what it remembers about
+#   where each work was found, against listings made up here.
+#   Run from the Program folder with: python3 -m unittest discover tests
+# Author: Fixationally_Consumed
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# User Defined modules
+from fetch_AO3_stats import harvest_listing_stats
+
+WORKS_PER_PAGE = 20
+
+def listing_page(workIDs, has_next_page):
+    blurbs = ''.join(f'<li id="work_{workID}" class="work blurb group" role="article"><div class="header module">'
+                     f'<h4 class="heading"><a href="/works/{workID}">Work {workID}</a></h4></div>'
+                     f'<dl class="stats"><dt class="hits">Hits:</dt><dd class="hits">{workID}</dd></dl></li>'
+                     for workID in workIDs)
+    pagination = '<ol class="pagination actions"><li class="next"><a rel="next" href="?page=2">Next</a></li></ol>' if has_next_page else ''
+    return f'<html><body><ol class="work index group">{blurbs}</ol>{pagination}</body></html>'
+
+class ListingResponse:
+    def __init__(self, text):
+        self.text = text
+
+    def raise_for_status(self):
+        return None
+
+class ListingSession:
+    # Stands in for AO3Session. listings: {listing: [workID, ...] in the order they're listed}
+    def __init__(self, listings):
+        self.listings = listings
+        self.requested = list()
+
+    def get(self, url):
+        self.requested.append(url)
+        path, page = url.split('/', 3)[-1].split('?page=')
+        page = int(page)
+        workIDs = self.listings[path]
+        return ListingResponse(listing_page(workIDs[(page - 1) * WORKS_PER_PAGE:page * WORKS_PER_PAGE], page * WORKS_PER_PAGE < len(workIDs)))
+
+class TestListingCoverage(unittest.TestCase):
+    def setUp(self):
+        self.session = ListingSession({'users/a/works': list(range(1, 201))}) # 10 pages
+        self.sources = ['users/a/works']
+        self.coverage = dict()
+
+    def harvest(self, workIDs):
+        self.session.requested = list()
+        found = harvest_listing_stats(self.sources, workIDs, session=self.session, coverage=self.coverage)
+        return sorted(found), len(self.session.requested)
+
+    def test_new_works_read_one_page_each(self):
+        # The 2 new works are looked for in 2 pages. 190 is further down, so it's looked for again next time
+        self.assertEqual(self.harvest({3, 190}), ([3], 2))
+        self.assertEqual(self.coverage, {3: ('users/a/works', 1)})
+
+    def test_remembers_the_page(self):
+        self.coverage = {3: ('users/a/works', 1), 190: ('users/a/works', 10)}
+        self.assertEqual(self.harvest({3, 190}), ([3, 190], 10))
+        self.assertEqual(self.harvest({3}), ([3], 1)) # Only the page it's on
+        self.assertEqual(self.coverage, {3: ('users/a/works', 1), 190: ('users/a/works', 10)})
+
+    def test_moved_down(self):
+        # A work pushed further down than was read isn't forgotten, and the next update reads one more page for it
+        self.coverage = {110: ('users/a/works', 5)}
+        self.assertEqual(self.harvest({110}), ([110], 6))
+        self.assertEqual(self.coverage, {110: ('users/a/works', 6)})
+        self.coverage = {170: ('users/a/works', 5)}
+        self.assertEqual(self.harvest({170}), ([], 6))
+        self.assertEqual(self.coverage, {170: ('users/a/works', 6)})
+        self.assertEqual(self.harvest({170}), ([], 7))
+        self.assertEqual(self.harvest({170}), ([], 8))
+        self.assertEqual(self.harvest({170}), ([170], 9))
+        self.assertEqual(self.coverage, {170: ('users/a/works', 9)})
+
+    def test_not_in_any_listing(self):
+        self.session.listings['users/a/works'] = list(range(1, 31)) # 2 pages
+        self.assertEqual(self.harvest({3, 500, 600}), ([3], 2))
+        self.assertEqual(self.coverage, {3: ('users/a/works', 1), 500: '', 600: ''})
+        self.assertEqual(self.harvest({3, 500, 600}), ([3], 1)) # 500 and 600 aren't looked for again
+
+    def test_left_the_listing(self):
+        # Only forgotten once the listing was read to the end without it
+        self.session.listings['users/a/works'] = list(range(1, 31))
+        self.coverage = {3: ('users/a/works', 1), 25: ('users/a/works', 2)}
+        self.session.listings['users/a/works'].remove(25)
+        self.assertEqual(self.harvest({3, 25}), ([3], 2))
+        self.assertEqual(self.coverage, {3: ('users/a/works', 1)})
+
+    def test_other_listing(self):
+        # A work is only looked for in the listing it was found in
+        self.session.listings['users/b/works'] = [1000, 1001]
+        self.sources.append('users/b/works')
+        self.coverage = {1001: ('users/b/works', 1)}
+        self.assertEqual(self.harvest({1001}), ([1001], 1))
+        self.assertEqual(self.session.requested[0].split('/', 3)[-1], 'users/b/works?page=1')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# test_parsers.py: Tests reading the stats out of AO3's work and listing pages, using the saved pages in fixtures/
+#   Run from the Program folder with: python3 -m unittest discover tests
+# Author: Fixationally_Consumed
+import os
+import sys
+import datetime
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# User Defined modules
+from fetch_AO3_stats import WorkStatsParser, WorkUnavailableError, parse_work_stats, parse_listing_stats
+
+FIXTURES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+FETCHED_AT = datetime.datetime(2023, 3, 1, 12, 0, 0)
+
+def read_fixture(filename):
+    with open(os.path.join(FIXTURES_DIRECTORY, filename), 'rb') as fh:
+        return fh.read()
+
+def chunked(page, size):
+    # The page split into chunks of `size` bytes, the way it comes in from AO3
+    return [page[i:i + size] for i in range(0, len(page), size)]
+
+class TestWorkStats(unittest.TestCase):
+    def test_work_page(self):
+        work = parse_work_stats([read_fixture('work.html')], 32751484, FETCHED_AT)
+        self.assertEqual(work.workID, 32751484)
+        self.assertEqual(work.title, 'The Long Way Round & Back')
+        self.assertEqual(work.date_published, datetime.datetime(2021, 7, 20))
+        self.assertEqual((work.nchapters, work.words, work.hits, work.kudos, work.comments), (27, 123456, 45678, 2345, 1001))
+        self.assertEqual(work.fetched_at, FETCHED_AT)
+
+    def test_small_chunks(self):
+        # Tags and multi-byte characters split between chunks still read the same
+        page = read_fixture('work.html')
+        for size in [1, 7, 64]:
+            self.assertEqual(parse_work_stats(chunked(page, size), 32751484, FETCHED_AT),
+                             parse_work_stats([page], 32751484, FETCHED_AT))
+
+    def test_stops_before_the_work(self):
+        # Nothing past the stats and the title is read, so text in the chapters can't change the stats
+        page = read_fixture('work.html')
+        chunks = chunked(page, 256)
+        read = list()
+        work = parse_work_stats((read.append(chunk) or chunk for chunk in chunks), 32751484, FETCHED_AT)
+        self.assertEqual(work.hits, 45678)
+        self.assertLess(len(read), len(chunks))
+
+    def test_missing_stats_are_zero(self):
+        page = read_fixture('work.html').replace(b'<dt class="kudos">Kudos:</dt><dd class="kudos">2,345</dd>', b'')
+        self.assertEqual(parse_work_stats([page], 32751484, FETCHED_AT).kudos, 0)
+
+    def test_no_stats(self):
+        # Ex: the page asking to log in, for works only shown to logged in users
+        with self.assertRaises(WorkUnavailableError):
+            parse_work_stats([b'<html><body><div id="main"><p>Sorry!</p><div id="chapters"></div></div></body></html>'], 1, FETCHED_AT)
+
+    def test_parser_done(self):
+        parser = WorkStatsParser()
+        parser.feed(read_fixture('work.html').decode('utf-8'))
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.stats['chapters'], '27/?')
+
+class TestListingStats(unittest.TestCase):
+    def test_works_listing(self):
+        works, has_next_page = parse_listing_stats(read_fixture('works_listing.html').decode('utf-8'), FETCHED_AT)
+        self.assertTrue(has_next_page)
+        self.assertEqual(sorted(works), [32751484, 40000001])
+        work = works[32751484]
+        self.assertEqual(work.title, 'The Long Way Round & Back')
+        self.assertIsNone(work.date_published) # Listings don't show it
+        self.assertEqual((work.nchapters, work.words, work.hits, work.kudos, work.comments), (27, 123456, 45678, 2345, 1001))
+        self.assertEqual(work.fetched_at, FETCHED_AT)
+
+    def test_works_listing_missing_stats(self):
+        works, _ = parse_listing_stats(read_fixture('works_listing.html').decode('utf-8'), FETCHED_AT)
+        work = works[40000001]
+        self.assertEqual((work.nchapters, work.words, work.hits, work.kudos, work.comments), (1, 2500, 310, 0, 0))
+
+    def test_bookmark_listing(self):
+        # Bookmark blurbs are numbered by the bookmark, so the work ID comes from the link. Bookmarked series are skipped.
+        works, has_next_page = parse_listing_stats(read_fixture('bookmarks_listing.html').decode('utf-8'), FETCHED_AT)
+        self.assertFalse(has_next_page)
+        self.assertEqual(sorted(works), [32751484, 41111111])
+        self.assertEqual(works[41111111].title, 'Someone Else\'s Fic')
+        self.assertEqual((works[41111111].hits, works[41111111].kudos), (1234, 150))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# test_poll_intervals.py: Tests how often poll_minutes says each fic is worth fetching, from made up histories.
+#   Run from the Program folder with: python3 -m unittest discover tests
+# Author: Fixationally_Consumed
+import os
+import sys
+import datetime
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# User Defined modules
+from fetch_AO3_stats import WorkStats
+from poll_intervals import poll_minutes
+from work_history_store import WorkHistoryStore
+
+PUBLISHED = datetime.datetime(2026, 1, 1)
+NOW = datetime.datetime(2026, 6, 1, 12)
+
+class TestPollMinutes(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = WorkHistoryStore(os.path.join(directory.name, 'store.sqlite3'))
+        self.addCleanup(self.store.close)
+
+    def add_samples(self, workID, samples):
+        # samples: [(days before NOW, nchapters, hits)]
+        for days, nchapters, hits in samples:
+            self.store.add_sample(WorkStats(workID, 'Work', PUBLISHED, nchapters, 1000, hits, 0, 0, NOW - datetime.timedelta(days=days)))
+        self.store.commit()
+        return None
+
+    def poll_minutes(self, workID):
+        return poll_minutes(self.store, workID, minMinutes=60, maxMinutes=10080, targetChanges=10, now=NOW)
+
+    def test_new_fic(self):
+        self.add_samples(1, [(0, 1, 10)])
+        self.assertEqual(self.poll_minutes(1), 60)
+
+    def test_quiet_fic(self):
+        self.add_samples(1, [(10, 1, 50), (5, 1, 50), (0, 1, 50)])
+        self.assertEqual(self.poll_minutes(1), 10080)
+
+    def test_busy_fic(self):
+        self.add_samples(1, [(1, 1, 0), (0, 1, 1000)])
+        self.assertEqual(self.poll_minutes(1), 60)
+
+    def test_in_between(self):
+        # 10 hits a day: fetched about once a day
+        self.add_samples(1, [(10, 1, 0), (0, 1, 100)])
+        self.assertEqual(self.poll_minutes(1), 24 * 60)
+
+    def test_new_chapter(self):
+        # A quiet fic that just posted a chapter is fetched as often as possible
+        self.add_samples(1, [(10, 1, 50), (1, 2, 50), (0, 2, 50)])
+        self.assertEqual(self.poll_minutes(1), 60)
+
+    def test_old_chapter(self):
+        self.add_samples(1, [(10, 1, 50), (5, 2, 50), (0, 2, 50)])
+        self.assertEqual(self.poll_minutes(1), 10080)
+
+    def test_only_recent_history(self):
+        # Hits from before the lookback don't count
+        self.add_samples(1, [(30, 1, 0), (20, 1, 1000), (10, 1, 1000), (0, 1, 1000)])
+        self.assertEqual(self.poll_minutes(1), 10080)
+
+if __name__ == '__main__':
+    unittest.main()
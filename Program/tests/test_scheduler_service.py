@@ -0,0 +1,47 @@
+# test_scheduler_service.py: Tests the scheduler service's reading of crontab times, and when an update is due.
+#   Run from the Program folder with: python3 -m unittest discover tests
+# Author: Fixationally_Consumed
+import os
+import sys
+import datetime
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# User Defined modules
+from scheduler_service import parse_cron_field, CronSchedule, is_due
+
+class TestCronSchedule(unittest.TestCase):
+    def test_parse_cron_field(self):
+        self.assertEqual(parse_cron_field('*/15', 0, 59), {0, 15, 30, 45})
+        self.assertEqual(parse_cron_field('1-5', 0, 6), {1, 2, 3, 4, 5})
+        self.assertEqual(parse_cron_field('10-20/5', 0, 59), {10, 15, 20})
+        self.assertEqual(parse_cron_field('1,3,5', 0, 6), {1, 3, 5})
+        self.assertEqual(parse_cron_field('50/5', 0, 59), {50, 55})
+        self.assertEqual(parse_cron_field('7', 0, 23), {7})
+
+    def test_matches(self):
+        schedule = CronSchedule('30', '17', '*', '*', '1,3,5') # 5:30 PM on Mondays, Wednesdays and Fridays
+        self.assertTrue(schedule.matches(datetime.datetime(2026, 10, 19, 17, 30))) # Monday
+        self.assertFalse(schedule.matches(datetime.datetime(2026, 10, 20, 17, 30))) # Tuesday
+        self.assertFalse(schedule.matches(datetime.datetime(2026, 10, 19, 17, 31)))
+
+    def test_sunday_is_0_and_7(self):
+        sunday = datetime.datetime(2026, 10, 18, 9, 0)
+        self.assertTrue(CronSchedule('0', '9', '*', '*', '0').matches(sunday))
+        self.assertTrue(CronSchedule('0', '9', '*', '*', '7').matches(sunday))
+
+    def test_day_or_weekday(self):
+        # Like cron, when both the day of the month and the day of the week are set, either one is enough
+        schedule = CronSchedule('0', '0', '1', '*', '1') # The 1st of the month, and every Monday
+        self.assertTrue(schedule.matches(datetime.datetime(2026, 10, 1))) # A Thursday
+        self.assertTrue(schedule.matches(datetime.datetime(2026, 10, 19))) # A Monday
+        self.assertFalse(schedule.matches(datetime.datetime(2026, 10, 20)))
+
+    def test_is_due(self):
+        schedules = [CronSchedule('0', '*/6')] # Every 6 hours
+        start = datetime.datetime(2026, 10, 18, 5, 59, 30)
+        self.assertTrue(is_due(schedules, start, datetime.datetime(2026, 10, 18, 6, 0)))
+        self.assertFalse(is_due(schedules, start, datetime.datetime(2026, 10, 18, 5, 59, 59)))
+        self.assertFalse(is_due(schedules, datetime.datetime(2026, 10, 18, 6, 0, 10), datetime.datetime(2026, 10, 18, 11, 59)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+# test_session.py: Tests the shared AO3 session: how AO3Session handles AO3 rate-limiting (429) and server
+#   errors (5xx) against a stand-in server on this computer, how the TokenBucket paces requests, the backoff
+#   between retries, and the cool-down after AO3 is found to be down.
+#   Run from the Program folder with: python3 -m unittest discover tests
+# Author: Fixationally_Consumed
+import os
+import sys
+import time
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# User Defined modules
+import common as cm
+import fetch_AO3_stats
+from fetch_AO3_stats import AO3Session, AO3UnavailableError, TokenBucket, backoff_seconds, retry_after_seconds
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Answers each request with the next (status, headers) in the server's `responses`, then with 200
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        status, headers = self.server.responses.pop(0) if len(self.server.responses) > 0 else (200, dict())
+        body = b'ok' if status == 200 else b'error'
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class TestAO3Session(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.responses = list()
+        self.server.paths = list()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/works/1'
+        # No waiting between retries, other than what the server asks for
+        patches = [mock.patch.object(cm, 'BACKOFF_SECONDS', 0), mock.patch.object(cm, 'MAX_BACKOFF_SECONDS', 0),
+                   mock.patch.object(cm, 'MAX_RETRIES', 4), mock.patch.object(cm, 'MAX_SERVER_ERRORS', 5)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.session = AO3Session(pool_size=1, requests_per_minute=6000)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_after(self):
+        # A 429 is retried once the time AO3 asked for has passed
+        self.server.responses = [(429, {'Retry-After': '1'})]
+        start = time.monotonic()
+        response = self.session.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(time.monotonic() - start, 1)
+        self.assertEqual(len(self.server.paths), 2)
+
+    def test_server_errors_are_retried(self):
+        self.server.responses = [(503, dict()), (502, dict())]
+        self.assertEqual(self.session.get(self.url).status_code, 200)
+        self.assertEqual(len(self.server.paths), 3)
+
+    def test_out_of_retries(self):
+        # The last response is returned, so the caller sees the error status
+        self.server.responses = [(500, dict())] * 5
+        self.assertEqual(self.session.get(self.url).status_code, 500)
+        self.assertEqual(len(self.server.paths), 5)
+
+    def test_unavailable(self):
+        # After MAX_SERVER_ERRORS in a row, requests stop without going to AO3, until the session is reset
+        self.server.responses = [(503, dict())] * 5
+        self.session.get(self.url)
+        with self.assertRaises(AO3UnavailableError):
+            self.session.get(self.url)
+        self.assertEqual(len(self.server.paths), 5)
+        self.session.reset()
+        self.assertEqual(self.session.get(self.url).status_code, 200)
+
+    def test_unavailable_cool_down(self):
+        self.server.responses = [(503, dict())] * 5
+        self.session.get(self.url)
+        with mock.patch.object(cm, 'SERVER_ERROR_COOLDOWN_SECONDS', 0):
+            self.assertEqual(self.session.get(self.url).status_code, 200)
+
+    def test_unavailable_until_cool_down(self):
+        # While AO3 is cooling down, nothing is sent to it
+        self.server.responses = [(503, dict())] * 5
+        self.session.get(self.url)
+        with mock.patch.object(cm, 'SERVER_ERROR_COOLDOWN_SECONDS', 3600):
+            with self.assertRaises(AO3UnavailableError):
+                self.session.get(self.url)
+        self.assertEqual(len(self.server.paths), 5)
+
+    def test_success_forgets_server_errors(self):
+        # Only errors in a row count toward AO3 being down
+        self.server.responses = [(503, dict())] * 3 + [(200, dict())] + [(503, dict())] * 3
+        self.session.get(self.url)
+        self.assertEqual(self.session.get(self.url).status_code, 200)
+
+    def test_get_session_is_shared(self):
+        with mock.patch.object(fetch_AO3_stats, '_shared_session', None):
+            session = fetch_AO3_stats.get_session(pool_size=2)
+            self.assertIs(fetch_AO3_stats.get_session(pool_size=4), session)
+            self.assertEqual(session.pool_size, 4)
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        # time.sleep is recorded instead of waited, and time stands still
+        self.waits = list()
+        patches = [mock.patch.object(fetch_AO3_stats.time, 'sleep', self.waits.append),
+                   mock.patch.object(fetch_AO3_stats.time, 'monotonic', return_value=1000.0)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_burst_then_paced(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        for _ in range(5):
+            bucket.take()
+        self.assertEqual(self.waits, [0, 0, 0, 0.5, 1])
+
+    def test_refills_over_time(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        for _ in range(3):
+            bucket.take()
+        with mock.patch.object(fetch_AO3_stats.time, 'monotonic', return_value=1010.0):
+            bucket.take() # Refilled, but only up to capacity
+            bucket.take()
+            bucket.take()
+            bucket.take()
+        self.assertEqual(self.waits[3:], [0, 0, 0, 0.5])
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        bucket.pause(30)
+        bucket.take()
+        self.assertEqual(self.waits, [30])
+
+class TestBackoff(unittest.TestCase):
+    def test_doubles_with_jitter(self):
+        with mock.patch.object(cm, 'BACKOFF_SECONDS', 1), mock.patch.object(cm, 'MAX_BACKOFF_SECONDS', 100):
+            for attempt in range(4):
+                delays = [backoff_seconds(attempt) for _ in range(50)]
+                self.assertTrue(all(2 ** attempt / 2 <= delay <= 2 ** attempt for delay in delays))
+
+    def test_capped(self):
+        with mock.patch.object(cm, 'BACKOFF_SECONDS', 1), mock.patch.object(cm, 'MAX_BACKOFF_SECONDS', 10):
+            self.assertLessEqual(backoff_seconds(20), 10)
+
+    def test_retry_after(self):
+        response = mock.Mock(headers={'Retry-After': ' 120 '})
+        self.assertEqual(retry_after_seconds(response), 120)
+        response.headers = {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'} # In the past
+        self.assertEqual(retry_after_seconds(response), 0)
+        response.headers = {'Retry-After': 'soon'}
+        self.assertIsNone(retry_after_seconds(response))
+        response.headers = dict()
+        self.assertIsNone(retry_after_seconds(response))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+# test_work_history_store.py: Tests the tiered compaction of WorkHistoryStore against made up samples:
+#   what's kept in each tier, and that compacting a little at a time ends up the same as all at once.
+#   Run from the Program folder with: python3 -m unittest discover tests
+# Author: Fixationally_Consumed
+import os
+import sys
+import datetime
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# User Defined modules
+import common as cm
+from fetch_AO3_stats import WorkStats
+from work_history_store import WorkHistoryStore
+
+WORK_ID = 1
+PUBLISHED = datetime.datetime(2026, 1, 1)
+NOW = datetime.datetime(2026, 6, 1, 12, 30)
+
+def sample_times(start, end, minutes=20):
+    # Every `minutes` from start until before end
+    times = list()
+    while start < end:
+        times.append(start)
+        start += datetime.timedelta(minutes=minutes)
+    return times
+
+def expected_kept(times, now):
+    # The samples compact() should keep, worked out one sample at a time
+    hourly_cutoff = (now - datetime.timedelta(days=cm.RAW_RETENTION_DAYS)).replace(minute=0, second=0, microsecond=0)
+    daily_cutoff = datetime.datetime.combine((now - datetime.timedelta(days=cm.HOURLY_RETENTION_DAYS)).date(), datetime.time())
+    kept = list()
+    for i, time in enumerate(times):
+        after = times[i + 1] if i + 1 < len(times) else None
+        if time >= hourly_cutoff:
+            kept.append(time)
+        elif time >= daily_cutoff:
+            if after is None or after.replace(minute=0) != time.replace(minute=0):
+                kept.append(time) # Last of its hour
+        elif after is None or after.date() != time.date():
+            kept.append(time) # Last of its day
+    return kept
+
+class TestCompaction(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = WorkHistoryStore(os.path.join(directory.name, 'store.sqlite3'))
+        self.addCleanup(self.store.close)
+
+    def add_samples(self, times):
+        for n, time in enumerate(times):
+            self.store.add_sample(WorkStats(WORK_ID, 'Work', PUBLISHED, 1, 1000, n, 0, 0, time))
+        self.store.commit()
+        return None
+
+    def kept(self):
+        return [sample[0] for sample in self.store.samples(WORK_ID)]
+
+    def test_tiers(self):
+        times = sample_times(NOW - datetime.timedelta(days=100), NOW)
+        self.add_samples(times)
+        deleted = self.store.compact(WORK_ID, now=NOW)
+        self.assertEqual(self.kept(), expected_kept(times, NOW))
+        self.assertEqual(deleted, len(times) - len(self.kept()))
+
+    def test_recent_samples_are_kept(self):
+        times = sample_times(NOW - datetime.timedelta(days=cm.RAW_RETENTION_DAYS - 1), NOW)
+        self.add_samples(times)
+        self.assertEqual(self.store.compact(WORK_ID, now=NOW), 0)
+        self.assertEqual(self.kept(), times)
+
+    def test_incremental(self):
+        # Compacting every few days, as new samples come in, keeps the same samples as compacting once at the end
+        times = sample_times(NOW - datetime.timedelta(days=100), NOW + datetime.timedelta(days=10))
+        added = 0
+        for day in range(0, 11, 2):
+            now = NOW + datetime.timedelta(days=day)
+            new = [time for time in times[added:] if time < now]
+            self.add_samples(new)
+            added += len(new)
+            self.store.compact(WORK_ID, now=now)
+        self.assertEqual(self.kept(), expected_kept(times[:added], NOW + datetime.timedelta(days=10)))
+
+    def test_nothing_new_to_compact(self):
+        self.add_samples(sample_times(NOW - datetime.timedelta(days=100), NOW))
+        self.store.compact(WORK_ID, now=NOW)
+        self.assertEqual(self.store.compact(WORK_ID, now=NOW), 0)
+
+    def test_reset_compaction(self):
+        # Samples older than what's been compacted already are only compacted after reset_compaction()
+        recent = sample_times(NOW - datetime.timedelta(days=50), NOW)
+        replayed = sample_times(NOW - datetime.timedelta(days=60), NOW - datetime.timedelta(days=59))
+        self.add_samples(recent)
+        self.store.compact(WORK_ID, now=NOW)
+        self.add_samples(replayed)
+        self.assertEqual(self.store.compact(WORK_ID, now=NOW), 0)
+        self.store.reset_compaction(WORK_ID)
+        self.assertGreater(self.store.compact(WORK_ID, now=NOW), 0)
+        self.assertEqual(self.kept(), expected_kept(replayed + recent, NOW))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# tracker.py: Everything the scripts do (add, remove, update, history, render), as one object another Python
+#   program can keep and call over and over, ex:
+#       with Tracker('/srv/ao3_stats') as tracker:
+#           tracker.add(32751484, 'My Fic')
+#           tracker.update()
+#           history = tracker.history(32751484)
+#   The fic list and the store are opened once and kept open. The fic list is only re-read when it's changed
+#   on disk (see fic_registry.py), and the most recently used fics' histories are kept in memory, so repeated
+#   calls don't re-read anything that hasn't changed.
+#   All of the files are kept under one data root (the AO3_Stats folder by default), laid out the same as in common.py.
+# Author: Fixationally_Consumed
+import os
+from collections import OrderedDict
+# User Defined modules
+import common as cm
+import history_arrays
+from fic_registry import FicRegistry
+from work_history_store import WorkHistoryStore, import_workHistory_pickles
+
+class Tracker:
+    def __init__(self, dataRoot=cm.MAIN_DIRECTORY, cacheSize=cm.TRACKER_CACHE_SIZE):
+        # dataRoot: folder everything is saved in. Its Data, Cache and Locks folders are made as they're needed.
+        # cacheSize: number of fics' histories kept in memory
+        self.data_directory = os.path.join(dataRoot, cm.DATA_DIR_NAME)
+        self.cache_directory = os.path.join(dataRoot, cm.CACHE_DIR_NAME)
+        self.lock_directory = os.path.join(dataRoot, cm.LOCK_DIR_NAME)
+        self.fic_save_filepath = os.path.join(self.data_directory, cm.FIC_SAVE_FILENAME)
+        self.history_arrays_directory = os.path.join(self.data_directory, os.path.basename(cm.HISTORY_ARRAYS_DIRECTORY))
+        self.cacheSize = cacheSize
+
+        self.registry = FicRegistry(self.fic_save_filepath) # Also makes the Data folder
+        self.store = WorkHistoryStore(os.path.join(self.data_directory, cm.HISTORY_STORE_FILENAME))
+        import_workHistory_pickles(self.store, self.registry.fics(), self.data_directory)
+        self._histories = OrderedDict() # workID: (file version, HistoryArrays), least recently used first
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        self.store.close()
+        self._histories.clear()
+        return None
+
+    ## Fic list -------------------
+    def fics(self):
+        # Returns every tracked fic, in the order of the fic list
+        return self.registry.fics()
+
+    def add(self, workID, ficName=None, graphDirectory=cm.DEFAULT_GRAPH_DIRECTORY, validate=True):
+        # Starts tracking the work and returns its fic. If `validate` is True, the work is fetched from AO3 first,
+        #   and that fetch is saved as its first data point. The fic name is the work's title if it isn't given.
+        #   Raises ValueError if the work is already tracked, isn't on AO3, or the name can't be used.
+        workID = str(workID)
+        if workID in self.registry:
+            raise ValueError(f'Work ID {workID} is already being tracked')
+        taken = {fic['ficName'] for fic in self.registry.fics()}
+        if ficName is not None and (cm.includes_illegal_char(ficName) or ficName in taken):
+            raise ValueError(f'The fic name "{ficName}" is already used or has characters that aren\'t allowed')
+        work = None
+        if validate:
+            import fetch_AO3_stats
+            try:
+                work = fetch_AO3_stats.fetch_work_stats(int(workID), cache_directory=self.cache_directory)
+            except (fetch_AO3_stats.InvalidWorkIDError, fetch_AO3_stats.WorkUnavailableError) as e:
+                raise ValueError(f'Work ID {workID} is not on AO3, or can only be viewed when logged in') from e
+        fic = {'workID': workID,
+               'ficName': ficName if ficName is not None else cm.make_ficName(work.title if work is not None else '', workID, taken),
+               'graphDirectory': graphDirectory}
+        self.registry.add(fic)
+        if work is not None:
+            self._save_work(work)
+        return fic
+
+    def remove(self, workIDs):
+        # Stops tracking the works. Their data is kept.
+        workIDs = [str(workID) for workID in workIDs]
+        self.registry.remove(workIDs)
+        for workID in workIDs:
+            self._histories.pop(workID, None)
+        return None
+
+    ## Data -------------------
+    def update(self, workIDs=None, force=False, freshMinutes=cm.FRESHNESS_MINUTES, adaptive=cm.ADAPTIVE_POLLING, jobs=cm.FETCH_JOBS):
+        # Fetches the works (every tracked fic by default) from AO3, `jobs` at a time, and saves their new data, the
+        #   same way update_AO3_fics.py does (listings first, then one fetch per fic) but without drawing the graphs.
+        #   Fics that are still fresh are skipped, unless `force` is True. A fic that fails is skipped and the
+        #   rest are still saved. Returns {workID: HistoryArrays} of the fics that were updated.
+        from update_AO3_fics import update_fics
+        updated = update_fics(self._select(workIDs), self.store, jobs, freshMinutes, force, adaptive=adaptive, render=False,
+                              cache_directory=self.cache_directory, historyArraysDirectory=self.history_arrays_directory,
+                              lock_directory=self.lock_directory,
+                              listing_sources_filepath=os.path.join(self.data_directory, cm.LISTING_SOURCES_FILENAME),
+                              listing_coverage_filepath=os.path.join(self.data_directory, cm.LISTING_COVERAGE_FILENAME))
+        return {workID: self.history(workID) for workID in updated}
+
+    def history(self, workID):
+        # Returns the work's HistoryArrays, or None if it has no data yet. It comes from memory if the saved
+        #   arrays haven't changed since they were last read, and have every sample in the store.
+        workID = str(workID)
+        filepath = history_arrays.columns_filepath(workID, self.history_arrays_directory)
+        file_version = self._file_version(filepath)
+        cached = self._histories.get(workID)
+        if cached is not None and cached[0] == file_version and history_arrays.is_current(cached[1], self.store):
+            self._histories.move_to_end(workID)
+            return cached[1]
+        history = history_arrays.load_current(self.store, workID, self.history_arrays_directory)
+        if history is None:
+            return None
+        self._remember(workID, self._file_version(filepath), history)
+        return history
+
+    def render(self, workIDs=None, profile=cm.RENDER_PROFILE, graphFormat=cm.GRAPH_FORMAT, jobs=cm.RENDER_JOBS):
+        # Draws the graphs of the works (every tracked fic by default) from their saved data, without fetching
+        #   anything. Graphs that are already current are skipped. Returns the number of graphs drawn.
+        from generate_graph import RenderPool, data_fingerprint
+        drawn = 0
+        with RenderPool(self.store, jobs=jobs, profile=profile, graphFormat=graphFormat,
+                        historyArraysDirectory=self.history_arrays_directory, lock_directory=self.lock_directory) as renders:
+            for fic in self._select(workIDs):
+                dataFingerprint = self.store.data_fingerprint(fic['workID'])
+                if dataFingerprint is None: # Not updated since data fingerprints were added
+                    history = self.history(fic['workID'])
+                    if history is None or len(history) == 0:
+                        continue
+                    dataFingerprint = data_fingerprint(history)
+                if renders.submit(int(fic['workID']), fic['ficName'], fic['graphDirectory'], dataFingerprint):
+                    drawn += 1
+        return drawn
+
+    ## Helpers -------------------
+    def _select(self, workIDs):
+        # Returns the tracked fics with the work IDs, or every tracked fic if workIDs is None
+        if workIDs is None:
+            return self.registry.fics()
+        return [self.registry.get(workID) for workID in workIDs if workID in self.registry]
+
+    def _save_work(self, work):
+        # Adds the work's stats to its data
+        from generate_graph import update_history
+        update_history(work.workID, self.store, work=work, historyArraysDirectory=self.history_arrays_directory,
+                       lock_directory=self.lock_directory, cache_directory=self.cache_directory)
+        return None
+
+    def _remember(self, workID, file_version, history):
+        # Keeps the history in memory, forgetting the least recently used one if there are more than cacheSize
+        self._histories[workID] = (file_version, history)
+        self._histories.move_to_end(workID)
+        while len(self._histories) > self.cacheSize:
+            self._histories.popitem(last=False)
+        return None
+
+    def _file_version(self, filepath):
+        if not os.path.exists(filepath):
+            return None
+        stat = os.stat(filepath)
+        return (stat.st_mtime_ns, stat.st_size)
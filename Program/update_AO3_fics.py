@@ -1,32 +1,259 @@
 #!/usr/bin/env python3
 # main.py:  Runs the script that takes in data and commands the computer to update the fics being tracked.
 # Author: Fixationally_Consumed
-from generate_graph import generate_graph
+from generate_graph import update_history, replay_graph, close_renderer, RenderPool
+from fetch_AO3_stats import fetch_work_stats, harvest_listing_stats, parse_cached_pages, recent_cached_work_stats, get_session, NoConnectionError, AO3UnavailableError
 import os
 import pathlib
+import contextlib
+import argparse
+import itertools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import common as cm
 import datetime
+from work_history_store import WorkHistoryStore, import_workHistory_pickles
+from fic_registry import FicRegistry
+from poll_intervals import poll_minutes
+from file_locks import file_lock
 
-def update_AO3_fics(fic_save_filepath):
-    cm.ensure_fic_save_file_exists(fic_save_filepath)
-    list_of_fics = cm.read_in(fic_save_filepath)
-    for fic in list_of_fics:
+def update_AO3_fics(fic_save_filepath, jobs=cm.FETCH_JOBS, freshMinutes=cm.FRESHNESS_MINUTES, force=False, store=None, registry=None, render_jobs=cm.RENDER_JOBS,
+                    profile=cm.RENDER_PROFILE, graphFormat=cm.GRAPH_FORMAT, adaptive=cm.ADAPTIVE_POLLING, only=None, renders=None):
+    # Fetches every fic from AO3, with up to `jobs` requests in flight at once, and updates each fic's
+    #   data as soon as its fetch finishes. Its graph is then drawn in one of `render_jobs` other processes
+    #   (see generate_graph.RenderPool) while the rest of the fics are being fetched, at the size of the render `profile`.
+    #   Fics that are in one of the listing pages are read from the listings first, 20 fics per request.
+    #   Fics updated within the last `freshMinutes` are skipped, unless `force` is True. If `adaptive` is True,
+    #   quiet fics are skipped for longer, depending on how fast their stats have been changing (see poll_intervals.py).
+    #   Each fic's new data is committed to the store as soon as it's updated, under the fic's lock (see file_locks.py),
+    #   so another update running at the same time never writes over it.
+    #   registry: the FicRegistry of the fic save file, if the caller already has one (ex: the user interface)
+    #   only: work IDs of the only fics to update, if not all of them
+    #   renders: a RenderPool to draw the graphs with, if the caller keeps one between updates (ex: the scheduler service).
+    #            Otherwise one is made for this update, and its processes are stopped at the end.
+    registry = registry if registry is not None else FicRegistry(fic_save_filepath)
+    list_of_fics = registry.fics()
+    if only is not None:
+        list_of_fics = [fic for fic in list_of_fics if fic['workID'] in {str(workID) for workID in only}]
+    own_store = store is None
+    if own_store:
+        store = WorkHistoryStore(cm.HISTORY_STORE_FILEPATH)
+    try:
+        import_workHistory_pickles(store, list_of_fics, cm.HISTORY_FOLDER_DIRECTORY)
+        update_fics(list_of_fics, store, jobs, freshMinutes, force, render_jobs, profile, graphFormat, adaptive, renders=renders)
+    finally:
+        store.commit()
+        if own_store:
+            store.close()
+    return None
+
+def update_fics(list_of_fics, store, jobs, freshMinutes, force, render_jobs=cm.RENDER_JOBS, profile=cm.RENDER_PROFILE, graphFormat=cm.GRAPH_FORMAT,
+                adaptive=cm.ADAPTIVE_POLLING, render=True, cache_directory=cm.CACHE_DIRECTORY, historyArraysDirectory=cm.HISTORY_ARRAYS_DIRECTORY,
+                lock_directory=cm.LOCK_DIRECTORY, listing_sources_filepath=cm.LISTING_SOURCES_FILEPATH,
+                listing_coverage_filepath=cm.LISTING_COVERAGE_FILEPATH, renders=None):
+    # Updates the fics (see update_AO3_fics) and returns {workID: fingerprint of its data} of the fics that were updated
+    #   (see generate_graph.data_fingerprint).
+    #   A fic that fails is skipped, and the rest are still updated and saved.
+    #   render: whether to draw the graphs too
+    #   renders: the RenderPool to draw them with, if the caller keeps one. It's waited for at the end, but not closed.
+    #   The directories are where the response cache, history arrays and locks are kept, and
+    #   listing_sources_filepath is the file of listings to read (and listing_coverage_filepath which fics were in which), so a Tracker can keep them all under its own folder.
+    updated = dict()
+    if not force:
+        fresh_fics = [fic for fic in list_of_fics
+                      if cm.is_fresh(fic, store.last_sample_time(fic['workID']),
+                                     poll_minutes(store, fic['workID'], freshMinutes) if adaptive else freshMinutes)]
+        for fic in fresh_fics:
+            print('Skipping: ', fic['ficName'], '(updated recently)')
+        fresh_IDs = {fic['workID'] for fic in fresh_fics}
+        list_of_fics = [fic for fic in list_of_fics if fic['workID'] not in fresh_IDs]
+    session = get_session(pool_size=max(1, jobs)) # One session for the whole run, so connections are reused between fics
+    session.reset() # A new run tries AO3 again, even if the last run in this process stopped because AO3 was down
+
+    # Only fics whose publish date is saved can use a listing, since listings don't show it
+    listable_IDs = {int(fic['workID']) for fic in list_of_fics if store.date_published(fic['workID']) is not None}
+    ready_stats = dict()
+    if len(listable_IDs) > 0:
         try:
-            # Note: If cm.HISTORY_FOLDER_DIRECTORY does not exist, generate_graph will create a new file
-            print('Updating: ', fic['ficName'], '...')
-            generate_graph(int(fic['workID']), fic['ficName'], fic['graphDirectory'], cm.HISTORY_FOLDER_DIRECTORY)
+            sources = cm.read_in_listing_sources(listing_sources_filepath)
+            if len(sources) > 0:
+                coverage = cm.read_listing_coverage(listing_coverage_filepath, sources)
+                ready_stats = harvest_listing_stats(sources, listable_IDs, session=session, coverage=coverage)
+                cm.write_listing_coverage(coverage, listing_coverage_filepath, sources)
+        except NoConnectionError:
+            print('There was no internet connection on ', datetime.date.today())
+            print('The fics were not updated.')
+            return updated
+        except AO3UnavailableError:
+            print('AO3 is having server issues on ', datetime.date.today())
+            print('The fics were not updated.')
+            return updated
 
-        except Exception as e:
-            if 'Failed to establish a new connection' in str(e):
+    # New fics were just fetched when their work IDs were validated. If that was recent, the page in the
+    #   response cache is used for their first data point instead of fetching them again.
+    for fic in list_of_fics:
+        if not store.has_history(fic['workID']):
+            cached = recent_cached_work_stats(int(fic['workID']), cache_directory=cache_directory)
+            if cached is not None:
+                ready_stats[int(fic['workID'])] = cached
+
+    if not render:
+        renderer = contextlib.nullcontext()
+    elif renders is not None:
+        renderer = renders.batch()
+    else:
+        renderer = RenderPool(store, jobs=render_jobs, profile=profile, graphFormat=graphFormat, historyArraysDirectory=historyArraysDirectory,
+                              lock_directory=lock_directory)
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor, renderer as renders:
+        fetches = {executor.submit(fetch_work_stats, int(fic['workID']), session, cache_directory=cache_directory): fic
+                   for fic in list_of_fics if int(fic['workID']) not in ready_stats}
+        # Each fic with a function that returns its stats. The listed and validated fics are ready right away,
+        #   then the rest come in as their fetches finish.
+        ready = [(fic, lambda stats=ready_stats[int(fic['workID'])]: stats)
+                 for fic in list_of_fics if int(fic['workID']) in ready_stats]
+        fetched = ((fetches[fetch], fetch.result) for fetch in as_completed(fetches))
+        for fic, get_work in itertools.chain(ready, fetched):
+            try:
+                print('Updating: ', fic['ficName'], '...')
+                dataFingerprint = update_history(int(fic['workID']), store, work=get_work(), historyArraysDirectory=historyArraysDirectory,
+                                                 lock_directory=lock_directory, cache_directory=cache_directory)
+                updated[fic['workID']] = dataFingerprint
+                if render:
+                    renders.submit(int(fic['workID']), fic['ficName'], fic['graphDirectory'], dataFingerprint)
+
+            except NoConnectionError:
                 print('There was no internet connection on ', datetime.date.today())
                 print('The fics were not updated.')
-                break # No need to continue with all of them if there's no connection
-            else:
+                # No need to continue with all of them if there's no connection
+                for other_fetch in fetches:
+                    other_fetch.cancel()
+                break
+            except AO3UnavailableError:
+                print('AO3 is having server issues on ', datetime.date.today())
+                print('The rest of the fics were not updated.')
+                for other_fetch in fetches:
+                    other_fetch.cancel()
+                break
+            except Exception as e:
                 # If there's an issue with the program, just skip this fic
                 print(f"Error with {fic['ficName']} on {datetime.date.today()}")
                 print(e)
                 continue
+    return updated
+
+## Run coalescing -------------------
+def log_run(event):
+    # Adds a line to the run log: when, and whether it was a run, a follow-up run or a trigger folded into one
+    os.makedirs(os.path.dirname(cm.RUN_LOG_FILEPATH), exist_ok=True)
+    with open(cm.RUN_LOG_FILEPATH, 'a') as fh:
+        fh.write(f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}{cm.SEP}{event}{cm.SEP}{os.getpid()}\n")
+    return None
+
+def coalesced_update(fic_save_filepath, **kwargs):
+    # Runs update_AO3_fics, unless another update is already running (ex: cron started one while the last is still
+    #   going, or two tracking times are close together). Then this trigger is folded into one follow-up run that the
+    #   running update does as soon as it finishes, however many triggers came in meanwhile.
+    #   Returns True if it ran the update, or False if it was folded into the running one.
+    asked_for_follow_up = False
+    ran = False
+    while True:
+        started = False
+        try:
+            with file_lock(cm.RUN_LOCK_FILEPATH, blocking=False):
+                started = True
+                event = 'follow-up' if ran else 'run'
+                while True:
+                    if os.path.exists(cm.RUN_PENDING_FILEPATH):
+                        os.remove(cm.RUN_PENDING_FILEPATH)
+                    log_run(event)
+                    update_AO3_fics(fic_save_filepath, **kwargs)
+                    ran = True
+                    if not os.path.exists(cm.RUN_PENDING_FILEPATH):
+                        break
+                    print('Another update was started during this one. Updating again...')
+                    event = 'follow-up'
+            # A trigger can ask for a follow-up after the check above but before the lock is released, and then
+            #   not get the lock either. So it's checked once more now that the lock is released.
+            if not os.path.exists(cm.RUN_PENDING_FILEPATH):
+                return True
+            print('Another update was started during this one. Updating again...')
+        except BlockingIOError:
+            if started:
+                raise
+            if ran:
+                return True # Another update got the lock first, and it does the follow-up
+            if asked_for_follow_up:
+                print('Another update is running. The fics will be updated again as soon as it finishes.')
+                log_run('coalesced')
+                return False
+            pathlib.Path(cm.RUN_PENDING_FILEPATH).touch()
+            # The running update may have finished before it saw the follow-up was asked for, so the lock is tried
+            #   once more. If it's free now, this trigger runs the update itself.
+            asked_for_follow_up = True
+
+def run_counts(run_log_filepath=cm.RUN_LOG_FILEPATH):
+    # Returns how many times each event is in the run log, ex: {'run': 40, 'follow-up': 3, 'coalesced': 7}
+    counts = {'run': 0, 'follow-up': 0, 'coalesced': 0}
+    if not os.path.exists(run_log_filepath):
+        return counts
+    with open(run_log_filepath, 'r') as fh:
+        for line in fh:
+            event = line.strip().split(cm.SEP)[1]
+            counts[event] = counts.get(event, 0) + 1
+    return counts
+
+def replay_AO3_fics(fic_save_filepath, profile=cm.RENDER_PROFILE, graphFormat=cm.GRAPH_FORMAT):
+    # Re-parses every page in the response cache and merges them into each fic's data and graph, without going to AO3.
+    #   The cached pages are parsed in parallel, one process per core.
+    list_of_fics = FicRegistry(fic_save_filepath).fics()
+    store = WorkHistoryStore(cm.HISTORY_STORE_FILEPATH)
+    import_workHistory_pickles(store, list_of_fics, cm.HISTORY_FOLDER_DIRECTORY)
+    with ProcessPoolExecutor() as executor:
+        parses = {executor.submit(parse_cached_pages, int(fic['workID'])): fic for fic in list_of_fics}
+        for parse in as_completed(parses):
+            fic = parses[parse]
+            try:
+                cachedStats = parse.result()
+                if len(cachedStats) == 0:
+                    print('No cached pages for: ', fic['ficName'])
+                    continue
+                print('Replaying: ', fic['ficName'], f'({len(cachedStats)} cached pages) ...')
+                replay_graph(int(fic['workID']), fic['ficName'], fic['graphDirectory'], store, cachedStats, profile=profile, graphFormat=graphFormat)
+            except Exception as e:
+                print(f"Error replaying {fic['ficName']}")
+                print(e)
+                continue
+    close_renderer()
+    store.commit()
+    store.close()
     return None
 
 if __name__  == '__main__':
-    update_AO3_fics(cm.FIC_SAVE_FILEPATH)
+    parser = argparse.ArgumentParser(description='Updates the data and graphs of every fic being tracked.')
+    parser.add_argument('--jobs', type=int, default=cm.FETCH_JOBS,
+                        help=f'Number of fics fetched from AO3 at the same time (default: {cm.FETCH_JOBS})')
+    parser.add_argument('--fresh-minutes', type=int, default=cm.FRESHNESS_MINUTES,
+                        help=f'Skip fics updated within this many minutes (default: {cm.FRESHNESS_MINUTES})')
+    parser.add_argument('--fixed-interval', action='store_true',
+                        help='Skip fics updated within --fresh-minutes only, instead of learning how often each fic changes')
+    parser.add_argument('--render-jobs', type=int, default=cm.RENDER_JOBS,
+                        help=f'Number of graphs drawn at the same time (default: the number of cores, {cm.RENDER_JOBS})')
+    parser.add_argument('--profile', choices=list(cm.RENDER_PROFILES), default=cm.RENDER_PROFILE,
+                        help=f'Size the graphs are drawn at (default: {cm.RENDER_PROFILE})')
+    parser.add_argument('--format', choices=cm.GRAPH_FORMATS, default=cm.GRAPH_FORMAT,
+                        help=f'File type of the graphs (default: {cm.GRAPH_FORMAT})')
+    parser.add_argument('--force', action='store_true',
+                        help='Update every fic, even ones updated recently')
+    parser.add_argument('--runs', action='store_true',
+                        help='Show how many updates ran and how many triggers were folded into another run, then exit')
+    parser.add_argument('--replay', action='store_true',
+                        help='Rebuild the data and graphs from the cached pages of past fetches, without going to AO3')
+    args = parser.parse_args()
+    if args.runs:
+        counts = run_counts()
+        print(f"{counts['run']} updates ran, plus {counts['follow-up']} follow-up runs.")
+        print(f"{counts['coalesced']} triggers came in while an update was running and were folded into a follow-up run.")
+    elif args.replay:
+        replay_AO3_fics(cm.FIC_SAVE_FILEPATH, profile=args.profile, graphFormat=args.format)
+    else:
+        coalesced_update(cm.FIC_SAVE_FILEPATH, jobs=args.jobs, freshMinutes=args.fresh_minutes, force=args.force, render_jobs=args.render_jobs,
+                         profile=args.profile, graphFormat=args.format, adaptive=not args.fixed_interval)
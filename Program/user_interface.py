@@ -1,25 +1,23 @@
 #!/usr/bin/env python3
 # interact_with_fic_save_file.py: This allows the user to interact with the data file
 #   that is referenced to update fics.
+#   Modules that are slow to import (plotting, AO3 requests, crontab) are only imported once they're needed,
+#   so the menu opens right away. See import_benchmark.py.
 # Author: Fixationally_Consumed
 import os
 import shutil
-from copy import copy
 import pathlib
-import AO3
-from tabulate import tabulate
-import warnings
 import datetime
 # User Defined modules
 import common as cm
-import update_AO3_fics
-import interact_with_cron
+from work_history_store import WorkHistoryStore, import_workHistory_pickles
+from fic_registry import FicRegistry
 
-def days_since_last_update(filepath):
-    # Returns the number of days since modified. When this is the graph output, it's
-    #   the number of days since it was last tracked.
-    last_modified_time_stamp = datetime.datetime.fromtimestamp(pathlib.Path(filepath).stat().st_mtime)
-    modified_time = datetime.datetime.now() - last_modified_time_stamp
+def days_since_last_update(last_updated):
+    # Returns the number of days since the fic's stats were last recorded, or "Never" if they haven't been yet
+    if last_updated is None:
+        return 'Never'
+    modified_time = datetime.datetime.now() - last_updated
     return modified_time.days
 
 def print_fics(fics):
@@ -27,38 +25,39 @@ def print_fics(fics):
         print("You have no fics you're currently tracking.")
         return None
 
+    from tabulate import tabulate
     # Create a list of lists for the tabulate function
     data = list()
+    store = WorkHistoryStore(cm.HISTORY_STORE_FILEPATH)
     for index, fic in enumerate(fics):
-        filepath = os.path.join(cm.DATA_DIRECTORY, cm.make_workHistory_filename(fic['ficName'], fic['workID']))
-        data.append([str(index), fic['workID'], fic['ficName'], fic['graphDirectory'], days_since_last_update(filepath)])
+        data.append([str(index), fic['workID'], fic['ficName'], fic['graphDirectory'], days_since_last_update(store.last_sample_time(fic['workID']))])
+    store.close()
 
     print(tabulate(data, headers=['Index', 'Work ID', 'Fic Name', 'Graph Directory', 'Days Since Updated']))
     return None
 
 def is_valid_AO3_workID(workID):
     # Returns True if work ID is identifiable on AO3
+    import fetch_AO3_stats
     workID = int(workID) # Make sure work ID is an int
 
-    warnings.filterwarnings(action='ignore', category=UserWarning, module='AO3') # Suppress the annoying UserWarning that some fics may be long in length
     try:
-        AO3.Work(workID)
+        fetch_AO3_stats.fetch_work_stats(workID)
         return True
-    except AO3.utils.InvalidIdError:
+    except (fetch_AO3_stats.InvalidWorkIDError, fetch_AO3_stats.WorkUnavailableError):
         return False
-    except Exception as e:
-        if 'Failed to establish a new connection' in str(e):
-            cm.clear_screen(new_lines=3)
-            print("Hmmm... it seems you don't have internet connection, which is needed to validate this work ID.")
-            print("The entered ID is assumed to be valid, but if it's wrong then the program won't update this fic.")
-            print('Press any button to accept this and continue.')
-            input()
-            return True
-        else:
-            raise e
+    except fetch_AO3_stats.NoConnectionError:
+        cm.clear_screen(new_lines=3)
+        print("Hmmm... it seems you don't have internet connection, which is needed to validate this work ID.")
+        print("The entered ID is assumed to be valid, but if it's wrong then the program won't update this fic.")
+        print('Press any button to accept this and continue.')
+        input()
+        return True
     
-def get_workID(fics):
+def get_workID(registry, pending_fics=(), changing_fic=None):
     # Returns the work ID of the fic the user wants to track. The function ensures the work ID is valid.
+    #   pending_fics: fics that are about to be added, so their IDs are taken too
+    #   changing_fic: the fic being changed, so it can keep its own ID
     print('Every fic on AO3 has a work ID, which is a number, associated with it.')
     print('For example, in the URL')
     print('https://archiveofourown.org/works/32751484/chapters/81257581')
@@ -70,16 +69,15 @@ def get_workID(fics):
         # Sort out if they passed in a workID or the URL, then pull out the ID if necessary
         if len(ID_or_URL) > 26: # The only reason it would be this long is if it were a URL they'd pasted in
             URL = ID_or_URL
-            try:
-                possible_ID = str(AO3.utils.workid_from_url(URL))
-            except:
+            possible_ID = cm.workid_from_url(URL)
+            if possible_ID is None:
                 cm.clear_screen()
                 print('Sorry, the script could not identify the work ID.')
                 print('Try pasting the full URL again or manually entering it.')
                 continue
             if not cm.isPosInt(possible_ID):
                 cm.clear_screen()
-                print(f'Sorry, the script identified\n{ID}\nfrom\n{URL}\nPlease try again or type in the work ID manually.')
+                print(f'Sorry, the script identified\n{possible_ID}\nfrom\n{URL}\nPlease try again or type in the work ID manually.')
                 continue
             ID = possible_ID
         elif len(ID_or_URL) > 0 and cm.isPosInt(ID_or_URL):
@@ -89,8 +87,7 @@ def get_workID(fics):
             print(f'The value\n"{ID_or_URL}"\nis not identifiable. Please enter it again.')
             continue
 
-        cataloged_IDs = {cataloged_fic['workID'] for cataloged_fic in fics}
-        if ID in cataloged_IDs:
+        if is_taken(ID, 'workID', registry.get(ID) is not None, pending_fics, changing_fic):
             cm.clear_screen()
             print('Sorry, this ID is already being used by another fic you\'re tracking.')
             print('Please enter another work ID.')
@@ -106,27 +103,19 @@ def get_workID(fics):
             return ID
     return None
 
-def includes_illegal_char(string):
-    illegal_chars = '/<>:"\|?*;'
-    windows_illegal_names = """CON, PRN, AUX, NUL, COM1, COM2, COM3, COM4, COM5, COM6, COM7, COM8, COM9, LPT1, LPT2, LPT3, LPT4, LPT5, LPT6, LPT7, LPT8, LPT9""".split(', ')
-    for char in string:
-        if char in illegal_chars:
-            return True
-    if string in windows_illegal_names:
-        return True
-    elif string.endswith(' ') or string.endswith('.'):
+def is_taken(value, key, tracked, pending_fics, changing_fic):
+    # Returns True if the work ID or fic name (key) is already used by a tracked or pending fic, other than changing_fic
+    if tracked and (changing_fic is None or changing_fic[key] != value):
         return True
-    else:
-        return False
-    return None
-    
-def get_ficName(fics):
+    return any(pending_fic[key] == value for pending_fic in pending_fics)
+
+def get_ficName(registry, pending_fics=(), changing_fic=None):
     while True:
         print('What is the name of the fic?')
         print('Please omit any special characters other than _ and -')
         print('Note: You can shorten or abbreviate this for ease.')
         ficName = input().strip()
-        if includes_illegal_char(ficName):
+        if cm.includes_illegal_char(ficName):
             cm.clear_screen()
             print(f'{ficName} is not allowed, sorry :/')
             print('Please do not use any special characters or end with a period.')
@@ -134,8 +123,7 @@ def get_ficName(fics):
             print('Please enter another fic name.')
             print()
             continue
-        cataloged_names = {cataloged_fic['ficName'] for cataloged_fic in fics}
-        if ficName in cataloged_names:
+        if is_taken(ficName, 'ficName', registry.has_ficName(ficName), pending_fics, changing_fic):
             cm.clear_screen()
             print(f'{ficName} is already used for another fic being tracked.')
             print('Please chose another name.')
@@ -192,28 +180,27 @@ def change_fic_save_files(old_fic, new_fic):
     # Changes the save locations and/or names of the save files
     #   If nothing has been changed, the function won't change anything.
     #   If the work ID is the only thing that changed, nothing gets updated.
-    # Move/Rename graph
-    old_graph_filepath = os.path.join(old_fic['graphDirectory'], cm.make_graph_filename(old_fic['ficName']))
-    new_graph_filepath = os.path.join(new_fic['graphDirectory'], cm.make_graph_filename(new_fic['ficName']))
-    if os.path.exists(old_graph_filepath):
-        shutil.move(old_graph_filepath, new_graph_filepath)
+    # Move/Rename graph, in every size and file type it was drawn in
+    for profile in cm.RENDER_PROFILES:
+        for graphFormat in cm.GRAPH_FORMATS:
+            old_graph_filepath = os.path.join(old_fic['graphDirectory'], cm.make_graph_filename(old_fic['ficName'], graphFormat, profile))
+            new_graph_filepath = os.path.join(new_fic['graphDirectory'], cm.make_graph_filename(new_fic['ficName'], graphFormat, profile))
+            if os.path.exists(old_graph_filepath) and old_graph_filepath != new_graph_filepath:
+                shutil.move(old_graph_filepath, new_graph_filepath)
 ##    else:
 ##        # The file hasn't actually been made yet and this is a fic list clerical change
 ##        # Nothing else needs to be done
 
-    # Update the name of the work history pickle file if the name changed
-    old_workHistory_filepath = os.path.join(cm.DATA_DIRECTORY, cm.make_workHistory_filename(old_fic['ficName'], old_fic['workID']))
-    new_workHistory_filepath = os.path.join(cm.DATA_DIRECTORY, cm.make_workHistory_filename(new_fic['ficName'], new_fic['workID']))
-    if os.path.exists(old_workHistory_filepath):
-        os.rename(old_workHistory_filepath, new_workHistory_filepath)
+    # The fic's data is saved by work ID, so it doesn't need to be moved when the name changes
     return None
 
-def change_fic_list(fics, save_filepath):
-    if len(fics) < 1:
+def change_fic_list(registry):
+    if len(registry) < 1:
         print('There are no fics to change.')
-        return fics
+        return None
     
     while True:
+        fics = registry.fics()
         print_fics(fics)
         print()
         print('Warning: Any accepted changes made are saved immediately.')
@@ -224,24 +211,22 @@ def change_fic_list(fics, save_filepath):
         print('Save and return to home screen:         Type "Save"')
         command = input()
         if command.lower().startswith('s'):
-            cm.write_out(fics, save_filepath)
-            return fics
+            return None
         elif cm.isPosInt(command) and int(command) < len(fics):
-            fic = fics.pop(int(command))
-            unchanged_fic = copy(fic)
+            unchanged_fic = fics[int(command)]
             cm.clear_screen()
             print(f'You have chosen to change {command}')
-            print('Work ID: --------------- ' + fic['workID'])
-            print('Fic Name: -------------- ' + fic['ficName'])
-            print('Directory of Graph File: ' + fic['graphDirectory'])
+            print('Work ID: --------------- ' + unchanged_fic['workID'])
+            print('Fic Name: -------------- ' + unchanged_fic['ficName'])
+            print('Directory of Graph File: ' + unchanged_fic['graphDirectory'])
             
             # Pull new fic data from user
             print()
             print('If you mis-type or wish to exit, simply type in fake values or accept the defaults.')
             print('The program will then ask if you wish to accept this change, and you can decline then.')
             print()
-            workID = get_workID(fics)
-            ficName = get_ficName(fics)
+            workID = get_workID(registry, changing_fic=unchanged_fic)
+            ficName = get_ficName(registry, changing_fic=unchanged_fic)
             graphDirectory = get_graphDirectory()
             print('\n')
             print(f'Do you accept row {command} new values?')
@@ -253,15 +238,15 @@ def change_fic_list(fics, save_filepath):
                 fic = {'workID': workID,
                        'ficName': ficName,
                        'graphDirectory': graphDirectory}
+                if 'freshMinutes' in unchanged_fic:
+                    fic['freshMinutes'] = unchanged_fic['freshMinutes']
                 change_fic_save_files(unchanged_fic, fic)
-                fics.insert(int(command), fic)
-                cm.write_out(fics, save_filepath)
+                registry.change(unchanged_fic['workID'], fic)
                 cm.clear_screen()
             else:
                 cm.clear_screen()
                 print(f'Okay, Index {command} will not be changed.')
                 print('If that was a mistake, please enter the information again.')
-                fics.insert(int(command), unchanged_fic)
         else:
             cm.clear_screen()
             print(f'\nThe command "{command}" is not recognized or not listed.')
@@ -269,10 +254,10 @@ def change_fic_list(fics, save_filepath):
             print()
     return None
 
-def add_to_fic_list(fics, save_filepath):
-    unchanged_fics = copy(fics)
+def add_to_fic_list(registry):
+    added_fics = list() # Only added to the registry when saved
     while True:
-        print_fics(fics)
+        print_fics(registry.fics() + added_fics)
         print()
         print('Please type a command. After typing, hit Enter.')
         print('Add a fic:                              Type "Add"')
@@ -280,18 +265,18 @@ def add_to_fic_list(fics, save_filepath):
         print('Quit without saving additions:          Type "Quit"')
         command = input()
         if command.lower().startswith('s'):
-            cm.write_out(fics, save_filepath)
-            return fics
+            registry.add_many(added_fics)
+            return None
         elif command.lower().startswith('q'):
-            return unchanged_fics
+            return None
         elif command.lower().startswith('a'):
             # Pull new fic data from user
             cm.clear_screen()
             print('If you mis-type or wish to exit, simply type in fake values or accept the defaults.')
             print('The program will then ask if you wish to accept this addition, and you can decline then.')
             print()
-            workID = get_workID(fics)
-            ficName = get_ficName(fics)
+            workID = get_workID(registry, pending_fics=added_fics)
+            ficName = get_ficName(registry, pending_fics=added_fics)
             graphDirectory = get_graphDirectory()
             print('\n\n')
             print('Do you wish to add the following fic?')
@@ -300,9 +285,9 @@ def add_to_fic_list(fics, save_filepath):
             print('Directory of Graph File: ' + graphDirectory)
             print('Type "Yes" to accept and "No" to decline')
             if input().lower().startswith('y'):
-                fics.append({'workID': workID,
-                             'ficName': ficName,
-                             'graphDirectory': graphDirectory})
+                added_fics.append({'workID': workID,
+                                   'ficName': ficName,
+                                   'graphDirectory': graphDirectory})
                 cm.clear_screen()
             else:
                 cm.clear_screen()
@@ -315,13 +300,14 @@ def add_to_fic_list(fics, save_filepath):
             print()
     return None
 
-def delete_from_fic_list(fics, save_filepath):
-    if len(fics) < 1:
+def delete_from_fic_list(registry):
+    if len(registry) < 1:
         print('There are no fics to delete.')
-        return fics
-    unchanged_fics = copy(fics)
+        return None
+    deleted_IDs = set() # Only removed from the registry when saved
     
     while True:
+        fics = [fic for fic in registry.fics() if fic['workID'] not in deleted_IDs]
         print_fics(fics)
         print()
         print('Deleting a fic will only stop it from being tracked. It\'s data will still be stored.')
@@ -332,10 +318,10 @@ def delete_from_fic_list(fics, save_filepath):
         print('Quit without saving deletions:          Type "Quit"')
         row = input()
         if row.lower().startswith('s'): # Save the fic list
-            cm.write_out(fics, save_filepath)
-            return fics
+            registry.remove(deleted_IDs)
+            return None
         elif row.lower().startswith('q'): # Quit without saving
-            return unchanged_fics
+            return None
         elif cm.isPosInt(row) and len(fics) < 1:
             cm.clear_screen()
             print('\nThere are no more fics to delete. Please save or quit without saving these changes.')
@@ -346,7 +332,7 @@ def delete_from_fic_list(fics, save_filepath):
             # Ask and make sure they want to delete this row
             if input(f'\nAre you sure you want to stop updating Row {row}?\nType "Yes" or "No": ').lower().startswith('y'):
                 # At this point, the user is sure they want to delete this row
-                del fics[int(row)]
+                deleted_IDs.add(fics[int(row)]['workID'])
             cm.clear_screen()
         else:
             cm.clear_screen()
@@ -358,12 +344,14 @@ def delete_from_fic_list(fics, save_filepath):
 def user_interface(save_filepath):
     # Loop that allows the user to interact with and change the file commanding what fics are tracked.
     #   This will also move and/or rename the stat files if the user changes those in any way.
-    cm.ensure_fic_save_file_exists(save_filepath) # Also creates the save folder if it doesn't exist
+    registry = FicRegistry(save_filepath) # Also creates the save file and folder if they don't exist
+    store = WorkHistoryStore(cm.HISTORY_STORE_FILEPATH)
+    import_workHistory_pickles(store, registry.fics(), cm.HISTORY_FOLDER_DIRECTORY) # Data saved by older versions
+    store.close()
     cm.clear_screen()
     
     print('Hi!\n')
     while True:
-        fics = cm.read_in(save_filepath)
         print('What would you like to do? After typing, hit Enter')
         print('View fics being tracked:             Type "View"')
         print('Add a fic to be tracked:             Type "Add"')
@@ -372,36 +360,50 @@ def user_interface(save_filepath):
         print('Adjust times fics are tracked:       Type "Time"')
         print('                   ~~~~~~~~~~             ')
         print('Update the fics right now:           Type "Update"')
+        print('See every fic on one page:           Type "Dashboard"')
         print('Exit program:                        Type "Exit"')
         print('                   ~~~~~~~~~~             ')
         
         user_action = input()
         if user_action.lower().startswith('v'): # View fics
             cm.clear_screen()
-            print_fics(fics)
+            print_fics(registry.fics())
             print()
         elif user_action.lower().startswith('a'): # Add a fic
             cm.clear_screen()
-            fics = add_to_fic_list(fics, save_filepath)
+            add_to_fic_list(registry)
             cm.clear_screen()
         elif user_action.lower().startswith('r'): # Remove a fic
             cm.clear_screen()
-            fics = delete_from_fic_list(fics, save_filepath)
+            delete_from_fic_list(registry)
             cm.clear_screen()
         elif user_action.lower().startswith('c'): # Change a fic
             cm.clear_screen()
-            fics = change_fic_list(fics, save_filepath)
+            change_fic_list(registry)
             cm.clear_screen()
-        elif user_action.lower().startswith('e'): # Save the changes and exit
-            cm.write_out(fics, save_filepath)
+        elif user_action.lower().startswith('e'): # Exit (every change is already saved)
             return None
-        elif user_action.lower().startswith('u'): # Save and update the fics right now
-            cm.write_out(fics, save_filepath)
+        elif user_action.lower().startswith('u'): # Update the fics right now
             cm.clear_screen()
             print('Updating fics...')
-            update_AO3_fics.update_AO3_fics(cm.FIC_SAVE_FILEPATH)
+            import update_AO3_fics
+            # Asked for by hand, so quiet fics aren't skipped for as long as adaptive polling would. Only fics
+            #   updated within the last FRESHNESS_MINUTES are skipped.
+            ran = update_AO3_fics.coalesced_update(save_filepath, registry=registry, adaptive=False)
             cm.clear_screen()
+            if not ran:
+                print('An update was already running, so the fics will be updated again as soon as it finishes.')
+                print()
+        elif user_action.lower().startswith('d'): # Make the report of every fic and open it
+            import webbrowser
+            import generate_report
+            cm.clear_screen()
+            report_filepath = generate_report.generate_report(save_filepath)
+            print('The report was saved to: ', report_filepath)
+            print()
+            webbrowser.open(pathlib.Path(report_filepath).as_uri())
         elif user_action.lower().startswith('t'): # Change the times the script is tracked
+            import interact_with_cron
             cm.clear_screen()
             interact_with_cron.interact_with_cron()
             cm.clear_screen()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# work_history_store.py: Saves the data of every fic in one SQLite file, instead of one pickle file per fic.
+#   Every update is a single small append to the samples table, so updating a fic no longer means loading
+#   and re-writing everything it has ever recorded. Several programs can use the store at once: SQLite
+#   locks it while one is writing, and each fic is updated under its own lock (see file_locks.py).
+#   The old "{ficName}_{ID}_workHistory.pickle" files are imported the first time the store sees them.
+#   Samples are kept with their full time, so several updates a day are all kept. To keep that from growing
+#   without bound, older samples are thinned out to one an hour, and then one a day (see compact()).
+# Author: Fixationally_Consumed
+import os
+import sqlite3
+import pickle
+import datetime
+# User Defined modules
+import common as cm
+
+""" Tables
+works:   one row per work
+    workID | date_published (ISO date)
+
+samples: one row per time a work's stats were recorded. Appended to, and thinned out by compact().
+    workID | sampled_at (unix time) | days_since_published | nchapters | words | hits | kudos | comments
+
+compaction: how far each work's samples have been thinned out, so compact() only looks at new samples
+    workID | hourly_until (unix time) | daily_until (unix time)
+
+renders: the fingerprint of the data each graph was last drawn from (see generate_graph.render_fingerprint)
+    graph_filepath | fingerprint
+
+data_fingerprints: the fingerprint of each work's data (see generate_graph.data_fingerprint), so whether its graphs
+    need redrawing can be told without reading its samples
+    workID | fingerprint
+
+exports: the newest sample of each work already exported by each named incremental export (see export_history.py)
+    name | workID | exported_until (unix time)
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS works (
+    workID INTEGER PRIMARY KEY,
+    date_published TEXT
+);
+CREATE TABLE IF NOT EXISTS samples (
+    workID INTEGER NOT NULL,
+    sampled_at INTEGER NOT NULL,
+    days_since_published INTEGER NOT NULL,
+    nchapters INTEGER NOT NULL,
+    words INTEGER NOT NULL,
+    hits INTEGER NOT NULL,
+    kudos INTEGER NOT NULL,
+    comments INTEGER NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS samples_by_work_and_time ON samples (workID, sampled_at);
+CREATE TABLE IF NOT EXISTS compaction (
+    workID INTEGER PRIMARY KEY,
+    hourly_until INTEGER NOT NULL,
+    daily_until INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS renders (
+    graph_filepath TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS data_fingerprints (
+    workID INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS exports (
+    name TEXT NOT NULL,
+    workID INTEGER NOT NULL,
+    exported_until INTEGER NOT NULL,
+    PRIMARY KEY (name, workID)
+);
+"""
+
+class WorkHistoryStore:
+    def __init__(self, filepath=cm.HISTORY_STORE_FILEPATH):
+        directory = os.path.dirname(filepath)
+        if directory != '' and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.filepath = filepath
+        # timeout: Wait on another program (ex: a cron update) that's in the middle of writing
+        self._db = sqlite3.connect(filepath, timeout=60)
+        self._db.execute('PRAGMA journal_mode=WAL') # Readers don't block the writer, and appends are cheap
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+        return None
+
+    def commit(self):
+        self._db.commit()
+        return None
+
+    ## Writing -------------------
+    def add_sample(self, work, sampled_at=None):
+        # Appends the work's stats (a WorkStats) as a sample taken at sampled_at (default: when it was fetched).
+        #   A sample for the same work at the same second replaces the old one, ex: when replaying a cached page.
+        #   Not committed until commit() is called.
+        sampled_at = sampled_at or work.fetched_at
+        if work.date_published is not None:
+            self.set_date_published(work.workID, work.date_published)
+        date_published = self.date_published(work.workID)
+        self._db.execute('INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (work.workID, int(sampled_at.timestamp()), (sampled_at.date() - date_published.date()).days,
+                          work.nchapters, work.words, work.hits, work.kudos, work.comments))
+        return None
+
+    def set_date_published(self, workID, date_published):
+        self._db.execute('INSERT OR REPLACE INTO works VALUES (?, ?)', (int(workID), date_published.date().isoformat()))
+        return None
+
+    def set_data_fingerprint(self, workID, fingerprint):
+        self._db.execute('INSERT OR REPLACE INTO data_fingerprints VALUES (?, ?)', (int(workID), fingerprint))
+        return None
+
+    def set_render_fingerprint(self, graph_filepath, fingerprint):
+        self._db.execute('INSERT OR REPLACE INTO renders VALUES (?, ?)', (os.path.abspath(graph_filepath), fingerprint))
+        return None
+
+    ## Reading -------------------
+    def date_published(self, workID):
+        # Returns the date the work was published as a datetime, or None if it isn't known yet
+        row = self._db.execute('SELECT date_published FROM works WHERE workID = ?', (int(workID),)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return datetime.datetime.fromisoformat(row[0])
+
+    def last_sample_time(self, workID):
+        # Returns when the work's stats were last recorded, or None if they never have been
+        row = self._db.execute('SELECT MAX(sampled_at) FROM samples WHERE workID = ?', (int(workID),)).fetchone()
+        if row[0] is None:
+            return None
+        return datetime.datetime.fromtimestamp(row[0])
+
+    def last_sample(self, workID):
+        # Returns the work's newest sample as (sampled_at (unix time), nchapters, words, hits, kudos, comments),
+        #   or None if it has none
+        return self._db.execute('SELECT sampled_at, nchapters, words, hits, kudos, comments FROM samples '
+                                'WHERE workID = ? ORDER BY sampled_at DESC LIMIT 1', (int(workID),)).fetchone()
+
+    def history_version(self, workID):
+        # Returns (number of samples, newest sampled_at) of the work, which changes whenever its samples do.
+        #   Only reads the index, so it's quick however long the history is.
+        return self._db.execute('SELECT COUNT(*), MAX(sampled_at) FROM samples WHERE workID = ?', (int(workID),)).fetchone()
+
+    def data_fingerprint(self, workID):
+        # Returns the fingerprint of the work's data, or None if it hasn't been worked out yet
+        row = self._db.execute('SELECT fingerprint FROM data_fingerprints WHERE workID = ?', (int(workID),)).fetchone()
+        return row[0] if row is not None else None
+
+    def render_fingerprint(self, graph_filepath):
+        # Returns the fingerprint of the data the graph was last drawn from, or None if it hasn't been drawn yet
+        row = self._db.execute('SELECT fingerprint FROM renders WHERE graph_filepath = ?', (os.path.abspath(graph_filepath),)).fetchone()
+        return row[0] if row is not None else None
+
+    def has_history(self, workID):
+        return self.last_sample_time(workID) is not None
+
+    def samples(self, workID, start=None, end=None):
+        # Returns every sample of the work taken between start and end (datetimes, both optional), oldest first.
+        #   Each sample is (sampled_at, days_since_published, nchapters, words, hits, kudos, comments)
+        start = int(start.timestamp()) if start is not None else 0
+        end = int(end.timestamp()) if end is not None else 2**62
+        rows = self._db.execute('SELECT sampled_at, days_since_published, nchapters, words, hits, kudos, comments '
+                                'FROM samples WHERE workID = ? AND sampled_at BETWEEN ? AND ? ORDER BY sampled_at',
+                                (int(workID), start, end)).fetchall()
+        return [(datetime.datetime.fromtimestamp(row[0]),) + tuple(row[1:]) for row in rows]
+
+    def history_samples(self, workID):
+        # Returns every sample of the work, oldest first, timed by seconds since the work was published.
+        #   Each sample is (seconds_since_published, nchapters, words, hits, kudos, comments)
+        date_published = self.date_published(workID)
+        if date_published is None:
+            return list()
+        published_at = int(date_published.timestamp())
+        return self._db.execute('SELECT sampled_at - ?, nchapters, words, hits, kudos, comments '
+                                'FROM samples WHERE workID = ? ORDER BY sampled_at',
+                                (published_at, int(workID))).fetchall()
+
+    def iter_samples(self, since_export=None):
+        # Yields every sample of every work, one at a time straight from the database (so they're never all in
+        #   memory), ordered by work and then time. Each sample is
+        #   (workID, sampled_at (unix time), days_since_published, nchapters, words, hits, kudos, comments)
+        #   since_export: name of an incremental export. Only samples newer than what it last exported are yielded.
+        cursor = self._db.execute('SELECT workID, sampled_at, days_since_published, nchapters, words, hits, kudos, comments '
+                                  'FROM samples WHERE sampled_at > COALESCE((SELECT exported_until FROM exports '
+                                  'WHERE name = ? AND exports.workID = samples.workID), -1) ORDER BY workID, sampled_at',
+                                  (since_export,))
+        yield from cursor
+
+    def set_exported_until(self, name, exported_until):
+        # Saves the newest sample of each work the incremental export has exported. exported_until: {workID: unix time}
+        self._db.executemany('INSERT OR REPLACE INTO exports VALUES (?, ?, ?)',
+                             [(name, int(workID), until) for workID, until in exported_until.items()])
+        return None
+
+    ## Compaction -------------------
+    def compact(self, workID, now=None):
+        """
+        Thins out the work's older samples, so that updating many times a day keeps the store small:
+            - Every sample from the last cm.RAW_RETENTION_DAYS days is kept
+            - Older than that, only the last sample of each hour is kept
+            - Older than cm.HOURLY_RETENTION_DAYS days, only the last sample of each day is kept
+        The stats only ever count up, so the last sample of an hour or day stands in for the whole hour or day.
+        It's incremental: each tier only looks at the samples that have aged into it since the last compaction.
+        Returns the number of samples deleted.
+        """
+        now = now or datetime.datetime.now()
+        # The cutoffs are on the hour and at midnight, so an hour or day is never split between two compactions
+        hourly_cutoff = int((now - datetime.timedelta(days=cm.RAW_RETENTION_DAYS)).timestamp()) // 3600 * 3600
+        daily_cutoff = int(datetime.datetime.combine((now - datetime.timedelta(days=cm.HOURLY_RETENTION_DAYS)).date(), datetime.time()).timestamp())
+        row = self._db.execute('SELECT hourly_until, daily_until FROM compaction WHERE workID = ?', (int(workID),)).fetchone()
+        hourly_until, daily_until = row if row is not None else (0, 0)
+
+        deleted = self._keep_last_sample_of_each(workID, 'sampled_at / 3600', hourly_until, hourly_cutoff) # Each hour
+        deleted += self._keep_last_sample_of_each(workID, 'days_since_published', daily_until, daily_cutoff) # Each day
+        self._db.execute('INSERT OR REPLACE INTO compaction VALUES (?, ?, ?)',
+                         (int(workID), max(hourly_until, hourly_cutoff), max(daily_until, daily_cutoff)))
+        return deleted
+
+    def _keep_last_sample_of_each(self, workID, period, start, end):
+        # Deletes every sample between start and end except the last one of each period. Returns how many were deleted.
+        if end <= start:
+            return 0
+        cursor = self._db.execute(f'DELETE FROM samples WHERE workID = ? AND sampled_at >= ? AND sampled_at < ? AND sampled_at NOT IN ('
+                         f'SELECT MAX(sampled_at) FROM samples WHERE workID = ? AND sampled_at >= ? AND sampled_at < ? GROUP BY {period})',
+                         (int(workID), start, end, int(workID), start, end))
+        return cursor.rowcount
+
+    def reset_compaction(self, workID):
+        # Makes the next compact() look at all of the work's samples again, ex: after old samples were replayed
+        self._db.execute('DELETE FROM compaction WHERE workID = ?', (int(workID),))
+        return None
+
+    ## Importing -------------------
+    def import_workHistory_pickle(self, workID, workHistorySavePath):
+        """
+        Adds the data points in an old workHistory pickle file to the store.
+
+        The pickles only saved the number of days since published, not the time of each data point.
+        The last data point was saved when the file was last modified, so that's used to date it, and every
+        other data point is dated from there by how many days before the last one it was.
+        """
+        with open(workHistorySavePath, 'rb') as pFile:
+            workHistory = pickle.load(pFile)
+        last_saved = datetime.datetime.fromtimestamp(os.path.getmtime(workHistorySavePath)).replace(microsecond=0)
+        last_day = workHistory['days since published'][-1]
+        date_published = workHistory.get('date published') or datetime.datetime.combine(last_saved.date() - datetime.timedelta(days=last_day), datetime.time())
+        self.set_date_published(workID, date_published)
+        for i, day in enumerate(workHistory['days since published']):
+            sampled_at = last_saved - datetime.timedelta(days=last_day - day)
+            self._db.execute('INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             (int(workID), int(sampled_at.timestamp()), day,
+                              workHistory['nchapters'][i], workHistory['word count'][i], workHistory['hits'][i],
+                              workHistory['kudos'][i], workHistory['ncomments'][i]))
+        return None
+
+def import_workHistory_pickles(store, fics, workHistoryDirectory=cm.HISTORY_FOLDER_DIRECTORY):
+    # Imports the pickle file of every fic that has one and isn't in the store yet.
+    #   Each imported file is renamed to end in .imported, rather than deleted, just in case.
+    for fic in fics:
+        workHistorySavePath = os.path.join(workHistoryDirectory, cm.make_workHistory_filename(fic['ficName'], fic['workID']))
+        if not os.path.isfile(workHistorySavePath):
+            continue
+        if not store.has_history(fic['workID']):
+            print('Importing the saved data of: ', fic['ficName'], '...')
+            store.import_workHistory_pickle(fic['workID'], workHistorySavePath)
+            store.commit() # Committed before the file is renamed, so the data is never only in one place
+        os.rename(workHistorySavePath, workHistorySavePath + '.imported')
+    return None